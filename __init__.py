@@ -10,6 +10,7 @@ from pathlib import Path
 from .fast64_internal import *
 from .fast64_internal.panels import SM64_Panel
 from .fast64_internal.oot.oot_level import OOT_ObjectProperties
+from .fast64_internal.export_stats import ExportStats
 from .fast64_internal.render_settings import (
     Fast64RenderSettings_Properties,
     resync_scene_props,
@@ -210,6 +211,12 @@ class F3D_GlobalSettingsPanel(bpy.types.Panel):
         col.prop(context.scene, "ignoreTextureRestrictions")
         if context.scene.ignoreTextureRestrictions:
             col.box().label(text="Width/height must be < 1024. Must be png format.")
+        col.prop(context.scene.fast64.settings, "texture_cache_enabled")
+        if context.scene.fast64.settings.texture_cache_enabled:
+            prop_split(col, context.scene.fast64.settings, "texture_cache_size", "Texture Cache Size (MB)")
+            col.operator(F3D_ClearTextureCache.bl_idname)
+        col.prop(context.scene.fast64.settings, "optimize_vertex_loads")
+        col.prop(context.scene.fast64.settings, "sort_material_draw_order")
 
 
 class Fast64_GlobalObjectPanel(bpy.types.Panel):
@@ -269,6 +276,43 @@ class Fast64_GlobalToolsPanel(bpy.types.Panel):
         addon_updater_ops.update_notice_box_ui(self, context)
 
 
+class Fast64_ExportStatsPanel(bpy.types.Panel):
+    bl_idname = "FAST64_PT_export_stats"
+    bl_label = "Fast64 Export Stats"
+    bl_space_type = "VIEW_3D"
+    bl_region_type = "UI"
+    bl_category = "Fast64"
+    bl_options = {"DEFAULT_CLOSED"}
+
+    @classmethod
+    def poll(cls, context):
+        return True
+
+    # called every frame
+    def draw(self, context):
+        col = self.layout.column()
+        settings = context.scene.fast64.settings
+        col.prop(settings, "export_stats_report")
+        if settings.export_stats_report:
+            prop_split(col, settings, "export_stats_report_path", "Report File")
+
+        stats = ExportStats.last
+        if stats is None:
+            col.label(text="No export has been run yet.")
+            return
+
+        box = col.box().column()
+        status = "" if stats.succeeded else " (failed)"
+        box.label(text=f"{stats.exportName}{status}: {stats.totalTime:.3f}s")
+        for phaseName, (seconds, calls) in sorted(stats.phases.items(), key=lambda item: -item[1][0]):
+            box.label(text=f"{phaseName}: {seconds:.3f}s ({calls} calls)")
+
+        if len(stats.metrics) > 0:
+            box = col.box().column()
+            for name, value in stats.metrics.items():
+                box.label(text=f"{name.replace('_', ' ').capitalize()}: {value}")
+
+
 class Fast64Settings_Properties(bpy.types.PropertyGroup):
     """Settings affecting exports for all games found in scene.fast64.settings"""
 
@@ -302,6 +346,49 @@ class Fast64Settings_Properties(bpy.types.PropertyGroup):
         default="intersect_action_and_scene",
     )
 
+    texture_cache_enabled: bpy.props.BoolProperty(
+        name="Cache Converted Textures",
+        description=(
+            "Store converted texture data on disk, next to the blend file, "
+            "so that unchanged textures are not converted again on later exports"
+        ),
+        default=False,
+    )
+    texture_cache_size: bpy.props.IntProperty(
+        name="Texture Cache Size",
+        description="Maximum size of the texture cache in megabytes. Least recently used textures are removed first",
+        default=256,
+        min=1,
+    )
+
+    optimize_vertex_loads: bpy.props.BoolProperty(
+        name="Optimize Vertex Loads",
+        description=(
+            "Reorder the triangles of static meshes to reduce the number of vertex loads (SPVertex) "
+            "and vertices loaded. Counts before and after are printed to the console"
+        ),
+        default=False,
+    )
+    sort_material_draw_order: bpy.props.BoolProperty(
+        name="Sort Material Draw Order",
+        description=(
+            "Reorder the materials of static meshes so that materials with the same textures, combiner and render mode "
+            "are drawn together. Translucent materials keep their order. "
+            "Estimated texture bytes loaded before and after are printed to the console"
+        ),
+        default=False,
+    )
+    export_stats_report: bpy.props.BoolProperty(
+        name="Write Export Stats Report",
+        description="Append the timing and output stats of every export to a JSON lines file",
+        default=False,
+    )
+    export_stats_report_path: bpy.props.StringProperty(
+        name="Export Stats Report File",
+        description="File that export stats are appended to, one JSON object per export",
+        subtype="FILE_PATH",
+    )
+
 
 class Fast64_Properties(bpy.types.PropertyGroup):
     """
@@ -431,6 +518,7 @@ classes = (
     Fast64_GlobalSettingsPanel,
     SM64_ArmatureToolsPanel,
     Fast64_GlobalToolsPanel,
+    Fast64_ExportStatsPanel,
     UpgradeF3DMaterialsDialog,
 )
 
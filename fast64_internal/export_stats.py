@@ -0,0 +1,131 @@
+import bpy, sys, json, time, functools
+from contextlib import contextmanager
+
+
+class ExportStats:
+    """
+    Timing and output metrics of a single export operator run.
+    Phase times are inclusive, so a phase that runs inside another one is also counted in the outer phase.
+    """
+
+    # ExportStats of the export currently running, or None
+    active = None
+    # ExportStats of the last finished export, shown in the export stats panel
+    last = None
+
+    def __init__(self, exportName):
+        self.exportName = exportName
+        self.startTime = time.perf_counter()
+        self.totalTime = 0
+        self.succeeded = False
+        self.phases = {}  # phase name : [seconds, calls]
+        self.metrics = {}  # metric name : int
+
+    def addPhaseTime(self, phaseName, seconds):
+        phase = self.phases.setdefault(phaseName, [0, 0])
+        phase[0] += seconds
+        phase[1] += 1
+
+    def addMetrics(self, metrics):
+        for name, value in metrics.items():
+            self.metrics[name] = self.metrics.get(name, 0) + value
+
+    def to_dict(self):
+        return {
+            "export": self.exportName,
+            "succeeded": self.succeeded,
+            "total_seconds": self.totalTime,
+            "phases": {
+                phaseName: {"seconds": seconds, "calls": calls} for phaseName, (seconds, calls) in self.phases.items()
+            },
+            "metrics": self.metrics,
+        }
+
+
+@contextmanager
+def exportPhase(phaseName):
+    """
+    Times the enclosed code as an export phase, if an export is being recorded.
+    """
+    stats = ExportStats.active
+    if stats is None:
+        yield
+        return
+    startTime = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.addPhaseTime(phaseName, time.perf_counter() - startTime)
+
+
+def timedExportPhase(phaseName):
+    """
+    Decorator version of exportPhase.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with exportPhase(phaseName):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def recordExportMetrics(metrics):
+    if ExportStats.active is not None:
+        ExportStats.active.addMetrics(metrics)
+
+
+def getAddonVersion():
+    addonModule = sys.modules.get(__name__.split(".")[0])
+    bl_info = getattr(addonModule, "bl_info", None)
+    if bl_info is None:
+        return "unknown"
+    return ".".join(str(field) for field in bl_info["version"])
+
+
+def writeExportStatsReport(stats: ExportStats, reportPath):
+    reportPath = bpy.path.abspath(reportPath)
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "addon_version": getAddonVersion(),
+        "blender_version": bpy.app.version_string,
+    }
+    report.update(stats.to_dict())
+    try:
+        # Reports are appended as JSON lines, so that exports can be compared across addon versions.
+        with open(reportPath, "a", newline="\n") as reportFile:
+            reportFile.write(json.dumps(report) + "\n")
+    except OSError as e:
+        print(f"Could not write export stats report to {reportPath}: {e}")
+
+
+def recordExportStats(execute):
+    """
+    Decorator for export operator execute methods, which records the stats of the export.
+    """
+
+    @functools.wraps(execute)
+    def wrapper(self, context):
+        if ExportStats.active is not None:
+            return execute(self, context)
+
+        stats = ExportStats(self.bl_label)
+        ExportStats.active = stats
+        try:
+            result = execute(self, context)
+            stats.succeeded = "FINISHED" in result
+            return result
+        finally:
+            ExportStats.active = None
+            stats.totalTime = time.perf_counter() - stats.startTime
+            ExportStats.last = stats
+
+            settings = context.scene.fast64.settings
+            if settings.export_stats_report and settings.export_stats_report_path != "":
+                writeExportStatsReport(stats, settings.export_stats_report_path)
+
+    return wrapper
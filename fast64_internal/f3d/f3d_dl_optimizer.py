@@ -0,0 +1,372 @@
+from . import f3d_gbi
+from ..export_stats import recordExportMetrics
+
+# Commands are looked up by class name, since f3d_gbi imports this module.
+
+# Commands that set a single piece of state to an absolute value, by class name : state key
+singleStateCommands = {
+    "DPSetCombineMode": "combine",
+    "DPSetEnvColor": "envcolor",
+    "DPSetBlendColor": "blendcolor",
+    "DPSetFogColor": "fogcolor",
+    "DPSetFillColor": "fillcolor",
+    "DPSetPrimDepth": "primdepth",
+    "DPSetPrimColor": "primcolor",
+    "DPSetConvert": "convert",
+    "DPSetKeyR": "keyr",
+    "DPSetKeyGB": "keygb",
+    "SPTexture": "texture",
+    # Both set the RSP fog multiplier and offset
+    "SPFogFactor": "fog",
+    "SPFogPosition": "fog",
+    # Other mode fields
+    "DPPipelineMode": "pipeline",
+    "DPSetCycleType": "cycletype",
+    "DPSetTexturePersp": "textpersp",
+    "DPSetTextureDetail": "textdetail",
+    "DPSetTextureLOD": "textlod",
+    "DPSetTextureLUT": "textlut",
+    "DPSetTextureFilter": "textfilt",
+    "DPSetTextureConvert": "textconv",
+    "DPSetCombineKey": "combkey",
+    "DPSetColorDither": "rgbdither",
+    "DPSetAlphaDither": "alphadither",
+    "DPSetAlphaCompare": "alphacompare",
+    "DPSetDepthSource": "zsrcsel",
+    "DPSetRenderMode": "rendermode",
+}
+
+otherModeKeys = {
+    "pipeline",
+    "cycletype",
+    "textpersp",
+    "textdetail",
+    "textlod",
+    "textlut",
+    "textfilt",
+    "textconv",
+    "combkey",
+    "rgbdither",
+    "alphadither",
+    "alphacompare",
+    "zsrcsel",
+    "rendermode",
+}
+
+# Commands that draw primitives, which read the current state
+renderCommands = {"SP1Triangle", "SP2Triangles", "SPLine3D", "SPTextureRectangle", "SPScisTextureRectangle"}
+
+# State read by the RSP when vertices are loaded, for lighting, texture coordinate generation and fog
+vertexStateKeys = {"texture", "fog"}
+
+# Commands that don't read or change any tracked state
+neutralCommands = {
+    "SPMatrix",
+    "SPSetLights",
+    "SPLight",
+    "SPLightColor",
+    "SPNumLights",
+    "SPPerspNormalize",
+    "SPCullDisplayList",
+    "SPBranchLessZraw",
+    "DPSetHilite1Tile",
+    "DPSetHilite2Tile",
+    "DPTileSync",
+    "DPLoadSync",
+}
+
+# Commands that set the texture image or the settings of one tile, which are read by TMEM loads and primitives.
+# Since these reads are not tracked, only writes of the value a tile already has are removed.
+tileStateCommands = {"DPSetTextureImage", "DPSetTile", "DPSetTileSize"}
+
+# Commands that load TMEM. They use the RDP pipeline like primitives do,
+# so a pipe sync after them (as in gsDPLoadTextureBlock / gsDPLoadTLUT) must be kept.
+# Single load commands use the texture image and the settings of their tile.
+tmemLoadCommands = {
+    "DPLoadTile",
+    "DPLoadBlock",
+    "DPLoadTLUTCmd",
+}
+
+# Load macros, which also set the texture image and the settings of the load and render tiles
+tmemLoadMacros = {
+    "DPLoadTextureBlock",
+    "DPLoadTextureBlockYuv",
+    "_DPLoadTextureBlock",
+    "DPLoadTextureBlock_4b",
+    "DPLoadTextureTile",
+    "DPLoadTextureTile_4b",
+    "DPLoadTLUT_pal16",
+    "DPLoadTLUT_pal256",
+    "DPLoadTLUT",
+}
+
+# Tile names used by imported display lists
+tileNames = {"G_TX_LOADTILE": 7, "G_TX_RENDERTILE": 0}
+
+geometryModeCommands = {"SPSetGeometryMode", "SPClearGeometryMode", "SPGeometryMode"}
+
+
+def getGeometryModeWrites(command):
+    """
+    Returns a dict of geometry mode flag : value set by the command.
+    """
+    commandName = type(command).__name__
+    if commandName == "SPSetGeometryMode":
+        return {flag: True for flag in command.flagList}
+    elif commandName == "SPClearGeometryMode":
+        return {flag: False for flag in command.flagList}
+    else:
+        writes = {flag: False for flag in command.clearFlagList}
+        writes.update({flag: True for flag in command.setFlagList})
+        return writes
+
+
+def getTileStateKey(command):
+    """
+    Returns the state key set by a tile state command, or None if its tile is not known.
+    """
+    commandName = type(command).__name__
+    if commandName == "DPSetTextureImage":
+        return "timg"
+    elif commandName == "DPSetTile":
+        tile = tileNames.get(command.tile, command.tile)
+        return ("tile", tile) if isinstance(tile, int) else None
+    else:
+        tile = tileNames.get(command.t, command.t)
+        return ("tilesize", tile) if isinstance(tile, int) else None
+
+
+def withGeometryModeWrites(command, writes):
+    """
+    Returns a geometry mode command of the same type that only sets the given flags.
+    """
+    commandName = type(command).__name__
+    if commandName == "SPSetGeometryMode" or commandName == "SPClearGeometryMode":
+        return type(command)(list(writes))
+    return SPGeometryModeFromWrites(writes)
+
+
+def SPGeometryModeFromWrites(writes):
+    return f3d_gbi.SPGeometryMode(
+        [flag for flag, value in writes.items() if not value], [flag for flag, value in writes.items() if value]
+    )
+
+
+class DisplayListState:
+    """
+    State known to be set at a point in a display list, relative to the start of the list.
+    """
+
+    def __init__(self):
+        self.values = {}  # state key : to_c() of the command that set it
+        self.geometryMode = {}  # flag : bool
+        self.pendingWrites = {}  # state key : index of a write that has not been read yet
+        self.renderedSinceSync = True  # unknown at the start of a list, so the first sync is always kept
+        self.lastLoad = None  # (load command, texture image, tile settings) of the last write to TMEM
+
+    def forgetAll(self):
+        self.values.clear()
+        self.geometryMode.clear()
+        self.pendingWrites.clear()
+        self.lastLoad = None
+
+    def forgetTiles(self):
+        for key in list(self.values):
+            if key == "timg" or isinstance(key, tuple):
+                del self.values[key]
+
+    def forgetOtherMode(self):
+        for key in otherModeKeys:
+            self.values.pop(key, None)
+            self.pendingWrites.pop(key, None)
+
+
+def optimizeGfxList(gfxList):
+    """
+    Removes commands that set state to the value it already has, state that is overwritten before being used,
+    TMEM loads repeating the previous load, and pipe syncs with no primitives drawn since the previous sync.
+    Only state set earlier in the same list is known, since lists can be called from different states.
+    Returns the number of removed commands.
+    """
+    state = DisplayListState()
+    removed = set()
+    newCommands = list(gfxList.commands)
+
+    for index, command in enumerate(gfxList.commands):
+        commandName = type(command).__name__
+
+        if commandName in singleStateCommands:
+            key = singleStateCommands[commandName]
+            value = command.to_c(True)
+            if state.values.get(key) == value:
+                removed.add(index)
+                continue
+            # The previous write was never used by a primitive, so it has no effect.
+            if key in state.pendingWrites:
+                removed.add(state.pendingWrites[key])
+            state.values[key] = value
+            state.pendingWrites[key] = index
+
+        elif commandName in geometryModeCommands:
+            writes = getGeometryModeWrites(command)
+            changedWrites = {flag: value for flag, value in writes.items() if state.geometryMode.get(flag) != value}
+            if len(changedWrites) == 0:
+                removed.add(index)
+                continue
+            if len(changedWrites) < len(writes):
+                newCommands[index] = withGeometryModeWrites(command, changedWrites)
+            state.geometryMode.update(changedWrites)
+
+        elif commandName == "SPLoadGeometryMode":
+            # Sets every flag, including ones we don't track
+            state.geometryMode = {flag: True for flag in command.flagList}
+
+        elif commandName == "DPSetOtherMode" or commandName == "SPSetOtherMode":
+            state.forgetOtherMode()
+
+        elif commandName == "DPPipeSync":
+            # A sync directly after a TMEM load is always kept, whatever the state tracking says.
+            previousName = type(gfxList.commands[index - 1]).__name__ if index > 0 else None
+            followsLoad = previousName in tmemLoadCommands or previousName in tmemLoadMacros
+            if not state.renderedSinceSync and not followsLoad:
+                removed.add(index)
+                continue
+            state.renderedSinceSync = False
+
+        elif commandName in tileStateCommands:
+            key = getTileStateKey(command)
+            if key is None:
+                state.forgetTiles()
+                continue
+            value = command.to_c(True)
+            if state.values.get(key) == value:
+                removed.add(index)
+                continue
+            state.values[key] = value
+
+        elif commandName in renderCommands:
+            state.renderedSinceSync = True
+            state.pendingWrites.clear()
+
+        elif commandName == "SPVertex":
+            for key in vertexStateKeys:
+                state.pendingWrites.pop(key, None)
+
+        elif commandName in tmemLoadCommands:
+            state.renderedSinceSync = True
+            tile = command.t if commandName == "DPLoadTile" else command.tile
+            tile = tileNames.get(tile, tile)
+            if not isinstance(tile, int):
+                state.forgetTiles()
+                state.lastLoad = None
+                continue
+            load = (command.to_c(True), state.values.get("timg"), state.values.get(("tile", tile)))
+            # TMEM still holds what the previous load wrote, so loading the same data again has no effect.
+            if load == state.lastLoad:
+                removed.add(index)
+                continue
+            state.lastLoad = load
+            # Loads set the size of their tile
+            state.values.pop(("tilesize", tile), None)
+
+        elif commandName in tmemLoadMacros:
+            state.forgetTiles()
+            state.lastLoad = None
+            state.renderedSinceSync = True
+
+        elif commandName not in neutralCommands:
+            # Calls, branches and anything unknown
+            state.forgetAll()
+            state.renderedSinceSync = True
+
+    gfxList.commands = [command for index, command in enumerate(newCommands) if index not in removed]
+    return len(removed)
+
+
+def getMaterialStateKeys(gfxList):
+    """
+    Returns the state keys set by a list before it draws anything or calls another list.
+    Geometry mode flags are returned as ("geo", flag).
+    """
+    keys = set()
+    for command in gfxList.commands:
+        commandName = type(command).__name__
+        if commandName in singleStateCommands:
+            keys.add(singleStateCommands[commandName])
+        elif commandName in geometryModeCommands:
+            keys.update(("geo", flag) for flag in getGeometryModeWrites(command))
+        elif (
+            commandName == "DPPipeSync"
+            or commandName == "SPVertex"
+            or commandName in neutralCommands
+            or commandName in tileStateCommands
+            or commandName in tmemLoadCommands
+            or commandName in tmemLoadMacros
+        ):
+            continue
+        else:
+            break
+    return keys
+
+
+def getRevertStateKeys(gfxList):
+    """
+    Returns the state keys a revert list sets, or None if it does anything other than setting state.
+    """
+    keys = set()
+    for command in gfxList.commands:
+        commandName = type(command).__name__
+        if commandName in singleStateCommands:
+            keys.add(singleStateCommands[commandName])
+        elif commandName in geometryModeCommands:
+            keys.update(("geo", flag) for flag in getGeometryModeWrites(command))
+        elif commandName == "DPPipeSync" or commandName == "SPEndDisplayList":
+            continue
+        else:
+            return None
+    return keys
+
+
+def removeOverwrittenReverts(gfxList):
+    """
+    Removes calls to material revert lists that are directly followed by a material that sets all of the reverted state.
+    Returns the number of removed commands.
+    """
+    newCommands = []
+    commands = gfxList.commands
+    for index, command in enumerate(commands):
+        if (
+            isinstance(command, f3d_gbi.SPDisplayList)
+            and command.displayList.tag == f3d_gbi.GfxListTag.MaterialRevert
+            and index + 1 < len(commands)
+            and isinstance(commands[index + 1], f3d_gbi.SPDisplayList)
+            and commands[index + 1].displayList.tag == f3d_gbi.GfxListTag.Material
+        ):
+            nextMaterial = commands[index + 1].displayList
+            revertKeys = getRevertStateKeys(command.displayList)
+            # The next material has to sync before changing state, since the revert's sync is removed too.
+            startsWithSync = len(nextMaterial.commands) > 0 and isinstance(nextMaterial.commands[0], f3d_gbi.DPPipeSync)
+            if revertKeys is not None and startsWithSync and revertKeys <= getMaterialStateKeys(nextMaterial):
+                continue
+        newCommands.append(command)
+
+    removedCount = len(commands) - len(newCommands)
+    gfxList.commands = newCommands
+    return removedCount
+
+
+def optimizeModelDisplayLists(fModel):
+    """
+    Runs the display list optimizer over all display lists of a model.
+    """
+    gfxLists, vtxLists = fModel.get_gfx_and_vtx_lists()
+    removedCount = 0
+    for name, mesh in fModel.meshes.items():
+        removedCount += removeOverwrittenReverts(mesh.draw)
+    for gfxList in gfxLists:
+        removedCount += optimizeGfxList(gfxList)
+
+    if removedCount > 0:
+        print(f"Display list optimizer removed {removedCount} commands from {fModel.name}.")
+    recordExportMetrics({"optimizer_removed_commands": removedCount})
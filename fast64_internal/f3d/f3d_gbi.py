@@ -1,6 +1,8 @@
 # Macros are all copied over from gbi.h
 import bpy, os, enum
 from ..utility import *
+from ..export_stats import timedExportPhase, recordExportMetrics
+from .f3d_dl_optimizer import optimizeModelDisplayLists
 
 
 class ScrollMethod(enum.Enum):
@@ -2081,13 +2083,15 @@ class VtxList:
 
     def to_c(self):
         data = CData()
-        data.header = "extern Vtx " + self.name + "[" + str(len(self.vertices)) + "];\n"
-        data.source = "Vtx " + self.name + "[" + str(len(self.vertices)) + "] = {\n"
-        for vert in self.vertices:
-            data.source += "\t" + vert.to_c() + ",\n"
-        data.source += "};\n\n"
+        self.write_c(data)
         return data
 
+    def write_c(self, data: CData):
+        data.write_header("extern Vtx " + self.name + "[" + str(len(self.vertices)) + "];\n")
+        data.write_source("Vtx " + self.name + "[" + str(len(self.vertices)) + "] = {\n")
+        data.extend_source("\t" + vert.to_c() + ",\n" for vert in self.vertices)
+        data.write_source("};\n\n")
+
     def to_sm64_decomp_s(self):
         data = self.name + ":\n"
         for vert in self.vertices:
@@ -2147,31 +2151,38 @@ class GfxList:
 
         return data
 
-    def to_c_static(self):
-        data = "Gfx " + self.name + "[] = {\n"
+    def c_static_parts(self):
+        yield "Gfx " + self.name + "[] = {\n"
         for command in self.commands:
-            data += "\t" + command.to_c(True) + ",\n"
-        data += "};\n\n"
-        return data
+            yield "\t" + command.to_c(True) + ",\n"
+        yield "};\n\n"
 
-    def to_c_dynamic(self):
-        data = "Gfx* " + self.name + "(Gfx* glistp) {\n"
+    def c_dynamic_parts(self):
+        yield "Gfx* " + self.name + "(Gfx* glistp) {\n"
         for command in self.commands:
-            data += "\t" + command.to_c(False) + ";\n"
-        data += "\treturn glistp;\n}\n\n"
-        return data
+            yield "\t" + command.to_c(False) + ";\n"
+        yield "\treturn glistp;\n}\n\n"
+
+    def to_c_static(self):
+        return "".join(self.c_static_parts())
+
+    def to_c_dynamic(self):
+        return "".join(self.c_dynamic_parts())
 
     def to_c(self, f3d):
         data = CData()
+        self.write_c(data, f3d)
+        return data
+
+    def write_c(self, data: CData, f3d):
         if self.DLFormat == DLFormat.Static:
-            data.header = "extern Gfx " + self.name + "[];\n"
-            data.source = self.to_c_static()
+            data.write_header("extern Gfx " + self.name + "[];\n")
+            data.extend_source(self.c_static_parts())
         elif self.DLFormat == DLFormat.Dynamic:
-            data.header = "Gfx* " + self.name + "(Gfx* glistp);\n"
-            data.source = self.to_c_dynamic()
+            data.write_header("Gfx* " + self.name + "(Gfx* glistp);\n")
+            data.extend_source(self.c_dynamic_parts())
         else:
             raise PluginError("Invalid GfxList format: " + str(self.DLFormat))
-        return data
 
     def to_sm64_decomp_s(self):
         data = "glabel " + self.name + "\n"
@@ -2238,6 +2249,43 @@ class FGlobalData:
             return self.area_data[self.current_area_index].makeKey()
 
 
+class VertexLoadStats:
+    """
+    Vertex load counts of display lists with optimized triangle order, before and after reordering.
+    Counts are (number of SPVertex commands, total vertices loaded).
+    """
+
+    def __init__(self):
+        self.entries = []  # (display list name, counts before, counts after)
+
+    def add(self, name, before, after):
+        self.entries.append((name, before, after))
+        print(f"Vertex loads for {name}: {before[0]} ({before[1]} vertices) -> {after[0]} ({after[1]} vertices)")
+
+    def totals(self):
+        loadsBefore = sum(before[0] for name, before, after in self.entries)
+        vertsBefore = sum(before[1] for name, before, after in self.entries)
+        loadsAfter = sum(after[0] for name, before, after in self.entries)
+        vertsAfter = sum(after[1] for name, before, after in self.entries)
+        return (loadsBefore, vertsBefore), (loadsAfter, vertsAfter)
+
+
+class MaterialOrderStats:
+    """
+    Estimated texture bytes loaded by the material calls of static meshes, before and after sorting materials.
+    """
+
+    def __init__(self):
+        self.entries = []  # (mesh name, bytes before, bytes after)
+
+    def add(self, name, before, after):
+        self.entries.append((name, before, after))
+        print(f"Texture bytes loaded by materials of {name}: {before} -> {after}")
+
+    def totals(self):
+        return sum(before for name, before, after in self.entries), sum(after for name, before, after in self.entries)
+
+
 class FModel:
     def __init__(self, f3dType, isHWv1, name, DLFormat, matWriteMethod):
         self.name = name  # used for texture prefixing
@@ -2263,6 +2311,8 @@ class FModel:
         self.matWriteMethod = matWriteMethod
         self.global_data = FGlobalData()
         self.texturesSavedLastExport = 0  # hacky
+        self.vertexLoadStats = VertexLoadStats()
+        self.materialOrderStats = MaterialOrderStats()
 
     # Called before SPEndDisplayList
     def onMaterialCommandsBuilt(self, fMaterial, material, drawLayer):
@@ -2277,6 +2327,13 @@ class FModel:
     def getRenderMode(self, drawLayer):
         return None
 
+    def optimizeDisplayListsEnabled(self):
+        return False
+
+    def optimize_display_lists(self):
+        if self.optimizeDisplayListsEnabled():
+            optimizeModelDisplayLists(self)
+
     def addLODGroup(self, name, position, alwaysRenderFarthest):
         if name in self.LODGroups:
             raise PluginError("Duplicate LOD group: " + str(name))
@@ -2411,6 +2468,68 @@ class FModel:
             materials.update(subModel.getAllMaterials())
         return materials
 
+    def get_gfx_and_vtx_lists(self):
+        """
+        Returns (GfxLists, VtxLists) of this model, not including sub models.
+        """
+        gfxLists = []
+        vtxLists = []
+        for name, lod in self.LODGroups.items():
+            if lod.drawCommandsBuilt:
+                gfxLists.append(lod.draw)
+            gfxLists.extend(displayList for displayList in lod.subdraws if displayList is not None)
+            vtxLists.append(lod.vertexList)
+        for name, mesh in self.meshes.items():
+            gfxLists.append(mesh.draw)
+            gfxLists.extend(mesh.drawMatOverrides.values())
+            for triGroup in mesh.triangleGroups:
+                gfxLists.append(triGroup.triList)
+                vtxLists.append(triGroup.vertexList)
+            if mesh.cullVertexList is not None:
+                vtxLists.append(mesh.cullVertexList)
+        for materialKey, (fMaterial, texDimensions) in self.materials.items():
+            gfxLists.append(fMaterial.material)
+            if fMaterial.revert is not None:
+                gfxLists.append(fMaterial.revert)
+        if self.materialRevert is not None:
+            gfxLists.append(self.materialRevert)
+        return gfxLists, vtxLists
+
+    def get_stats(self):
+        """
+        Returns output metrics of this model, not including sub models.
+        """
+        gfxLists, vtxLists = self.get_gfx_and_vtx_lists()
+        stats = {
+            "vertices": sum(len(vtxList.vertices) for vtxList in vtxLists),
+            "vertex_loads": 0,
+            "triangles": 0,
+            "texture_loads": 0,
+            "gfx_bytes": sum(gfxList.size(self.f3d) for gfxList in gfxLists),
+            "vtx_bytes": sum(vtxList.size() for vtxList in vtxLists),
+            "texture_bytes": sum(texture.size() for texture in self.textures.values()),
+        }
+        for gfxList in gfxLists:
+            for command in gfxList.commands:
+                if isinstance(command, SPVertex):
+                    stats["vertex_loads"] += 1
+                elif isinstance(command, SP1Triangle):
+                    stats["triangles"] += 1
+                elif isinstance(command, SP2Triangles):
+                    stats["triangles"] += 2
+                elif isinstance(command, textureLoadCommands):
+                    stats["texture_loads"] += 1
+
+        (loadsBefore, vertsBefore), (loadsAfter, vertsAfter) = self.vertexLoadStats.totals()
+        if len(self.vertexLoadStats.entries) > 0:
+            stats["optimized_vertex_loads_before"] = loadsBefore
+            stats["optimized_vertex_loads_after"] = loadsAfter
+        if len(self.materialOrderStats.entries) > 0:
+            stats["sorted_material_texture_bytes_before"], stats["sorted_material_texture_bytes_after"] = (
+                self.materialOrderStats.totals()
+            )
+        return stats
+
     def get_ptr_addresses(self, f3d):
         addresses = []
         for name, lod in self.LODGroups.items():
@@ -2424,6 +2543,7 @@ class FModel:
         return addresses
 
     def set_addr(self, startAddress):
+        self.optimize_display_lists()
         addrRange = (startAddress, startAddress)
         startAddrSet = False
         for name, lod in self.LODGroups.items():
@@ -2466,6 +2586,7 @@ class FModel:
         return startAddress, addrRange[1]
 
     def save_binary(self, romfile, segments):
+        recordExportMetrics(self.get_stats())
         for name, light in self.lights.items():
             light.save_binary(romfile)
         for info, texture in self.textures.items():
@@ -2497,7 +2618,7 @@ class FModel:
             if savePNG:
                 data.append(texture.to_c_tex_separate(texDir, texArrayBitSize))
             else:
-                data.append(texture.to_c(texArrayBitSize))
+                texture.write_c(data, texArrayBitSize)
         return data
 
     def to_c_materials(self, gfxFormatter):
@@ -2517,24 +2638,38 @@ class FModel:
             data.append(self.materialRevert.to_c(self.f3d))
         return data
 
-    def to_c(self, textureExportSettings: TextureExportSettings, gfxFormatter: GfxFormatter):
+    @timedExportPhase("C Emission")
+    def to_c(
+        self,
+        textureExportSettings: TextureExportSettings,
+        gfxFormatter: GfxFormatter,
+        exportData: ExportCData | None = None,
+    ):
+        """
+        exportData can be used to provide the CData objects to write into,
+        ex. CDataFileWriter objects to stream the output directly to files.
+        """
         texCSeparate = textureExportSettings.texCSeparate
         savePNG = textureExportSettings.savePNG
         texDir = textureExportSettings.includeDir
 
-        staticData = CData()
-        dynamicData = CData()
-        texC = CData()
+        self.optimize_display_lists()
+
+        if exportData is None:
+            exportData = ExportCData(CData(), CData(), CData())
+        staticData = exportData.staticData
+        dynamicData = exportData.dynamicData
+        texC = exportData.textureData
 
         # Source
         staticData.append(self.to_c_lights())
 
         texData = self.to_c_textures(texCSeparate, savePNG, texDir, gfxFormatter.texArrayBitSize)
-        staticData.header += texData.header
+        staticData.extend_header(texData.headerParts)
         if texCSeparate:
-            texC.source += texData.source
+            texC.extend_source(texData.sourceParts)
         else:
-            staticData.source += texData.source
+            staticData.extend_source(texData.sourceParts)
 
         dynamicData.append(self.to_c_materials(gfxFormatter))
 
@@ -2553,8 +2688,9 @@ class FModel:
         if savePNG:
             self.texturesSavedLastExport = self.save_textures(textureExportSettings.exportPath)
 
+        recordExportMetrics(self.get_stats())
         self.freePalettes()
-        return ExportCData(staticData, dynamicData, texC)
+        return exportData
 
     def to_c_vertex_scroll(self, scrollName, gfxFormatter):
         scrollData = CData()
@@ -2794,7 +2930,7 @@ class FMesh:
     def to_c(self, f3d, gfxFormatter):
         staticData = CData()
         if self.cullVertexList is not None:
-            staticData.append(self.cullVertexList.to_c())
+            self.cullVertexList.write_c(staticData)
         for triGroup in self.triangleGroups:
             staticData.append(triGroup.to_c(f3d, gfxFormatter))
         dynamicData = gfxFormatter.drawToC(f3d, self.draw)
@@ -2850,8 +2986,8 @@ class FTriGroup:
 
     def to_c(self, f3d, gfxFormatter):
         data = CData()
-        data.append(self.vertexList.to_c())
-        data.append(self.triList.to_c(f3d))
+        self.vertexList.write_c(data)
+        self.triList.write_c(data, f3d)
         return data
 
     def to_c_vertex_scroll(self, gfxFormatter: GfxFormatter):
@@ -3262,24 +3398,40 @@ class FImage:
         return self.data
 
     def to_c(self, texArrayBitSize):
-        return self.to_c_helper(self.to_c_data(texArrayBitSize), texArrayBitSize)
+        code = CData()
+        self.write_c(code, texArrayBitSize)
+        return code
+
+    def write_c(self, code: CData, texArrayBitSize):
+        self.write_c_helper(code, self.c_data_parts(texArrayBitSize), texArrayBitSize)
 
     def to_c_tex_separate(self, texPath, texArrayBitSize):
-        return self.to_c_helper('#include "' + texPath + self.filename + '"', texArrayBitSize)
+        code = CData()
+        self.write_c_helper(code, ['#include "' + texPath + self.filename + '"'], texArrayBitSize)
+        return code
 
     def to_c_helper(self, texData, bitsPerValue):
         code = CData()
-        code.header = "extern u" + str(bitsPerValue) + " " + self.name + "[];\n"
+        self.write_c_helper(code, [texData], bitsPerValue)
+        return code
+
+    def write_c_helper(self, code: CData, texDataParts, bitsPerValue):
+        code.write_header("extern u" + str(bitsPerValue) + " " + self.name + "[];\n")
 
         # This is to force 8 byte alignment
         if bitsPerValue != 64:
-            code.source = "Gfx " + self.name + "_aligner[] = {gsSPEndDisplayList()};\n"
-        code.source += "u" + str(bitsPerValue) + " " + self.name + "[] = {\n\t"
-        code.source += texData
-        code.source += "\n};\n\n"
-        return code
+            code.write_source("Gfx " + self.name + "_aligner[] = {gsSPEndDisplayList()};\n")
+        code.write_source("u" + str(bitsPerValue) + " " + self.name + "[] = {\n\t")
+        code.extend_source(texDataParts)
+        code.write_source("\n};\n\n")
 
     def to_c_data(self, bitsPerValue):
+        return "".join(self.c_data_parts(bitsPerValue))
+
+    def c_data_parts(self, bitsPerValue):
+        """
+        Yields the texture data as C text, one line of values at a time.
+        """
         if not self.converted:
             raise PluginError(
                 "Error: Trying to write texture data to C, but haven't actually converted the image file to bytes yet."
@@ -3288,30 +3440,26 @@ class FImage:
         bytesPerValue = int(bitsPerValue / 8)
         numValues = int(len(self.data) / bytesPerValue)
         remainderCount = len(self.data) - numValues * bytesPerValue
-        digits = 2 + 2 * bytesPerValue
-
-        code = "".join(
-            [
-                format(
-                    int.from_bytes(self.data[i * bytesPerValue : (i + 1) * bytesPerValue], "big"),
-                    "#0" + str(digits) + "x",
-                )
-                + ", "
-                + ("\n\t" if i % 8 == 7 else "")
-                for i in range(numValues)
-            ]
-        )
+        valueFormat = "#0" + str(2 + 2 * bytesPerValue) + "x"
+        valuesPerLine = 8
+
+        for lineStart in range(0, numValues, valuesPerLine):
+            lineEnd = min(lineStart + valuesPerLine, numValues)
+            yield "".join(
+                [
+                    format(int.from_bytes(self.data[i * bytesPerValue : (i + 1) * bytesPerValue], "big"), valueFormat)
+                    + ", "
+                    for i in range(lineStart, lineEnd)
+                ]
+            ) + ("\n\t" if lineEnd % valuesPerLine == 0 else "")
 
         if remainderCount > 0:
             start = numValues * bytesPerValue
             end = (numValues + 1) * bytesPerValue
-            code += format(
-                int.from_bytes(self.data[start:end], "big") << (8 * (bytesPerValue - remainderCount)),
-                "#0" + str(digits) + "x",
+            yield format(
+                int.from_bytes(self.data[start:end], "big") << (8 * (bytesPerValue - remainderCount)), valueFormat
             )
 
-        return code
-
     def set_addr(self, startAddress):
         startAddress = get64bitAlignedAddr(startAddress)
         self.startAddress = startAddress
@@ -6590,6 +6738,23 @@ class DPLoadTLUT:
             return GFX_SIZE * 7
 
 
+# Commands that load texture data into TMEM, used for export stats
+textureLoadCommands = (
+    DPLoadTile,
+    DPLoadBlock,
+    DPLoadTLUTCmd,
+    DPLoadTextureBlock,
+    DPLoadTextureBlockYuv,
+    _DPLoadTextureBlock,
+    DPLoadTextureBlock_4b,
+    DPLoadTextureTile,
+    DPLoadTextureTile_4b,
+    DPLoadTLUT_pal16,
+    DPLoadTLUT_pal256,
+    DPLoadTLUT,
+)
+
+
 # gsDPSetScissor
 # gsDPSetScissorFrac
 
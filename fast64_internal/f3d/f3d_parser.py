@@ -95,8 +95,7 @@ def cmdToPositiveInt(cmd):
 def parseF3DBinary(romfile, startAddress, scene, bMesh, obj, transformMatrix, groupName, segmentData, vertexBuffer):
     f3d = F3D("F3D", False)
     currentAddress = startAddress
-    romfile.seek(currentAddress)
-    command = romfile.read(8)
+    command = romfile.readAt(currentAddress, 8)
 
     faceSeq = bMesh.faces
     vertSeq = bMesh.verts
@@ -136,8 +135,7 @@ def parseF3DBinary(romfile, startAddress, scene, bMesh, obj, transformMatrix, gr
             if command[1] == 0:
                 jumps.append(currentAddress)
             currentAddress = decodeSegmentedAddr(command[4:8], segmentData=segmentData)
-            romfile.seek(currentAddress)
-            command = romfile.read(8)
+            command = romfile.readAt(currentAddress, 8)
             continue
 
         elif command[0] == cmdToPositiveInt(f3d.G_ENDDL):
@@ -163,8 +161,7 @@ def parseF3DBinary(romfile, startAddress, scene, bMesh, obj, transformMatrix, gr
             # print(format(command[0], '#04x') + ' at ' + hex(currentAddress))
 
         currentAddress += 8
-        romfile.seek(currentAddress)
-        command = romfile.read(8)
+        command = romfile.readAt(currentAddress, 8)
 
     bmesh.ops.remove_doubles(bMesh, verts=vertList, dist=0.0001)
     return vertexBuffer
@@ -248,11 +245,13 @@ def interpretLoadVertices(romfile, vertexBuffer, transformMatrix, command, segme
 
     dataStartAddr = decodeSegmentedAddr(segmentedAddr.to_bytes(4, "big"), segmentData=segmentData)
 
-    romfile.seek(dataStartAddr)
-    data = romfile.read(dataLength)
+    data = romfile.readAt(dataStartAddr, dataLength)
+    # Positions of all vertices are decoded at once, the rest of each vertex is copied as is.
+    positions = romfile.unpackAt(">" + "3h10x" * numVerts, dataStartAddr)
+    scale = bpy.context.scene.blenderToSM64Scale
 
     for i in range(numVerts):
-        vert = mathutils.Vector(readVectorFromShorts(data, i * 16))
+        vert = mathutils.Vector([value / scale for value in positions[i * 3 : i * 3 + 3]])
         vert = transformMatrix @ vert
         transformedVert = bytearray(6)
         writeVectorToShorts(transformedVert, 0, vert)
@@ -329,10 +328,9 @@ def createNewTextureMaterial(romfile, textureStart, textureSize, texelCount, col
 
     obj.data.materials.append(newMat)
 
-    romfile.seek(textureStart)
     texelSize = int(colorDepth / 8)
     dataLength = texelCount * texelSize
-    textureData = romfile.read(dataLength)
+    textureData = romfile.readAt(textureStart, dataLength)
 
     if colorDepth != 16:
         print("Warning: Only 16bit RGBA supported, input was " + str(colorDepth) + "bit " + colorFormat)
@@ -358,11 +356,36 @@ binOps = {
 }
 
 
+# Plain decimal and hex literals, which are most macro arguments
+intLiteralPattern = re.compile(r"-?(?:0[xX][0-9a-fA-F]+|0|[1-9][0-9]*)")
+
+# dict of (expression, F3D version, HW v1) : value
+mathEvalCache = {}
+mathEvalCacheSize = 2**16
+
+
 def math_eval(s, f3d):
     if isinstance(s, int):
         return s
 
     s = s.strip()
+    if intLiteralPattern.fullmatch(s):
+        return int(s, 0)
+
+    cacheKey = (s, f3d.F3D_VER, f3d._HW_VERSION_1)
+    if cacheKey in mathEvalCache:
+        return mathEvalCache[cacheKey]
+
+    value = math_eval_expression(s, f3d)
+    # Only cache immutable values, since callers may modify results of calls
+    if isinstance(value, (int, float, str)):
+        if len(mathEvalCache) >= mathEvalCacheSize:
+            mathEvalCache.clear()
+        mathEvalCache[cacheKey] = value
+    return value
+
+
+def math_eval_expression(s, f3d):
     node = ast.parse(s, mode="eval")
 
     def _eval(node):
@@ -464,12 +487,14 @@ class F3DContext:
         mat.set_combiner = False
 
         self.materials = []  # saved materials
+        self.materialIndices = {}  # propertyGroupFingerprint of material context : index in materials
         self.triMatIndices = []  # material indices per triangle
         self.materialChanged = True
         self.lastMaterialIndex = None
 
         self.vertexData = {}  # c name : parsed data
         self.textureData = {}  # c name : blender texture
+        self.symbolIndex = None  # CSymbolIndex of the data being imported
 
         self.tlutAppliedTextures = []  # c name
         self.currentTextureName = None
@@ -517,6 +542,12 @@ class F3DContext:
         self.numLights = 0
         self.lightData = {}  # (color, normal) : list of blender light objects
 
+    def getSymbolIndex(self, data):
+        # The same data string is passed through the whole import, so the index is only built once.
+        if self.symbolIndex is None or self.symbolIndex.data is not data:
+            self.symbolIndex = CSymbolIndex(data)
+        return self.symbolIndex
+
     # MAKE SURE TO CALL THIS BETWEEN parseF3D() CALLS
     def clearMaterial(self):
         mat = self.mat()
@@ -691,19 +722,42 @@ class F3DContext:
             self.triMatIndices.append(self.lastMaterialIndex)
 
     def getMaterialIndex(self):
-        # We do this for now to update tile settings for S and T.
-        # Right now we don't handle those, so we need the auto-calculator to set it correctly.
-        overrideContext = bpy.context.copy()
-        overrideContext["material"] = self.materialContext
-        bpy.ops.material.update_f3d_nodes(overrideContext)
-
-        for material in self.materials:
-            if propertyGroupEquals(self.materialContext.f3d_mat, material.f3d_mat):
-                return self.materials.index(material)
+        # Node updates are deferred to mergeMaterials, so materials are compared before they are updated here.
+        fingerprint = propertyGroupFingerprint(self.materialContext.f3d_mat)
+        if fingerprint in self.materialIndices:
+            return self.materialIndices[fingerprint]
 
         self.addMaterial()
+        self.materialIndices[fingerprint] = len(self.materials) - 1
         return len(self.materials) - 1
 
+    def mergeMaterials(self):
+        """
+        Updates the nodes of saved materials, and merges materials that are equal after the update.
+        """
+        mergedMaterials = []
+        mergedIndices = {}  # propertyGroupFingerprint : index in mergedMaterials
+        newIndices = []  # index in materials : index in mergedMaterials
+        for material in self.materials:
+            # We do this for now to update tile settings for S and T.
+            # Right now we don't handle those, so we need the auto-calculator to set it correctly.
+            overrideContext = bpy.context.copy()
+            overrideContext["material"] = material
+            bpy.ops.material.update_f3d_nodes(overrideContext)
+
+            fingerprint = propertyGroupFingerprint(material.f3d_mat)
+            if fingerprint in mergedIndices:
+                newIndices.append(mergedIndices[fingerprint])
+                bpy.data.materials.remove(material)
+            else:
+                mergedIndices[fingerprint] = len(mergedMaterials)
+                newIndices.append(len(mergedMaterials))
+                mergedMaterials.append(material)
+
+        self.materials = mergedMaterials
+        self.materialIndices = {}
+        self.triMatIndices = [newIndices[index] for index in self.triMatIndices]
+
     def getImageName(self, image):
         for name, otherImage in self.textureData.items():
             if image == otherImage:
@@ -761,9 +815,6 @@ class F3DContext:
         self.applyTLUTToIndex(1)
 
         material = self.materialContext.copy()
-        overrideContext = bpy.context.copy()
-        overrideContext["material"] = material
-        bpy.ops.material.update_f3d_nodes(overrideContext)
         self.materials.append(material)
         self.materialChanged = False
 
@@ -1425,7 +1476,7 @@ class F3DContext:
             elif command.name == "gsSPDisplayList" or command.name[:10] == "gsSPBranch":
                 newDLName = self.processDLName(command.params[0])
                 if newDLName is not None:
-                    newDLCommands = parseDLData(dlData, newDLName)
+                    newDLCommands = parseDLData(dlData, newDLName, self)
                     # Use -1 index so that it will be incremented to 0 at end of loop
                     parsedCommands = F3DParsedCommands(newDLName, newDLCommands, -1)
                     if command.name == "gsSPDisplayList":
@@ -1634,18 +1685,55 @@ class F3DContext:
     def processDLName(self, name):
         return name
 
+    def getMergedVertices(self, removeDoubles):
+        """
+        Returns (vertex positions, vertex index of each f3d vertex).
+        When removeDoubles is set, f3d vertices at the same position are merged, unless they are in different limbs.
+        """
+        if not removeDoubles:
+            return [f3dVert[0] for f3dVert in self.verts], list(range(len(self.verts)))
+
+        limbNames = [None] * len(self.verts)
+        for groupName, indices in self.limbGroups.items():
+            for index in indices:
+                limbNames[index] = groupName
+
+        positions = []
+        vertIndices = []
+        mergedIndices = {}  # (position, limb name) : vertex index
+        for f3dVert, limbName in zip(self.verts, limbNames):
+            key = (tuple(f3dVert[0]), limbName)
+            vertIndex = mergedIndices.get(key)
+            if vertIndex is None:
+                vertIndex = len(positions)
+                mergedIndices[key] = vertIndex
+                positions.append(f3dVert[0])
+            vertIndices.append(vertIndex)
+        return positions, vertIndices
+
     def createMesh(self, obj, removeDoubles, importNormals):
         mesh = obj.data
         if len(self.verts) % 3 != 0:
             print(len(self.verts))
             raise PluginError("Number of verts in mesh not divisible by 3, currently " + str(len(self.verts)))
 
-        triangleCount = int(len(self.verts) / 3)
-        verts = [f3dVert[0] for f3dVert in self.verts]
-        faces = [[3 * i + j for j in range(3)] for i in range(triangleCount)]
-        print("Vertices: " + str(len(self.verts)) + ", Triangles: " + str(triangleCount))
+        self.mergeMaterials()
+
+        positions, vertIndices = self.getMergedVertices(removeDoubles)
+        # Merged vertices can collapse triangles, which remove doubles would also delete.
+        triangles = [
+            i
+            for i in range(len(self.verts) // 3)
+            if vertIndices[3 * i] != vertIndices[3 * i + 1]
+            and vertIndices[3 * i] != vertIndices[3 * i + 2]
+            and vertIndices[3 * i + 1] != vertIndices[3 * i + 2]
+        ]
+        # Index in self.verts of each loop
+        loopVerts = [3 * i + j for i in triangles for j in range(3)]
+        faces = [vertIndices[3 * i : 3 * i + 3] for i in triangles]
+        print("Vertices: " + str(len(positions)) + ", Triangles: " + str(len(triangles)))
 
-        mesh.from_pydata(vertices=verts, edges=[], faces=faces)
+        mesh.from_pydata(vertices=positions, edges=[], faces=faces)
         uv_layer = mesh.uv_layers.new().data
         # if self.materialContext.f3d_mat.rdp_settings.g_lighting:
         color_layer = mesh.vertex_colors.new(name="Col").data
@@ -1654,23 +1742,22 @@ class F3DContext:
 
         if importNormals:
             mesh.use_auto_smooth = True
-            mesh.normals_split_custom_set([f3dVert[3] for f3dVert in self.verts])
+            mesh.normals_split_custom_set([self.verts[i][3] for i in loopVerts])
 
         for groupName, indices in self.limbGroups.items():
             group = obj.vertex_groups.new(name=self.limbToBoneName[groupName])
-            group.add(indices, 1, "REPLACE")
+            group.add(sorted({vertIndices[i] for i in indices}), 1, "REPLACE")
 
-        for i in range(len(mesh.polygons)):
-            mesh.polygons[i].material_index = self.triMatIndices[i]
-
-        for i in range(len(mesh.loops)):
-            # This should be okay, since we aren't trying to optimize vertices
-            # There will be one loop for every vertex
-            uv_layer[i].uv = self.verts[i][1]
+        mesh.polygons.foreach_set("material_index", [self.triMatIndices[i] for i in triangles])
+        if not importNormals:
+            mesh.polygons.foreach_set("use_smooth", [True] * len(triangles))
 
-            # if self.materialContext.f3d_mat.rdp_settings.g_lighting:
-            color_layer[i].color = self.verts[i][2]
-            alpha_layer[i].color = [self.verts[i][2][3]] * 3 + [1]
+        # Each loop keeps the uv and colors of its own f3d vertex, even if vertices were merged.
+        uv_layer.foreach_set("uv", [value for i in loopVerts for value in self.verts[i][1]])
+        # if self.materialContext.f3d_mat.rdp_settings.g_lighting:
+        color_layer.foreach_set("color", [value for i in loopVerts for value in self.verts[i][2]])
+        alpha_layer.foreach_set("color", [value for i in loopVerts for value in (self.verts[i][2][3],) * 3 + (1,)])
+        mesh.update()
 
         if bpy.context.mode != "OBJECT":
             bpy.ops.object.mode_set(mode="OBJECT")
@@ -1680,13 +1767,6 @@ class F3DContext:
 
         for material in self.materials:
             obj.data.materials.append(material)
-        if not importNormals:
-            bpy.ops.object.shade_smooth()
-        if removeDoubles:
-            bpy.ops.object.mode_set(mode="EDIT")
-            bpy.ops.mesh.select_all(action="SELECT")
-            bpy.ops.mesh.remove_doubles()
-            bpy.ops.object.mode_set(mode="OBJECT")
 
         bpy.data.materials.remove(self.materialContext)
 
@@ -1721,12 +1801,43 @@ def parseF3D(dlData, dlName, obj, transformMatrix, limbName, boneName, drawLayer
     # vertexGroup = getOrMakeVertexGroup(obj, boneName)
     # groupIndex = vertexGroup.index
 
-    dlCommands = parseDLData(dlData, dlName)
+    dlCommands = parseDLData(dlData, dlName, f3dContext)
     f3dContext.processCommands(dlData, dlName, dlCommands)
 
 
-def parseDLData(dlData, dlName):
-    matchResult = re.search("Gfx\s*" + re.escape(dlName) + "\s*\[\s*\w*\s*\]\s*=\s*\{([^\}]*)\}", dlData)
+class CSymbolIndex:
+    """
+    Index of the C variable definitions in import data, built in one pass.
+    Symbols are looked up by name instead of searching the whole data for each reference.
+    """
+
+    definitionPattern = re.compile(r"\b([A-Za-z0-9\_]+)\s+([A-Za-z\_][A-Za-z0-9\_]*)\s*(?:\[[^\]\[=;{}]*\])?\s*=")
+
+    def __init__(self, data):
+        self.data = data
+        self.definitions = {}  # c name : list of (c type, start index of definition)
+        for match in CSymbolIndex.definitionPattern.finditer(data):
+            self.definitions.setdefault(match.group(2), []).append((match.group(1), match.start()))
+        self.parsed = {}  # (c type, c name) : parsed data
+
+    def match(self, name, pattern, flags=0):
+        """
+        Matches a pattern starting at the type of each definition of name, and returns the first match or None.
+        """
+        compiledPattern = re.compile(pattern, flags)
+        for cType, start in self.definitions.get(name, []):
+            matchResult = compiledPattern.match(self.data, start)
+            if matchResult is not None:
+                return matchResult
+        return None
+
+
+def parseDLData(dlData, dlName, f3dContext):
+    symbolIndex = f3dContext.getSymbolIndex(dlData)
+    if ("Gfx", dlName) in symbolIndex.parsed:
+        return symbolIndex.parsed[("Gfx", dlName)]
+
+    matchResult = symbolIndex.match(dlName, "Gfx\s*" + re.escape(dlName) + "\s*\[\s*\w*\s*\]\s*=\s*\{([^\}]*)\}")
     if matchResult is None:
         raise PluginError("Cannot find display list named " + dlName)
 
@@ -1737,6 +1848,7 @@ def parseDLData(dlData, dlName):
     # 	re.findall('(gs[A-Za-z0-9\_]*)\(((?>[^()]|(?R))*)\)', dlCommandData, re.DOTALL)]
 
     dlCommands = parseMacroList(dlCommandData)
+    symbolIndex.parsed[("Gfx", dlName)] = dlCommands
     return dlCommands
 
 
@@ -1758,8 +1870,8 @@ def parseVertexData(dlData, vertexDataName, f3dContext):
     if vertexDataName in f3dContext.vertexData:
         return f3dContext.vertexData[vertexDataName]
 
-    matchResult = re.search(
-        "Vtx\s*" + re.escape(vertexDataName) + "\s*\[\s*[0-9x]*\s*\]\s*=\s*\{([^;]*);", dlData, re.DOTALL
+    matchResult = f3dContext.getSymbolIndex(dlData).match(
+        vertexDataName, "Vtx\s*" + re.escape(vertexDataName) + "\s*\[\s*[0-9x]*\s*\]\s*=\s*\{([^;]*);", re.DOTALL
     )
     if matchResult is None:
         raise PluginError("Cannot find vertex list named " + vertexDataName)
@@ -1795,12 +1907,13 @@ def parseVertexData(dlData, vertexDataName, f3dContext):
 
 
 def parseLightsData(lightsData, lightsName, f3dContext):
-    # if lightsName in f3dContext.lightData:
-    # 	return f3dContext.lightData[lightsName]
+    symbolIndex = f3dContext.getSymbolIndex(lightsData)
+    if ("Lights", lightsName) in symbolIndex.parsed:
+        return symbolIndex.parsed[("Lights", lightsName)]
 
-    matchResult = re.search(
+    matchResult = symbolIndex.match(
+        lightsName,
         "Lights([0-9n])\s*" + re.escape(lightsName) + "\s*=\s*gdSPDefLights[0-9]\s*\(([^\)]*)\)\s*;\s*",
-        lightsData,
         re.DOTALL,
     )
     if matchResult is None:
@@ -1814,10 +1927,9 @@ def parseLightsData(lightsData, lightsName, f3dContext):
     lightCount = matchResult.group(1)
     if lightCount == "n":
         lightCount = "7"
+    symbolIndex.parsed[("Lights", lightsName)] = (int(lightCount), values)
     return int(lightCount), values
 
-    # return f3dContext.lightData[lightsName]
-
 
 def RGBA16toRGBA32(value):
     return [((value >> 11) & 31) / 31, ((value >> 6) & 31) / 31, ((value >> 1) & 31) / 31, value & 1]
@@ -1859,9 +1971,9 @@ class F3DTextureReference:
 
 def parseTextureData(dlData, textureName, f3dContext, imageFormat, imageSize, width, basePath, isLUT, f3d):
 
-    matchResult = re.search(
+    matchResult = f3dContext.getSymbolIndex(dlData).match(
+        textureName,
         "([A-Za-z0-9\_]+)\s*" + re.escape(textureName) + "\s*\[\s*[0-9x]*\s*\]\s*=\s*\{([^\}]*)\s\}\s*;\s*",
-        dlData,
         re.DOTALL,
     )
     if matchResult is None:
@@ -1967,58 +2079,53 @@ def parseTextureData(dlData, textureName, f3dContext, imageFormat, imageSize, wi
     return image, loadedFromImageFile
 
 
-def parseMacroList(data):
-    end = 0
-    start = 0
-    isCommand = True
-    commands = []
-    parenthesesCount = 0
+# Parentheses and commas are the only characters that change the state of the macro scanner
+macroTokenPattern = re.compile(r"[(),]")
+
 
+def iterMacroList(data):
+    """
+    Yields a ParsedMacro for each macro in data, ex. the contents of a static display list.
+    Parentheses in macro arguments can be nested.
+    """
+    start = 0
     command = None
-    params = None
-    while end < len(data) - 1:
-        end += 1
-        if data[end] == "(":
+    parenthesesCount = 0
+    for match in macroTokenPattern.finditer(data):
+        token = match.group()
+        if token == "(":
             parenthesesCount += 1
-        elif data[end] == ")":
+            if parenthesesCount == 1:
+                command = data[start : match.start()].strip().lstrip(",").strip()
+                start = match.end()
+        elif token == ")" and parenthesesCount > 0:
             parenthesesCount -= 1
+            if parenthesesCount == 0:
+                yield ParsedMacro(command, parseMacroArgs(data[start : match.start()]))
+                start = match.end()
 
-        if isCommand and parenthesesCount > 0:
-            command = data[start:end].strip()
-            if command[0] == ",":
-                command = command[1:].strip()
-            isCommand = False
-            start = end + 1
-
-        elif not isCommand and parenthesesCount == 0:
-            params = parseMacroArgs(data[start:end])
-            commands.append(ParsedMacro(command, params))
-            isCommand = True
-            start = end + 1
 
-    return commands
+def parseMacroList(data):
+    return list(iterMacroList(data))
 
 
 def parseMacroArgs(data):
-    end = 0
-    start = 0
     params = []
+    start = 0
     parenthesesCount = 0
-
-    while end < len(data) - 1:
-        end += 1
-        if data[end] == "(":
+    for match in macroTokenPattern.finditer(data):
+        token = match.group()
+        if token == "(":
             parenthesesCount += 1
-        elif data[end] == ")":
+        elif token == ")":
             parenthesesCount -= 1
+        elif parenthesesCount == 0:
+            params.append("".join(data[start : match.start()].split()))
+            start = match.end()
 
-        if (data[end] == "," or end == len(data) - 1) and parenthesesCount == 0:
-            if end == len(data) - 1:
-                end += 1
-            param = "".join(data[start:end].split())
-            params.append(param)
-            start = end + 1
-
+    lastParam = "".join(data[start:].split())
+    if lastParam != "" or len(params) > 0:
+        params.append(lastParam)
     return params
 
 
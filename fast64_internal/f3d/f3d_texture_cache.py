@@ -0,0 +1,161 @@
+import bpy, os, hashlib, struct, tempfile, array
+
+from ..utility import PluginError, raisePluginError
+from ..export_stats import timedExportPhase
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Increment when texture conversion output changes, so that stale entries are never used.
+textureCacheVersion = 1
+textureCacheFolderName = ".fast64_texture_cache"
+textureCacheExtension = ".f64tex"
+
+
+def getTextureCacheDir():
+    # Prefer a folder next to the blend file, so that the cache is shared between exports of the same project.
+    if bpy.data.filepath != "":
+        return os.path.join(os.path.dirname(bpy.data.filepath), textureCacheFolderName)
+    return os.path.join(tempfile.gettempdir(), "fast64_texture_cache")
+
+
+def textureCacheEnabled():
+    return bpy.context.scene.fast64.settings.texture_cache_enabled
+
+
+def getImagePixelBytes(image: bpy.types.Image):
+    if np is not None:
+        pixels = np.empty(len(image.pixels), dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+        return pixels.tobytes()
+    return array.array("f", image.pixels[:]).tobytes()
+
+
+def getTextureCacheKey(image: bpy.types.Image, texFmt, palFmt):
+    keyHash = hashlib.sha1()
+    keyHash.update(
+        f"{textureCacheVersion}:{image.size[0]}x{image.size[1]}x{image.channels}:{texFmt}:{palFmt}".encode("ascii")
+    )
+    keyHash.update(getImagePixelBytes(image))
+    return keyHash.hexdigest()
+
+
+def loadCachedTexture(cacheDir, key):
+    """
+    Returns (palette, data), or None if the texture is not cached.
+    """
+    path = os.path.join(cacheDir, key + textureCacheExtension)
+    try:
+        with open(path, "rb") as cacheFile:
+            cacheData = cacheFile.read()
+        # Update modification time for LRU eviction
+        os.utime(path)
+    except OSError:
+        return None
+
+    try:
+        paletteCount = struct.unpack_from(">i", cacheData, 0)[0]
+        dataStart = 4 + max(paletteCount, 0) * 2
+        palette = list(struct.unpack_from(f">{paletteCount}H", cacheData, 4)) if paletteCount >= 0 else None
+    except (struct.error, ValueError):
+        # Truncated or corrupt entries are removed and treated as a cache miss.
+        print(f"Removing corrupt texture cache entry {path}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    return palette, bytearray(cacheData[dataStart:])
+
+
+def saveCachedTexture(cacheDir, key, palette, data, maxSize):
+    path = os.path.join(cacheDir, key + textureCacheExtension)
+    paletteCount = len(palette) if palette is not None else -1
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        # Write to a temporary file first, so that an interrupted export never leaves a partial entry.
+        tempPath = path + ".tmp"
+        with open(tempPath, "wb") as cacheFile:
+            cacheFile.write(struct.pack(">i", paletteCount))
+            if palette is not None:
+                cacheFile.write(struct.pack(f">{paletteCount}H", *palette))
+            cacheFile.write(data)
+        os.replace(tempPath, path)
+        evictTextureCache(cacheDir, maxSize)
+    except OSError as e:
+        print(f"Could not write texture cache entry {path}: {e}")
+
+
+def getTextureCacheEntries(cacheDir):
+    if not os.path.isdir(cacheDir):
+        return []
+    entries = []
+    for entry in os.scandir(cacheDir):
+        if entry.is_file() and entry.name.endswith(textureCacheExtension):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+
+def evictTextureCache(cacheDir, maxSize):
+    """
+    Removes least recently used entries until the cache is at most maxSize bytes.
+    """
+    entries = sorted(getTextureCacheEntries(cacheDir))
+    totalSize = sum(size for mtime, size, path in entries)
+    for mtime, size, path in entries:
+        if totalSize <= maxSize:
+            break
+        os.remove(path)
+        totalSize -= size
+
+
+def clearTextureCache(cacheDir):
+    entries = getTextureCacheEntries(cacheDir)
+    for mtime, size, path in entries:
+        os.remove(path)
+    return len(entries)
+
+
+@timedExportPhase("Texture Conversion")
+def convertWithCache(image: bpy.types.Image, texFmt, palFmt, convert):
+    """
+    convert is a function returning (palette, data), where palette is None for non CI textures.
+    If texture caching is enabled, the result is looked up by image contents and format before converting.
+    """
+    if not textureCacheEnabled():
+        return convert()
+
+    settings = bpy.context.scene.fast64.settings
+    cacheDir = getTextureCacheDir()
+    key = getTextureCacheKey(image, texFmt, palFmt)
+    cached = loadCachedTexture(cacheDir, key)
+    if cached is not None:
+        return cached
+
+    palette, data = convert()
+    saveCachedTexture(cacheDir, key, palette, data, settings.texture_cache_size * 1024 * 1024)
+    return palette, data
+
+
+class F3D_ClearTextureCache(bpy.types.Operator):
+    bl_idname = "object.f3d_clear_texture_cache"
+    bl_label = "Clear Texture Cache"
+    bl_description = "Removes all converted textures stored in the texture cache"
+    bl_options = {"REGISTER"}
+
+    def execute(self, context):
+        try:
+            cacheDir = getTextureCacheDir()
+            try:
+                count = clearTextureCache(cacheDir)
+            except OSError as e:
+                raise PluginError(f"Could not clear texture cache at {cacheDir}: {e}")
+        except Exception as e:
+            raisePluginError(self, e)
+            return {"CANCELLED"}
+
+        self.report({"INFO"}, f"Removed {count} cached textures.")
+        return {"FINISHED"}
@@ -0,0 +1,229 @@
+import bpy
+
+from ..utility import PluginError, RGB_TO_LUM_COEF, colorToLuminance, getRGBA16Tuple, getIA16Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def canUseNumpy(image: bpy.types.Image):
+    # The vectorized path assumes RGBA pixel data.
+    # Other channel counts go through the per pixel path, which matches the original conversion exactly.
+    return np is not None and image.channels == 4
+
+
+def compactNibbleArray(texture, width, height):
+    dataSize = int(width * height / 2)
+
+    nibbleData = [((texture[i * 2] & 0xF) << 4) | (texture[i * 2 + 1] & 0xF) for i in range(dataSize)]
+
+    if (width * height) % 2 == 1:
+        nibbleData.append((texture[-1] & 0xF) << 4)
+
+    return bytearray(nibbleData)
+
+
+def encodeImageData(image: bpy.types.Image, fmt, bitSize):
+    """
+    Converts the pixels of a blender image into N64 texture data of the given format.
+    """
+    if fmt == "G_IM_FMT_YUV":
+        raise PluginError("YUV not yet implemented.")
+    elif fmt == "G_IM_FMT_CI":
+        raise PluginError("CI not yet implemented.")
+    elif (fmt, bitSize) not in imageEncoders:
+        if fmt in {encoderFmt for encoderFmt, encoderSize in imageEncoders}:
+            raise PluginError("Invalid combo: " + fmt + ", " + bitSize)
+        raise PluginError("Invalid image format " + fmt)
+
+    if canUseNumpy(image):
+        data = imageEncoders[(fmt, bitSize)](getPixelArray(image))
+        if bitSize == "G_IM_SIZ_4b":
+            return compactNibbleArrayNumpy(data)
+        return bytearray(data.tobytes())
+    else:
+        data = encodeImageDataPython(image, fmt, bitSize)
+        # We stored 4bit values in byte arrays, now to convert
+        if bitSize == "G_IM_SIZ_4b":
+            return compactNibbleArray(data, image.size[0], image.size[1])
+        return data
+
+
+def encodeCIImageData(image: bpy.types.Image, imageName, palFormat, bitSize):
+    """
+    Returns (palette, data), where palette is a list of 16 bit colors in first use order
+    and data is the packed index data.
+    """
+    if palFormat not in {"G_IM_FMT_RGBA", "G_IM_FMT_IA"}:
+        raise PluginError("Invalid combo: " + palFormat + ", " + bitSize)
+    maxColors = 16 if bitSize == "G_IM_SIZ_4b" else 256
+
+    if canUseNumpy(image):
+        palette, texture = encodeCIImageDataNumpy(image, palFormat)
+        if len(palette) > maxColors:
+            raise PluginError("Texture " + imageName + " has more than " + str(maxColors) + " colors.")
+        if bitSize == "G_IM_SIZ_4b":
+            return palette, compactNibbleArrayNumpy(texture)
+        return palette, bytearray(texture.astype(np.uint8).tobytes())
+    else:
+        palette, texture = encodeCIImageDataPython(image, imageName, palFormat, maxColors)
+        if bitSize == "G_IM_SIZ_4b":
+            return palette, compactNibbleArray(texture, image.size[0], image.size[1])
+        return palette, bytearray(texture)
+
+
+# Per pixel conversion, used when numpy is not available.
+
+
+def encodeImageDataPython(image: bpy.types.Image, fmt, bitSize):
+    width, height = image.size
+    channels = image.channels
+    pixels = image.pixels[:]
+    data = bytearray()
+
+    # N64 is -Y, Blender is +Y
+    for j in reversed(range(height)):
+        for i in range(width):
+            start = (j * width + i) * channels
+            if fmt == "G_IM_FMT_RGBA":
+                if bitSize == "G_IM_SIZ_16b":
+                    data.extend(getRGBA16Tuple(pixels[start : start + 4]).to_bytes(2, "big"))
+                else:
+                    data.extend(int(round(pixels[start + field] * 0xFF)) & 0xFF for field in range(channels))
+            else:
+                intensity = colorToLuminance(pixels[start : start + 3])
+                alpha = pixels[start + 3] if fmt == "G_IM_FMT_IA" else None
+                if fmt == "G_IM_FMT_IA" and bitSize == "G_IM_SIZ_4b":
+                    data.append(((int(round(intensity * 0x7)) & 0x7) << 1) | (1 if alpha > 0.5 else 0))
+                elif fmt == "G_IM_FMT_IA" and bitSize == "G_IM_SIZ_8b":
+                    data.append(((int(round(intensity * 0xF)) & 0xF) << 4) | (int(round(alpha * 0xF)) & 0xF))
+                elif fmt == "G_IM_FMT_IA" and bitSize == "G_IM_SIZ_16b":
+                    data.extend((int(round(intensity * 0xFF)) & 0xFF, int(round(alpha * 0xFF)) & 0xFF))
+                elif bitSize == "G_IM_SIZ_4b":
+                    data.append(int(round(intensity * 0xF)) & 0xF)
+                else:
+                    data.append(int(round(intensity * 0xFF)) & 0xFF)
+    return data
+
+
+def encodeCIImageDataPython(image: bpy.types.Image, imageName, palFormat, maxColors):
+    palette = []
+    texture = []
+    # N64 is -Y, Blender is +Y
+    pixels = image.pixels[:]
+    for j in reversed(range(image.size[1])):
+        for i in range(image.size[0]):
+            color = [1, 1, 1, 1]
+            for field in range(image.channels):
+                color[field] = pixels[(j * image.size[0] + i) * image.channels + field]
+            if palFormat == "G_IM_FMT_RGBA":
+                pixelColor = getRGBA16Tuple(color)
+            else:
+                pixelColor = getIA16Tuple(color)
+
+            if pixelColor not in palette:
+                palette.append(pixelColor)
+                if len(palette) > maxColors:
+                    raise PluginError("Texture " + imageName + " has more than " + str(maxColors) + " colors.")
+            texture.append(palette.index(pixelColor))
+    return palette, texture
+
+
+# Vectorized conversion.
+# Rounding uses np.rint, which rounds half to even like python's round().
+
+
+def getPixelArray(image: bpy.types.Image):
+    """
+    Returns image pixels as a (width * height, 4) float64 array, flipped so that the first row is the top row.
+    """
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    # N64 is -Y, Blender is +Y
+    return pixels.reshape(height, width, 4)[::-1].reshape(-1, 4).astype(np.float64)
+
+
+def luminanceArray(pixels):
+    # Matches colorToLuminance, which uses mathutils' dot product:
+    # float32 products accumulated as a double, starting from the last component.
+    products = pixels[:, :3].astype(np.float32) * np.array(RGB_TO_LUM_COEF, dtype=np.float32)
+    return products[:, 2].astype(np.float64) + products[:, 1] + products[:, 0]
+
+
+def roundToInt(values):
+    return np.rint(values).astype(np.int64)
+
+
+def compactNibbleArrayNumpy(texture):
+    texture = np.asarray(texture, dtype=np.int64) & 0xF
+    if len(texture) % 2 == 1:
+        texture = np.append(texture, 0)
+    return bytearray(((texture[0::2] << 4) | texture[1::2]).astype(np.uint8).tobytes())
+
+
+def encodeRGBA16(pixels):
+    return (
+        ((roundToInt(pixels[:, 0] * 0x1F) & 0x1F) << 11)
+        | ((roundToInt(pixels[:, 1] * 0x1F) & 0x1F) << 6)
+        | ((roundToInt(pixels[:, 2] * 0x1F) & 0x1F) << 1)
+        | (pixels[:, 3] > 0.5)
+    ).astype(">u2")
+
+
+def encodeRGBA32(pixels):
+    return (roundToInt(pixels * 0xFF) & 0xFF).astype(np.uint8)
+
+
+def encodeIA4(pixels):
+    return ((roundToInt(luminanceArray(pixels) * 0x7) & 0x7) << 1) | (pixels[:, 3] > 0.5)
+
+
+def encodeIA8(pixels):
+    intensity = roundToInt(luminanceArray(pixels) * 0xF) & 0xF
+    alpha = roundToInt(pixels[:, 3] * 0xF) & 0xF
+    return ((intensity << 4) | alpha).astype(np.uint8)
+
+
+def encodeIA16(pixels):
+    return np.stack(
+        (roundToInt(luminanceArray(pixels) * 0xFF) & 0xFF, roundToInt(pixels[:, 3] * 0xFF) & 0xFF), axis=1
+    ).astype(np.uint8)
+
+
+def encodeI4(pixels):
+    return roundToInt(luminanceArray(pixels) * 0xF) & 0xF
+
+
+def encodeI8(pixels):
+    return (roundToInt(luminanceArray(pixels) * 0xFF) & 0xFF).astype(np.uint8)
+
+
+imageEncoders = {
+    ("G_IM_FMT_RGBA", "G_IM_SIZ_16b"): encodeRGBA16,
+    ("G_IM_FMT_RGBA", "G_IM_SIZ_32b"): encodeRGBA32,
+    ("G_IM_FMT_IA", "G_IM_SIZ_4b"): encodeIA4,
+    ("G_IM_FMT_IA", "G_IM_SIZ_8b"): encodeIA8,
+    ("G_IM_FMT_IA", "G_IM_SIZ_16b"): encodeIA16,
+    ("G_IM_FMT_I", "G_IM_SIZ_4b"): encodeI4,
+    ("G_IM_FMT_I", "G_IM_SIZ_8b"): encodeI8,
+}
+
+
+def encodeCIImageDataNumpy(image: bpy.types.Image, palFormat):
+    pixels = getPixelArray(image)
+    if palFormat == "G_IM_FMT_RGBA":
+        colors = encodeRGBA16(pixels).astype(np.int64)
+    else:
+        # Matches getIA16Tuple, where alpha is truncated rather than rounded.
+        colors = (roundToInt(luminanceArray(pixels) * 0xFF) << 8) | np.trunc(pixels[:, 3] * 0xFF).astype(np.int64)
+
+    uniqueColors, firstIndices, inverse = np.unique(colors, return_index=True, return_inverse=True)
+    # Palette entries are ordered by first use, like the per pixel conversion.
+    order = np.argsort(firstIndices, kind="stable")
+    paletteIndices = np.empty(len(order), dtype=np.int64)
+    paletteIndices[order] = np.arange(len(order))
+
+    return [int(color) for color in uniqueColors[order]], paletteIndices[inverse.reshape(-1)]
@@ -0,0 +1,100 @@
+# This module has no bpy or addon imports, so it can be used without Blender.
+
+
+def packTriangles(triangleVerts, vertLoadSize):
+    """
+    triangleVerts is a flat sequence of vertex ids, three per triangle, in draw order.
+    Splits triangles into vertex loads of at most vertLoadSize vertices, the same way TriangleConverter does.
+    Returns a list of (vertex ids to load, flat triangle buffer indices).
+    """
+    loads = []
+    vertBuffer = []
+    bufferIndices = {}  # vertex id : first index in vertBuffer
+    triangles = []
+
+    for i in range(0, len(triangleVerts), 3):
+        triangle = triangleVerts[i : i + 3]
+        addedVerts = [vert for vert in triangle if vert not in bufferIndices]
+
+        # We care only about load size, since loading is what takes up time.
+        if len(vertBuffer) + len(addedVerts) > vertLoadSize:
+            loads.append((vertBuffer, [bufferIndices[vert] for vert in triangles]))
+            vertBuffer = list(triangle)
+            bufferIndices = {}
+            for index, vert in enumerate(vertBuffer):
+                bufferIndices.setdefault(vert, index)
+            triangles = list(triangle)
+        else:
+            for vert in addedVerts:
+                bufferIndices.setdefault(vert, len(vertBuffer))
+                vertBuffer.append(vert)
+            triangles.extend(triangle)
+
+    if len(triangles) > 0:
+        loads.append((vertBuffer, [bufferIndices[vert] for vert in triangles]))
+    return loads
+
+
+def countVertexLoads(triangleVerts, vertLoadSize):
+    """
+    Returns (number of vertex loads, total vertices loaded) for triangles drawn in the given order.
+    """
+    loads = packTriangles(triangleVerts, vertLoadSize)
+    return len(loads), sum(len(vertIds) for vertIds, triangleIndices in loads)
+
+
+def reorderTriangles(triangleVerts, vertLoadSize):
+    """
+    triangleVerts is a flat sequence of vertex ids, three per triangle.
+    Returns triangle indices in an order that reduces the number of vertex loads.
+    Greedily draws the triangle that adds the fewest vertices to the current load.
+    When no remaining triangle fits, a new load is started from the earliest remaining triangle,
+    so the locality of the original order is kept.
+    """
+    triangles = [tuple(triangleVerts[i : i + 3]) for i in range(0, len(triangleVerts), 3)]
+    vertTriangles = {}  # vertex id : indices of remaining triangles using it
+    for triIndex, triangle in enumerate(triangles):
+        for vert in set(triangle):
+            vertTriangles.setdefault(vert, []).append(triIndex)
+
+    drawn = [False] * len(triangles)
+    order = []
+    nextSeed = 0
+    vertBuffer = set()
+    bufferSize = 0
+
+    while len(order) < len(triangles):
+        bestTriangle = None
+        bestScore = None
+        for vert in vertBuffer:
+            for triIndex in vertTriangles[vert]:
+                triangle = triangles[triIndex]
+                addedVerts = [v for v in triangle if v not in vertBuffer]
+                if bufferSize + len(addedVerts) > vertLoadSize:
+                    continue
+                # Prefer triangles that add fewer vertices, then ones using vertices with few remaining triangles,
+                # since those vertices are the ones that would otherwise need to be loaded again.
+                score = (len(addedVerts), sum(len(vertTriangles[v]) for v in triangle), triIndex)
+                if bestScore is None or score < bestScore:
+                    bestTriangle = triIndex
+                    bestScore = score
+
+        if bestTriangle is None:
+            while drawn[nextSeed]:
+                nextSeed += 1
+            bestTriangle = nextSeed
+            if bufferSize + 3 > vertLoadSize:
+                # Matches packTriangles, where a new load holds all three vertices of its first triangle.
+                vertBuffer = set()
+                bufferSize = 0
+
+        bufferSize += len([v for v in triangles[bestTriangle] if v not in vertBuffer])
+
+        triangle = triangles[bestTriangle]
+        drawn[bestTriangle] = True
+        order.append(bestTriangle)
+        vertBuffer.update(triangle)
+        for vert in set(triangle):
+            vertTriangles[vert].remove(bestTriangle)
+
+    return order
@@ -1,5 +1,6 @@
 import functools
-import bpy, bmesh, mathutils, os, re, copy, math
+from contextlib import ExitStack
+import bpy, bmesh, mathutils, os, re, copy, math, array
 from math import pi, ceil
 from io import BytesIO
 from bpy.utils import register_class, unregister_class
@@ -8,6 +9,8 @@ from .f3d_enums import *
 from .f3d_constants import *
 from .f3d_material import (
     all_combiner_uses,
+    drawLayerSM64Alpha,
+    get_blend_method,
     getMaterialScrollDimensions,
     getTmemWordUsage,
     getTmemMax,
@@ -17,8 +20,12 @@ from .f3d_material import (
 )
 from .f3d_gbi import *
 from .f3d_gbi import _DPLoadTextureBlock
+from .f3d_texture_encoder import compactNibbleArray, encodeImageData, encodeCIImageData
+from .f3d_texture_cache import convertWithCache, F3D_ClearTextureCache
+from .f3d_triangle_packing import countVertexLoads, reorderTriangles
 
 from ..utility import *
+from ..export_stats import timedExportPhase, recordExportStats
 
 
 def getColorLayer(mesh: bpy.types.Mesh, layer="Col"):
@@ -73,8 +80,94 @@ class MeshInfo:
         self.texDimensions = {}  # texture dimensions for each material
 
         self.vertexGroupInfo = None
+        self.skinnedVertexGroups = None  # bone vertex group index of each vertex, for SM64 skinned meshes
+        self.snapshot = None  # MeshSnapshot of the mesh attributes
 
 
+class MeshSnapshot:
+    """
+    Mesh attributes read in bulk with foreach_get, so that per loop conversion does not go through RNA.
+    Values are the same float32 values that per element access returns.
+    """
+
+    def __init__(self, mesh: bpy.types.Mesh, uv_data: bpy.types.bpy_prop_collection):
+        self.positions = readMeshArray(mesh.vertices, "co", 3, "f")
+        self.loopVertexIndices = readMeshArray(mesh.loops, "vertex_index", 1, "i")
+        self.normals = readMeshArray(mesh.loops, "normal", 3, "f")
+        self.uvs = readMeshArray(uv_data, "uv", 2, "f")
+
+        colorLayer = getColorLayer(mesh, layer="Col")
+        alphaLayer = getColorLayer(mesh, layer="Alpha")
+        self.colors = readMeshArray(colorLayer, "color", 4, "f") if colorLayer is not None else None
+        self.alphas = readMeshArray(alphaLayer, "color", 4, "f") if alphaLayer is not None else None
+
+        # Frozen vectors are immutable, so they can be shared between loops.
+        self.positionVectors = {}
+        self.gammaCorrectedColors = {}
+
+    def getPosition(self, vertIndex):
+        position = self.positionVectors.get(vertIndex)
+        if position is None:
+            position = mathutils.Vector(self.positions[vertIndex * 3 : vertIndex * 3 + 3]).freeze()
+            self.positionVectors[vertIndex] = position
+        return position
+
+    def getUV(self, loopIndex):
+        # N64 is -Y, Blender is +Y
+        uv = [field if not math.isnan(field) else 0 for field in self.uvs[loopIndex * 2 : loopIndex * 2 + 2]]
+        return mathutils.Vector((uv[0], 1 - uv[1])).freeze()
+
+    def getColor(self, colors, loopIndex):
+        color = tuple(colors[loopIndex * 4 : loopIndex * 4 + 3])
+        if not is3_2_or_above():
+            return color
+        # Apparently already gamma corrected to linear
+        correctedColor = self.gammaCorrectedColors.get(color)
+        if correctedColor is None:
+            correctedColor = gammaCorrect(color)
+            self.gammaCorrectedColors[color] = correctedColor
+        return correctedColor
+
+    def getAlpha(self, loopIndex):
+        if self.alphas is None:
+            return 1
+        return colorToLuminance(self.getColor(self.alphas, loopIndex)[0:3])
+
+    def getColorOrNormal(self, loopIndex, exportVertexColors):
+        if exportVertexColors:
+            # Matches getLoopColor
+            normalizedRGB = self.getColor(self.colors, loopIndex) if self.colors is not None else [1, 1, 1]
+            return (normalizedRGB[0], normalizedRGB[1], normalizedRGB[2], self.getAlpha(loopIndex))
+        else:
+            # Matches get8bitRoundedNormal
+            normal = self.normals[loopIndex * 3 : loopIndex * 3 + 3]
+            return mathutils.Vector(
+                (
+                    int(normal[0] * 128) / 128,
+                    int(normal[1] * 128) / 128,
+                    int(normal[2] * 128) / 128,
+                    self.getAlpha(loopIndex),
+                )
+            ).freeze()
+
+    def getF3DVert(self, loopIndex, exportVertexColors):
+        """
+        Same result as getF3DVert, for a loop of the snapshot mesh.
+        """
+        return (
+            self.getPosition(self.loopVertexIndices[loopIndex]),
+            self.getUV(loopIndex),
+            self.getColorOrNormal(loopIndex, exportVertexColors),
+        )
+
+
+def readMeshArray(collection, attr, size, typecode):
+    values = array.array(typecode, [0]) * (len(collection) * size)
+    collection.foreach_get(attr, values)
+    return values.tolist()
+
+
+@timedExportPhase("Mesh Info")
 def getInfoDict(obj):
     fixLargeUVs(obj)
     obj.data.calc_loop_triangles()
@@ -101,11 +194,16 @@ def getInfoDict(obj):
                 uv_data = uv_layer.data
         if uv_data is None:
             raise PluginError("Object '" + obj.name + "' does not have a UV layer named 'UVMap.'")
+    snapshot = MeshSnapshot(mesh, uv_data)
+    infoDict.snapshot = snapshot
+    exportVertexColorsDict = {}  # material index : export vertex colors
     for face in mesh.loop_triangles:
         validNeighborDict[face] = []
-        material = obj.material_slots[face.material_index].material
-        if material is None:
-            raise PluginError("There are some faces on your mesh that are assigned to an empty material slot.")
+        if face.material_index not in exportVertexColorsDict:
+            material = obj.material_slots[face.material_index].material
+            if material is None:
+                raise PluginError("There are some faces on your mesh that are assigned to an empty material slot.")
+            exportVertexColorsDict[face.material_index] = isLightingDisabled(material)
         for vertIndex in face.vertices:
             if vertIndex not in vertDict:
                 vertDict[vertIndex] = []
@@ -117,11 +215,9 @@ def getInfoDict(obj):
             if face not in edgeDict[edgeKey]:
                 edgeDict[edgeKey].append(face)
 
+        exportVertexColors = exportVertexColorsDict[face.material_index]
         for loopIndex in face.loops:
-            convertInfo = LoopConvertInfo(
-                uv_data, obj, isLightingDisabled(obj.material_slots[face.material_index].material)
-            )
-            f3dVertDict[loopIndex] = getF3DVert(mesh.loops[loopIndex], face, convertInfo, mesh)
+            f3dVertDict[loopIndex] = snapshot.getF3DVert(loopIndex, exportVertexColors)
     for face in mesh.loop_triangles:
         for edgeKey in face.edge_keys:
             for otherFace in edgeDict[edgeKey]:
@@ -438,6 +534,188 @@ def saveMeshWithLargeTexturesByFaces(
     return currentGroupIndex
 
 
+def getStaticModelDrawLayer(fModel, obj, material, drawLayerField):
+    """
+    Returns (draw layer, draw layer name for the mesh) of a material in a static model.
+    """
+    if drawLayerField is not None and material.mat_ver > 3:
+        drawLayer = getattr(material.f3d_mat.draw_layer, drawLayerField)
+        return drawLayer, drawLayer
+    else:
+        return fModel.getDrawLayerV3(obj), None
+
+
+def isOpaqueMaterial(material, drawLayer):
+    """
+    Returns whether a material is drawn without blending, so its draw order does not matter.
+    drawLayer is the SM64 or OOT draw layer it is exported on, or None when the model has no draw layers,
+    in which case the render mode of the material decides.
+    """
+    if drawLayer is None:
+        return get_blend_method(material) != "BLEND"
+    if str(drawLayer) in drawLayerSM64Alpha:
+        return drawLayerSM64Alpha[str(drawLayer)] != "BLEND"
+    return drawLayer == "Opaque"
+
+
+def getLoadedTexelBits(siz):
+    # Load blocks of 4 and 8 bit textures are done as 16 bit texels
+    if siz.endswith("_LOAD_BLOCK"):
+        return 32 if siz == "G_IM_SIZ_32b_LOAD_BLOCK" else 16
+    return bitSizeDict.get(siz, 16)
+
+
+def getTextureLoadBytes(gfxList):
+    """
+    Returns an estimate of the texture and palette bytes loaded into TMEM by a display list, not including called lists.
+    """
+    loadedBytes = 0
+    siz = "G_IM_SIZ_16b"
+    for command in gfxList.commands:
+        if isinstance(command, DPSetTextureImage):
+            siz = command.siz
+        elif isinstance(command, DPLoadBlock):
+            loadedBytes += (command.lrs + 1) * getLoadedTexelBits(siz) // 8
+        elif isinstance(command, DPLoadTile):
+            # Load tile coordinates are 10.2 fixed point
+            width = ((command.lrs - command.uls) >> 2) + 1
+            height = ((command.lrt - command.ult) >> 2) + 1
+            loadedBytes += width * height * getLoadedTexelBits(siz) // 8
+        elif isinstance(command, DPLoadTLUTCmd):
+            loadedBytes += (command.count + 1) * 2
+        elif isinstance(command, DPLoadTLUT):
+            loadedBytes += command.count * 2
+        elif isinstance(command, DPLoadTLUT_pal16):
+            loadedBytes += 16 * 2
+        elif isinstance(command, DPLoadTLUT_pal256):
+            loadedBytes += 256 * 2
+        elif isinstance(command, textureLoadCommands):
+            # Load macros, where tile versions have texel coordinates
+            bits = getLoadedTexelBits(getattr(command, "siz", "G_IM_SIZ_4b"))
+            if hasattr(command, "lrs"):
+                loadedBytes += (command.lrs - command.uls + 1) * (command.lrt - command.ult + 1) * bits // 8
+            else:
+                loadedBytes += command.width * command.height * bits // 8
+    return loadedBytes
+
+
+# Estimated cost of state changes other than texture loads, in texture bytes with a similar cost
+combinerSwitchCost = 32
+renderModeSwitchCost = 32
+
+
+class MaterialDrawState:
+    """
+    State set by a material, used to order the materials of a static model.
+    """
+
+    def __init__(self, materialIndex, fMaterial, translucent):
+        self.materialIndex = materialIndex
+        self.fMaterial = fMaterial
+        self.translucent = translucent
+        self.textureBytes = getTextureLoadBytes(fMaterial.material)
+
+        textures = []
+        self.combiner = None
+        self.renderMode = None
+        for command in fMaterial.material.commands:
+            if isinstance(command, DPSetTextureImage):
+                textures.append(command.image.name)
+            elif isinstance(command, textureLoadCommands):
+                image = getattr(command, "timg", getattr(command, "dram", None))
+                if image is not None:
+                    textures.append(image.name)
+            elif isinstance(command, DPSetCombineMode):
+                self.combiner = command.to_c(True)
+            elif isinstance(command, DPSetRenderMode):
+                self.renderMode = command.to_c(True)
+        self.textures = tuple(textures)
+
+    def getSwitchCost(self, previous):
+        """
+        Returns the estimated cost of drawing with this material after the previous one.
+        """
+        if previous.fMaterial is self.fMaterial:
+            # Consecutive calls to the same material are merged by FMesh.add_material_call
+            return 0
+        cost = 1
+        if previous.textures != self.textures:
+            cost += self.textureBytes
+        if previous.combiner != self.combiner:
+            cost += combinerSwitchCost
+        if previous.renderMode != self.renderMode:
+            cost += renderModeSwitchCost
+        return cost
+
+
+def getMaterialCallTextureBytes(drawStates):
+    """
+    Returns the texture bytes loaded by material calls when drawing materials in the given order.
+    """
+    loadedBytes = 0
+    previous = None
+    for drawState in drawStates:
+        if previous is None or previous.fMaterial is not drawState.fMaterial:
+            loadedBytes += drawState.textureBytes
+        previous = drawState
+    return loadedBytes
+
+
+def orderOpaqueMaterials(drawStates):
+    """
+    Greedily orders materials by picking the one that is cheapest to switch to next, starting from the first one.
+    Ties keep the original order.
+    """
+    remaining = list(drawStates)
+    order = [remaining.pop(0)]
+    while len(remaining) > 0:
+        previous = order[-1]
+        nextIndex = min(range(len(remaining)), key=lambda i: (remaining[i].getSwitchCost(previous), i))
+        order.append(remaining.pop(nextIndex))
+    return order
+
+
+def sortMaterialDrawOrder(fModel, obj, materialIndices, drawLayerField, convertTextureData):
+    """
+    Returns the material indices of a static model, ordered so that materials with the same state are drawn together.
+    Each draw layer is exported to its own mesh, so materials are only reordered within their draw layer.
+    Materials on translucent draw layers keep their position, and only the opaque materials between them are reordered.
+    """
+    drawStatesByLayer = {}  # draw layer : list of MaterialDrawState
+    for materialIndex in materialIndices:
+        material = obj.material_slots[materialIndex].material
+        drawLayer, drawLayerName = getStaticModelDrawLayer(fModel, obj, material, drawLayerField)
+        checkForF3dMaterialInFaces(obj, material)
+        # Materials are cached in the model, so this is only saving them earlier than the draw order would.
+        fMaterial, texDimensions = saveOrGetF3DMaterial(material, fModel, obj, drawLayer, convertTextureData)
+        translucent = material.mat_ver <= 3 or not isOpaqueMaterial(material, drawLayer)
+        drawStatesByLayer.setdefault(drawLayer, []).append(MaterialDrawState(materialIndex, fMaterial, translucent))
+
+    bytesBefore = 0
+    bytesAfter = 0
+    sortedIndices = []
+    for drawLayer, drawStates in drawStatesByLayer.items():
+        sortedStates = []
+        opaqueStates = []
+        for drawState in drawStates:
+            if drawState.translucent:
+                if len(opaqueStates) > 0:
+                    sortedStates.extend(orderOpaqueMaterials(opaqueStates))
+                    opaqueStates = []
+                sortedStates.append(drawState)
+            else:
+                opaqueStates.append(drawState)
+        if len(opaqueStates) > 0:
+            sortedStates.extend(orderOpaqueMaterials(opaqueStates))
+
+        bytesBefore += getMaterialCallTextureBytes(drawStates)
+        bytesAfter += getMaterialCallTextureBytes(sortedStates)
+        sortedIndices.extend(drawState.materialIndex for drawState in sortedStates)
+
+    fModel.materialOrderStats.add(obj.original_name, bytesBefore, bytesAfter)
+    return sortedIndices
+
+
 # Make sure to set original_name before calling this
 # used when duplicating an object
 def saveStaticModel(
@@ -454,16 +732,15 @@ def saveStaticModel(
             facesByMat[face.material_index] = []
         facesByMat[face.material_index].append(face)
 
+    materialIndices = list(facesByMat)
+    if bpy.context.scene.fast64.settings.sort_material_draw_order:
+        materialIndices = sortMaterialDrawOrder(fModel, obj, materialIndices, drawLayerField, convertTextureData)
+
     fMeshes = {}
-    for material_index, faces in facesByMat.items():
+    for material_index in materialIndices:
+        faces = facesByMat[material_index]
         material = obj.material_slots[material_index].material
-
-        if drawLayerField is not None and material.mat_ver > 3:
-            drawLayer = getattr(material.f3d_mat.draw_layer, drawLayerField)
-            drawLayerName = drawLayer
-        else:
-            drawLayer = fModel.getDrawLayerV3(obj)
-            drawLayerName = None
+        drawLayer, drawLayerName = getStaticModelDrawLayer(fModel, obj, material, drawLayerField)
 
         if drawLayer not in fMeshes:
             fMesh = fModel.addMesh(obj.original_name, ownerName, drawLayerName, False, obj)
@@ -567,12 +844,8 @@ def exportF3DCommon(obj, fModel, transformMatrix, includeChildren, name, DLForma
             triConverterInfo, fModel, tempObj, transformMatrix, name, convertTextureData, True, None
         )[drawLayer]
         cleanupCombineObj(tempObj, meshList)
-        obj.select_set(True)
-        bpy.context.view_layer.objects.active = obj
     except Exception as e:
         cleanupCombineObj(tempObj, meshList)
-        obj.select_set(True)
-        bpy.context.view_layer.objects.active = obj
         raise Exception(str(e))
 
     return fMesh
@@ -671,12 +944,12 @@ def getNextNeighborFace(faces, face, lastEdgeKey, visitedFaces, possibleFaces, i
     return nextFaceAndEdge
 
 
-def saveTriangleStrip(triConverter, faces, mesh, terminateDL):
+def getTriangleStripOrder(faces, infoDict):
+    orderedFaces = []
     visitedFaces = []
     unvisitedFaces = copy.copy(faces)
     possibleFaces = []
     lastEdgeKey = None
-    infoDict = triConverter.triConverterInfo.infoDict
     neighborFace = getLowestUnvisitedNeighborCountFace(unvisitedFaces, infoDict)
 
     while len(visitedFaces) < len(faces):
@@ -692,7 +965,7 @@ def saveTriangleStrip(triConverter, faces, mesh, terminateDL):
                 neighborFace = getLowestUnvisitedNeighborCountFace(unvisitedFaces, infoDict)
                 lastEdgeKey = None
 
-        triConverter.addFace(neighborFace)
+        orderedFaces.append(neighborFace)
         if neighborFace in visitedFaces:
             raise PluginError("Repeated face")
         visitedFaces.append(neighborFace)
@@ -706,6 +979,44 @@ def saveTriangleStrip(triConverter, faces, mesh, terminateDL):
             faces, neighborFace, lastEdgeKey, visitedFaces, possibleFaces, infoDict
         )
 
+    return orderedFaces
+
+
+def optimizeVertexLoadOrder(triConverter, faces, vertexLoadStats):
+    """
+    Reorders faces to reduce the number of SPVertex loads, keeping the original order if it is already better.
+    """
+    vertIds = {}  # BufferVertex : id
+    triangleVerts = []
+    for face in faces:
+        for loopIndex in face.loops:
+            bufferVert = triConverter.getBufferVert(face, loopIndex)
+            triangleVerts.append(vertIds.setdefault(bufferVert, len(vertIds)))
+
+    vertLoadSize = triConverter.triConverterInfo.f3d.vert_load_size
+    order = reorderTriangles(triangleVerts, vertLoadSize)
+    reorderedVerts = [vert for triIndex in order for vert in triangleVerts[triIndex * 3 : triIndex * 3 + 3]]
+
+    before = countVertexLoads(triangleVerts, vertLoadSize)
+    after = countVertexLoads(reorderedVerts, vertLoadSize)
+    if after >= before:
+        vertexLoadStats.add(triConverter.triList.name, before, before)
+        return faces
+    vertexLoadStats.add(triConverter.triList.name, before, after)
+    return [faces[triIndex] for triIndex in order]
+
+
+@timedExportPhase("Triangle Conversion")
+def saveTriangleStrip(triConverter, faces, mesh, terminateDL, vertexLoadStats=None):
+    """
+    If vertexLoadStats is provided, faces are reordered to reduce vertex loads and the result is recorded in it.
+    """
+    orderedFaces = getTriangleStripOrder(faces, triConverter.triConverterInfo.infoDict)
+    if vertexLoadStats is not None:
+        orderedFaces = optimizeVertexLoadOrder(triConverter, orderedFaces, vertexLoadStats)
+
+    for face in orderedFaces:
+        triConverter.addFace(face)
     triConverter.finish(terminateDL)
     return triConverter.currentGroupIndex
 
@@ -774,7 +1085,14 @@ def saveMeshByFaces(
         copy.deepcopy(matRegionDict),
     )
 
-    currentGroupIndex = saveTriangleStrip(triConverter, faces, obj.data, True)
+    # Static meshes can have their triangles reordered.
+    # Skinned meshes depend on the matrix state of previous meshes, so they are always converted in order.
+    isStatic = currentGroupIndex is None and existingVertData is None and triConverterInfo.vertexGroupInfo is None
+    vertexLoadStats = None
+    if isStatic and bpy.context.scene.fast64.settings.optimize_vertex_loads:
+        vertexLoadStats = fModel.vertexLoadStats
+
+    currentGroupIndex = saveTriangleStrip(triConverter, faces, obj.data, True, vertexLoadStats)
 
     if fMaterial.revert is not None:
         fMesh.draw.commands.append(SPDisplayList(fMaterial.revert))
@@ -823,13 +1141,20 @@ class BufferVertex:
         self.f3dVert = f3dVert
         self.groupIndex = groupIndex
         self.materialIndex = materialIndex
+        self._key = None
+
+    def getKey(self):
+        # Vertex data may be unfrozen mathutils vectors (ex. after a deepcopy), so compare plain tuples.
+        # mathutils vectors compare with a small tolerance, which would not be consistent with the hash.
+        if self._key is None:
+            self._key = (tuple(tuple(field) for field in self.f3dVert), self.groupIndex, self.materialIndex)
+        return self._key
 
     def __eq__(self, other):
-        return (
-            self.f3dVert == other.f3dVert
-            and self.groupIndex == other.groupIndex
-            and self.materialIndex == other.materialIndex
-        )
+        return self.getKey() == other.getKey()
+
+    def __hash__(self):
+        return hash(self.getKey())
 
 
 class TriangleConverterInfo:
@@ -891,6 +1216,17 @@ class TriangleConverter:
             self.vertBuffer = []
         self.existingVertexMaterialRegions = existingVertexMaterialRegions
         self.bufferStart = len(self.vertBuffer)
+
+        # The existing region never changes, so index it once.
+        # Indices always point to the first occurrence, matching list.index().
+        self.existingVertIndices = {}
+        for i, bufferVert in enumerate(self.vertBuffer):
+            self.existingVertIndices.setdefault(bufferVert, i)
+        self.existingRegionVerts = {}
+        if existingVertexMaterialRegions is not None:
+            for material_index, matRegion in existingVertexMaterialRegions.items():
+                self.existingRegionVerts[material_index] = set(self.vertBuffer[matRegion[0] : matRegion[1]])
+        self.liveVertIndices = {}  # BufferVertex : index, for vertBuffer[bufferStart:]
         self.vertexBufferTriangles = []  # [(index0, index1, index2)]
 
         self.triList = triList
@@ -905,16 +1241,31 @@ class TriangleConverter:
         self.exportVertexColors = exportVertexColors
         self.tex_scale = material.f3d_mat.tex_scale
 
+    def setLiveVerts(self, bufferVerts):
+        self.vertBuffer = self.vertBuffer[: self.bufferStart]
+        self.liveVertIndices = {}
+        self.extendLiveVerts(bufferVerts)
+
+    def extendLiveVerts(self, bufferVerts):
+        for bufferVert in bufferVerts:
+            self.liveVertIndices.setdefault(bufferVert, len(self.vertBuffer))
+            self.vertBuffer.append(bufferVert)
+
+    def bufferIndex(self, bufferVert):
+        index = self.existingVertIndices.get(bufferVert)
+        if index is None:
+            index = self.liveVertIndices[bufferVert]
+        return index
+
     def vertInBuffer(self, bufferVert, material_index):
         if self.existingVertexMaterialRegions is None:
-            return bufferVert in self.vertBuffer
+            return bufferVert in self.existingVertIndices or bufferVert in self.liveVertIndices
         else:
-            if material_index in self.existingVertexMaterialRegions:
-                matRegion = self.existingVertexMaterialRegions[material_index]
-                if bufferVert in self.vertBuffer[matRegion[0] : matRegion[1]]:
+            if material_index in self.existingRegionVerts:
+                if bufferVert in self.existingRegionVerts[material_index]:
                     return True
 
-            return bufferVert in self.vertBuffer[self.bufferStart :]
+            return bufferVert in self.liveVertIndices
 
     def getSortedBuffer(self):
         limbVerts = {}
@@ -933,7 +1284,7 @@ class TriangleConverter:
 
         if self.currentGroupIndex in limbVerts:
             currentLimbVerts = limbVerts[self.currentGroupIndex]
-            self.vertBuffer = self.vertBuffer[: self.bufferStart] + currentLimbVerts
+            self.setLiveVerts(currentLimbVerts)
             self.triList.commands.append(
                 SPVertex(self.vtxList, len(self.vtxList.vertices), len(currentLimbVerts), self.bufferStart)
             )
@@ -958,7 +1309,7 @@ class TriangleConverter:
 
             bufferStart = bufferEnd
         else:
-            self.vertBuffer = self.vertBuffer[: self.bufferStart]
+            self.setLiveVerts([])
 
         # Load other limb verts
         for groupIndex, bufferVerts in limbVerts.items():
@@ -971,7 +1322,7 @@ class TriangleConverter:
                 SPVertex(self.vtxList, len(self.vtxList.vertices), len(bufferVerts), bufferStart)
             )
 
-            self.vertBuffer += bufferVerts
+            self.extendLiveVerts(bufferVerts)
             bufferEnd += len(bufferVerts)
 
             # Save vertices
@@ -994,39 +1345,49 @@ class TriangleConverter:
 
         # Load triangles
         self.triList.commands.extend(
-            createTriangleCommands(self.vertexBufferTriangles, self.vertBuffer, self.triConverterInfo.f3d.F3DEX_GBI)
+            createTriangleCommands(self.vertexBufferTriangles, self.bufferIndex, self.triConverterInfo.f3d.F3DEX_GBI)
         )
 
+    def getBufferVert(self, face, loopIndex):
+        snapshot = self.triConverterInfo.infoDict.snapshot
+        if snapshot is not None:
+            # Faces of one material always use the same conversion settings,
+            # so the vertex computed in getInfoDict can be reused.
+            vertexIndex = snapshot.loopVertexIndices[loopIndex]
+            f3dVert = self.triConverterInfo.infoDict.f3dVert[loopIndex]
+        else:
+            loop = self.triConverterInfo.mesh.loops[loopIndex]
+            vertexIndex = loop.vertex_index
+            f3dVert = getF3DVert(loop, face, self.convertInfo, self.triConverterInfo.mesh)
+        vertexGroup = (
+            self.triConverterInfo.vertexGroupInfo.vertexGroups[vertexIndex]
+            if self.triConverterInfo.vertexGroupInfo is not None
+            else None
+        )
+        return BufferVertex(f3dVert, vertexGroup, face.material_index)
+
     def addFace(self, face):
         triIndices = []
         addedVerts = []  # verts added to existing vertexBuffer
         allVerts = []  # all verts not in 'untouched' buffer region
 
         for loopIndex in face.loops:
-            loop = self.triConverterInfo.mesh.loops[loopIndex]
-            vertexGroup = (
-                self.triConverterInfo.vertexGroupInfo.vertexGroups[loop.vertex_index]
-                if self.triConverterInfo.vertexGroupInfo is not None
-                else None
-            )
-            bufferVert = BufferVertex(
-                getF3DVert(loop, face, self.convertInfo, self.triConverterInfo.mesh), vertexGroup, face.material_index
-            )
+            bufferVert = self.getBufferVert(face, loopIndex)
             triIndices.append(bufferVert)
             if not self.vertInBuffer(bufferVert, face.material_index):
                 addedVerts.append(bufferVert)
 
-            if bufferVert not in self.vertBuffer[: self.bufferStart]:
+            if bufferVert not in self.existingVertIndices:
                 allVerts.append(bufferVert)
 
         # We care only about load size, since loading is what takes up time.
         # Even if vert_buffer is larger, its still another load to fill it.
         if len(self.vertBuffer) + len(addedVerts) > self.triConverterInfo.f3d.vert_load_size:
             self.processGeometry()
-            self.vertBuffer = self.vertBuffer[: self.bufferStart] + allVerts
+            self.setLiveVerts(allVerts)
             self.vertexBufferTriangles = [triIndices]
         else:
-            self.vertBuffer.extend(addedVerts)
+            self.extendLiveVerts(addedVerts)
             self.vertexBufferTriangles.append(triIndices)
 
     def finish(self, terminateDL):
@@ -1258,46 +1619,45 @@ def getLoopColorOrNormal(loop: bpy.types.MeshLoop, face, mesh, obj, exportVertex
         return getLoopNormal(loop, face, mesh, isFlatShaded)
 
 
-def createTriangleCommands(triangles, vertexBuffer, useSP2Triangle):
-    triangles = copy.deepcopy(triangles)
+def createTriangleCommands(triangles, bufferIndex, useSP2Triangle):
+    """
+    bufferIndex maps a BufferVertex to its index in the vertex buffer.
+    """
     commands = []
     if useSP2Triangle:
-        while len(triangles) > 0:
-            if len(triangles) >= 2:
+        for i in range(0, len(triangles), 2):
+            if i + 1 < len(triangles):
                 commands.append(
                     SP2Triangles(
-                        vertexBuffer.index(triangles[0][0]),
-                        vertexBuffer.index(triangles[0][1]),
-                        vertexBuffer.index(triangles[0][2]),
+                        bufferIndex(triangles[i][0]),
+                        bufferIndex(triangles[i][1]),
+                        bufferIndex(triangles[i][2]),
                         0,
-                        vertexBuffer.index(triangles[1][0]),
-                        vertexBuffer.index(triangles[1][1]),
-                        vertexBuffer.index(triangles[1][2]),
+                        bufferIndex(triangles[i + 1][0]),
+                        bufferIndex(triangles[i + 1][1]),
+                        bufferIndex(triangles[i + 1][2]),
                         0,
                     )
                 )
-                triangles = triangles[2:]
             else:
                 commands.append(
                     SP1Triangle(
-                        vertexBuffer.index(triangles[0][0]),
-                        vertexBuffer.index(triangles[0][1]),
-                        vertexBuffer.index(triangles[0][2]),
+                        bufferIndex(triangles[i][0]),
+                        bufferIndex(triangles[i][1]),
+                        bufferIndex(triangles[i][2]),
                         0,
                     )
                 )
-                triangles = []
     else:
-        while len(triangles) > 0:
+        for triangle in triangles:
             commands.append(
                 SP1Triangle(
-                    vertexBuffer.index(triangles[0][0]),
-                    vertexBuffer.index(triangles[0][1]),
-                    vertexBuffer.index(triangles[0][2]),
+                    bufferIndex(triangle[0]),
+                    bufferIndex(triangle[1]),
+                    bufferIndex(triangle[2]),
                     0,
                 )
             )
-            triangles = triangles[1:]
 
     return commands
 
@@ -1341,6 +1701,7 @@ def getTexDimensions(material):
     return texDimensions
 
 
+@timedExportPhase("Material Saving")
 def saveOrGetF3DMaterial(material, fModel, obj, drawLayer, convertTextureData):
     if material.mat_ver > 3:
         f3dMat = material.f3d_mat
@@ -2005,28 +2366,10 @@ def saveOrGetPaletteDefinition(fMaterial, fModelOrTexRect, image, imageName, tex
         return fImage, fPalette
 
     palette = []
-    texture = []
-    maxColors = 16 if bitSize == "G_IM_SIZ_4b" else 256
     if convertTextureData:
-        # N64 is -Y, Blender is +Y
-        pixels = image.pixels[:]
-        for j in reversed(range(image.size[1])):
-            for i in range(image.size[0]):
-                color = [1, 1, 1, 1]
-                for field in range(image.channels):
-                    color[field] = pixels[(j * image.size[0] + i) * image.channels + field]
-                if palFormat == "G_IM_FMT_RGBA":
-                    pixelColor = getRGBA16Tuple(color)
-                elif palFormat == "G_IM_FMT_IA":
-                    pixelColor = getIA16Tuple(color)
-                else:
-                    raise PluginError("Invalid combo: " + palFormat + ", " + bitSize)
-
-                if pixelColor not in palette:
-                    palette.append(pixelColor)
-                    if len(palette) > maxColors:
-                        raise PluginError("Texture " + imageName + " has more than " + str(maxColors) + " colors.")
-                texture.append(palette.index(pixelColor))
+        palette, texture = convertWithCache(
+            image, texFmt, palFmt, lambda: encodeCIImageData(image, imageName, palFormat, bitSize)
+        )
 
     if image.filepath == "":
         name = image.name
@@ -2067,11 +2410,7 @@ def saveOrGetPaletteDefinition(fMaterial, fModelOrTexRect, image, imageName, tex
     if convertTextureData:
         for color in palette:
             fPalette.data.extend(color.to_bytes(2, "big"))
-
-        if bitSize == "G_IM_SIZ_4b":
-            fImage.data = compactNibbleArray(texture, image.size[0], image.size[1])
-        else:
-            fImage.data = bytearray(texture)
+        fImage.data = texture
 
     fModelOrTexRect.addTexture((image, (texFmt, palFmt)), fImage, fMaterial)
     fModelOrTexRect.addTexture((image, (palFmt, "PAL")), fPalette, fMaterial)
@@ -2079,18 +2418,6 @@ def saveOrGetPaletteDefinition(fMaterial, fModelOrTexRect, image, imageName, tex
     return fImage, fPalette  # , paletteImage
 
 
-def compactNibbleArray(texture, width, height):
-    nibbleData = bytearray(0)
-    dataSize = int(width * height / 2)
-
-    nibbleData = [((texture[i * 2] & 0xF) << 4) | (texture[i * 2 + 1] & 0xF) for i in range(dataSize)]
-
-    if (width * height) % 2 == 1:
-        nibbleData.append((texture[-1] & 0xF) << 4)
-
-    return bytearray(nibbleData)
-
-
 def checkDuplicateTextureName(fModelOrTexRect, name):
     names = []
     for info, texture in fModelOrTexRect.textures.items():
@@ -2129,209 +2456,10 @@ def saveOrGetTextureDefinition(fMaterial, fModel, image: bpy.types.Image, imageN
         fImage.isLargeTexture = True
 
     if convertTextureData:
-        pixels = image.pixels[:]
         print(f"Converting texture data for {filename}")
-        if fmt == "G_IM_FMT_RGBA":
-            if bitSize == "G_IM_SIZ_16b":
-                # fImage.data = bytearray([byteVal for doubleByte in [
-                # 	(((int(image.pixels[(j * image.size[0] + i) * image.channels + 0] * 0x1F) & 0x1F) << 11) | \
-                # 	((int(image.pixels[(j * image.size[0] + i) * image.channels + 1] * 0x1F) & 0x1F) << 6) | \
-                # 	((int(image.pixels[(j * image.size[0] + i) * image.channels + 2] * 0x1F) & 0x1F) << 1) | \
-                # 	(1 if image.pixels[(j * image.size[0] + i) * image.channels + 3] > 0.5 else 0)
-                # 	).to_bytes(2, 'big')
-                # 	for j in reversed(range(image.size[1])) for i in range(image.size[0])] for byteVal in doubleByte])
-
-                fImage.data = bytearray(
-                    [
-                        byteVal
-                        for doubleByte in [
-                            (
-                                (
-                                    (
-                                        (int(round(pixels[(j * image.size[0] + i) * image.channels + 0] * 0x1F)) & 0x1F)
-                                        << 3
-                                    )
-                                    | (
-                                        (int(round(pixels[(j * image.size[0] + i) * image.channels + 1] * 0x1F)) & 0x1F)
-                                        >> 2
-                                    )
-                                ),
-                                (
-                                    (
-                                        (int(round(pixels[(j * image.size[0] + i) * image.channels + 1] * 0x1F)) & 0x03)
-                                        << 6
-                                    )
-                                    | (
-                                        (int(round(pixels[(j * image.size[0] + i) * image.channels + 2] * 0x1F)) & 0x1F)
-                                        << 1
-                                    )
-                                    | (1 if pixels[(j * image.size[0] + i) * image.channels + 3] > 0.5 else 0)
-                                ),
-                            )
-                            for j in reversed(range(image.size[1]))
-                            for i in range(image.size[0])
-                        ]
-                        for byteVal in doubleByte
-                    ]
-                )
-            elif bitSize == "G_IM_SIZ_32b":
-                fImage.data = bytearray(
-                    [
-                        int(round(pixels[(j * image.size[0] + i) * image.channels + field] * 0xFF)) & 0xFF
-                        for j in reversed(range(image.size[1]))
-                        for i in range(image.size[0])
-                        for field in range(image.channels)
-                    ]
-                )
-            else:
-                raise PluginError("Invalid combo: " + fmt + ", " + bitSize)
-
-        elif fmt == "G_IM_FMT_YUV":
-            raise PluginError("YUV not yet implemented.")
-            if bitSize == "G_IM_SIZ_16b":
-                pass
-            else:
-                raise PluginError("Invalid combo: " + fmt + ", " + bitSize)
-
-        elif fmt == "G_IM_FMT_CI":
-            raise PluginError("CI not yet implemented.")
-
-        elif fmt == "G_IM_FMT_IA":
-            if bitSize == "G_IM_SIZ_4b":
-                fImage.data = bytearray(
-                    [
-                        (
-                            (
-                                int(
-                                    round(
-                                        colorToLuminance(
-                                            pixels[
-                                                (j * image.size[0] + i)
-                                                * image.channels : (j * image.size[0] + i)
-                                                * image.channels
-                                                + 3
-                                            ]
-                                        )
-                                        * 0x7
-                                    )
-                                )
-                                & 0x7
-                            )
-                            << 1
-                        )
-                        | (1 if pixels[(j * image.size[0] + i) * image.channels + 3] > 0.5 else 0)
-                        for j in reversed(range(image.size[1]))
-                        for i in range(image.size[0])
-                    ]
-                )
-            elif bitSize == "G_IM_SIZ_8b":
-                fImage.data = bytearray(
-                    [
-                        (
-                            (
-                                int(
-                                    round(
-                                        colorToLuminance(
-                                            pixels[
-                                                (j * image.size[0] + i)
-                                                * image.channels : (j * image.size[0] + i)
-                                                * image.channels
-                                                + 3
-                                            ]
-                                        )
-                                        * 0xF
-                                    )
-                                )
-                                & 0xF
-                            )
-                            << 4
-                        )
-                        | (int(round(pixels[(j * image.size[0] + i) * image.channels + 3] * 0xF)) & 0xF)
-                        for j in reversed(range(image.size[1]))
-                        for i in range(image.size[0])
-                    ]
-                )
-            elif bitSize == "G_IM_SIZ_16b":
-                fImage.data = bytearray(
-                    [
-                        byteVal
-                        for doubleByte in [
-                            (
-                                int(
-                                    round(
-                                        colorToLuminance(
-                                            pixels[
-                                                (j * image.size[0] + i)
-                                                * image.channels : (j * image.size[0] + i)
-                                                * image.channels
-                                                + 3
-                                            ]
-                                        )
-                                        * 0xFF
-                                    )
-                                )
-                                & 0xFF,
-                                int(round(pixels[(j * image.size[0] + i) * image.channels + 3] * 0xFF)) & 0xFF,
-                            )
-                            for j in reversed(range(image.size[1]))
-                            for i in range(image.size[0])
-                        ]
-                        for byteVal in doubleByte
-                    ]
-                )
-            else:
-                raise PluginError("Invalid combo: " + fmt + ", " + bitSize)
-        elif fmt == "G_IM_FMT_I":
-            if bitSize == "G_IM_SIZ_4b":
-                fImage.data = bytearray(
-                    [
-                        int(
-                            round(
-                                colorToLuminance(
-                                    pixels[
-                                        (j * image.size[0] + i)
-                                        * image.channels : (j * image.size[0] + i)
-                                        * image.channels
-                                        + 3
-                                    ]
-                                )
-                                * 0xF
-                            )
-                        )
-                        & 0xF
-                        for j in reversed(range(image.size[1]))
-                        for i in range(image.size[0])
-                    ]
-                )
-            elif bitSize == "G_IM_SIZ_8b":
-                fImage.data = bytearray(
-                    [
-                        int(
-                            round(
-                                colorToLuminance(
-                                    pixels[
-                                        (j * image.size[0] + i)
-                                        * image.channels : (j * image.size[0] + i)
-                                        * image.channels
-                                        + 3
-                                    ]
-                                )
-                                * 0xFF
-                            )
-                        )
-                        & 0xFF
-                        for j in reversed(range(image.size[1]))
-                        for i in range(image.size[0])
-                    ]
-                )
-            else:
-                raise PluginError("Invalid combo: " + fmt + ", " + bitSize)
-        else:
-            raise PluginError("Invalid image format " + fmt)
-
-        # We stored 4bit values in byte arrays, now to convert
-        if bitSize == "G_IM_SIZ_4b":
-            fImage.data = compactNibbleArray(fImage.data, image.size[0], image.size[1])
+        _, fImage.data = convertWithCache(
+            image, texFormat, "NONE", lambda: (None, encodeImageData(image, fmt, bitSize))
+        )
 
     print("Finished converting.")
     fModel.addTexture((image, (texFormat, "NONE")), fImage, fMaterial)
@@ -2706,31 +2834,38 @@ def exportF3DtoC(
         os.makedirs(modelDirPath)
 
     gfxFormatter = GfxFormatter(ScrollMethod.Vertex, 64)
-    exportData = fModel.to_c(TextureExportSettings(texSeparate, savePNG, texDir, modelDirPath), gfxFormatter)
-    staticData = exportData.staticData
-    dynamicData = exportData.dynamicData
-    texC = exportData.textureData
+    with ExitStack() as openFiles:
+        # Static data and separate texture data are streamed directly to their files.
+        # They only replace the existing files once the export succeeds.
+        sourceFile = openFiles.enter_context(openReplacedFile(os.path.join(modelDirPath, "model.inc.c")))
+        headerFile = openFiles.enter_context(openReplacedFile(os.path.join(modelDirPath, "header.h")))
+        staticData = CDataFileWriter(sourceFile, headerFile)
+        texC = CData()
+        if texSeparate:
+            texC = CDataFileWriter(
+                openFiles.enter_context(openReplacedFile(os.path.join(modelDirPath, "texture.inc.c")))
+            )
 
-    if DLFormat == DLFormat.Static:
-        staticData.append(dynamicData)
-    else:
-        geoString = writeMaterialFiles(
-            dirPath,
-            modelDirPath,
-            '#include "actors/' + toAlnum(name) + '/header.h"',
-            '#include "actors/' + toAlnum(name) + '/material.inc.h"',
-            dynamicData.header,
-            dynamicData.source,
-            "",
-            True,
+        exportData = fModel.to_c(
+            TextureExportSettings(texSeparate, savePNG, texDir, modelDirPath),
+            gfxFormatter,
+            ExportCData(staticData, CData(), texC),
         )
+        dynamicData = exportData.dynamicData
 
-    if texSeparate:
-        texCFile = open(os.path.join(modelDirPath, "texture.inc.c"), "w", newline="\n")
-        texCFile.write(texC.source)
-        texCFile.close()
-
-    writeCData(staticData, os.path.join(modelDirPath, "header.h"), os.path.join(modelDirPath, "model.inc.c"))
+        if DLFormat == DLFormat.Static:
+            staticData.append(dynamicData)
+        else:
+            geoString = writeMaterialFiles(
+                dirPath,
+                modelDirPath,
+                '#include "actors/' + toAlnum(name) + '/header.h"',
+                '#include "actors/' + toAlnum(name) + '/material.inc.h"',
+                dynamicData.header,
+                dynamicData.source,
+                "",
+                True,
+            )
 
 
 def removeDL(sourcePath, headerPath, DLName):
@@ -2765,6 +2900,7 @@ class F3D_ExportDL(bpy.types.Operator):
 
     # Called on demand (i.e. button press, menu item)
     # Can also be called from operator search menu (Spacebar)
+    @recordExportStats
     def execute(self, context):
         if context.mode != "OBJECT":
             bpy.ops.object.mode_set(mode="OBJECT")
@@ -2855,6 +2991,7 @@ class F3D_ExportDLPanel(bpy.types.Panel):
 f3d_writer_classes = (
     F3D_ExportDL,
     F3D_ExportDLPanel,
+    F3D_ClearTextureCache,
 )
 
 
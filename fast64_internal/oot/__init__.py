@@ -28,6 +28,7 @@ class OOT_FileSettingsPanel(OOT_Panel):
         col.scale_y = 1.1  # extra padding, makes it easier to see these main settings
         prop_split(col, context.scene, "ootBlenderScale", "OOT Scene Scale")
         col.prop(context.scene.fast64.oot, "shipOfHarkinianCompatible")
+        col.prop(context.scene.fast64.oot, "optimize_display_lists")
         prop_split(col, context.scene, "ootDecompPath", "Decomp Path")
 
 
@@ -36,6 +37,11 @@ class OOT_Properties(bpy.types.PropertyGroup):
 
     version: bpy.props.IntProperty(name="OOT_Properties Version", default=0)
     shipOfHarkinianCompatible: bpy.props.BoolProperty(name="Ship of Harkinian Compatibility")
+    optimize_display_lists: bpy.props.BoolProperty(
+        name="Optimize Display Lists",
+        description="Remove redundant state changes and pipe syncs from exported display lists",
+        default=False,
+    )
     DLExportSettings: bpy.props.PointerProperty(type=oot_f3d_writer.OOTDLExportSettings)
     DLImportSettings: bpy.props.PointerProperty(type=oot_f3d_writer.OOTDLImportSettings)
     skeletonExportSettings: bpy.props.PointerProperty(type=oot_skeleton.OOTSkeletonExportSettings)
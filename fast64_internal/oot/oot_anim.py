@@ -6,6 +6,7 @@ from .oot_utility import *
 from .oot_skeleton import *
 from ..utility import *
 from ..panels import OOT_Panel
+from ..export_stats import recordExportStats, recordExportMetrics
 
 
 class OOTAnimation:
@@ -68,7 +69,8 @@ class OOTAnimation:
         return data
 
 
-def ootGetAnimBoneRot(bone, poseBone, convertTransformMatrix, isRoot):
+def ootGetAnimBoneRot(bone, poseMatrix, parentPoseMatrix, convertTransformMatrix, isRoot):
+    # poseMatrix and parentPoseMatrix are the sampled poseBone.matrix of the bone and its parent.
     # OoT draws limbs like this:
     # limbMatrix = parentLimbMatrix @ limbFixedTranslationMatrix @ animRotMatrix
     # There is no separate rest position rotation; an animation rotation of 0
@@ -111,8 +113,8 @@ def ootGetAnimBoneRot(bone, poseBone, convertTransformMatrix, isRoot):
     inverseTranslationMatrix = mathutils.Matrix.Translation(origTranslation).inverted()
     animMatrix = (
         inverseTranslationMatrix
-        @ (poseBone.parent.matrix.inverted() if poseBone.parent is not None else mathutils.Matrix.Identity(4))
-        @ poseBone.matrix
+        @ (parentPoseMatrix.inverted() if parentPoseMatrix is not None else mathutils.Matrix.Identity(4))
+        @ poseMatrix
     )
     finalTranslation, finalRotation, finalScale = animMatrix.decompose()
     if isRoot:
@@ -132,7 +134,7 @@ def ootGetAnimBoneRot(bone, poseBone, convertTransformMatrix, isRoot):
     return finalRotation
 
 
-def ootConvertAnimationData(anim, armatureObj, convertTransformMatrix, *, frame_start, frame_count):
+def ootGetAnimBones(armatureObj):
     checkForStartBone(armatureObj)
     bonesToProcess = [getStartBone(armatureObj)]
     currentBone = armatureObj.data.bones[bonesToProcess[0]]
@@ -150,6 +152,17 @@ def ootConvertAnimationData(anim, armatureObj, convertTransformMatrix, *, frame_
         childrenNames = getSortedChildren(armatureObj, currentBone)
         bonesToProcess = childrenNames + bonesToProcess
 
+    return animBones
+
+
+def ootConvertAnimationData(
+    anim, armatureObj, convertTransformMatrix, *, frame_start, frame_count, animBones=None, sampler=None
+):
+    if animBones is None:
+        animBones = ootGetAnimBones(armatureObj)
+    if sampler is None:
+        sampler = ArmaturePoseSampler(armatureObj)
+
     # list of boneFrameData, which is [[x frames], [y frames], [z frames]]
     # boneIndex is index in animBones in ootConvertAnimationData.
     # since we are processing the bones in the same order as ootProcessBone,
@@ -161,30 +174,26 @@ def ootConvertAnimationData(anim, armatureObj, convertTransformMatrix, *, frame_
         [ValueFrameData(i, 0, []), ValueFrameData(i, 1, []), ValueFrameData(i, 2, [])] for i in range(len(animBones))
     ]
 
-    currentFrame = bpy.context.scene.frame_current
-    for frame in range(frame_start, frame_start + frame_count):
-        bpy.context.scene.frame_set(frame)
-        rootBone = armatureObj.data.bones[animBones[0]]
-        rootPoseBone = armatureObj.pose.bones[animBones[0]]
-
+    for poseMatrices in sampler.sampleFrames(anim, range(frame_start, frame_start + frame_count)):
         # Convert Z-up to Y-up for root translation animation
         translation = (
             mathutils.Quaternion((1, 0, 0), math.radians(-90.0))
-            @ (convertTransformMatrix @ rootPoseBone.matrix).decompose()[0]
+            @ (convertTransformMatrix @ poseMatrices[animBones[0]]).decompose()[0]
         )
         saveTranslationFrame(translationData, translation)
 
         for boneIndex in range(len(animBones)):
             boneName = animBones[boneIndex]
             currentBone = armatureObj.data.bones[boneName]
-            currentPoseBone = armatureObj.pose.bones[boneName]
+            parentPoseMatrix = poseMatrices[currentBone.parent.name] if currentBone.parent is not None else None
 
             saveQuaternionFrame(
                 rotationData[boneIndex],
-                ootGetAnimBoneRot(currentBone, currentPoseBone, convertTransformMatrix, boneIndex == 0),
+                ootGetAnimBoneRot(
+                    currentBone, poseMatrices[boneName], parentPoseMatrix, convertTransformMatrix, boneIndex == 0
+                ),
             )
 
-    bpy.context.scene.frame_set(currentFrame)
     squashFramesIfAllSame(translationData)
     for frameData in rotationData:
         squashFramesIfAllSame(frameData)
@@ -198,13 +207,18 @@ def ootConvertAnimationData(anim, armatureObj, convertTransformMatrix, *, frame_
     return armatureFrameData
 
 
-def ootExportAnimationCommon(armatureObj, convertTransformMatrix, skeletonName):
+# animBones and sampler can be passed in to share them between the animations of a batch export,
+# which also only has to check the skeleton once.
+def ootExportAnimationCommon(
+    armatureObj, convertTransformMatrix, skeletonName, animBones=None, sampler=None, checkSkeleton=True
+):
     if armatureObj.animation_data is None or armatureObj.animation_data.action is None:
         raise PluginError("No active animation selected.")
     anim = armatureObj.animation_data.action
     ootAnim = OOTAnimation(toAlnum(skeletonName + anim.name.capitalize() + "Anim"))
 
-    skeleton = ootConvertArmatureToSkeletonWithoutMesh(armatureObj, convertTransformMatrix, skeletonName)
+    if checkSkeleton:
+        skeleton = ootConvertArmatureToSkeletonWithoutMesh(armatureObj, convertTransformMatrix, skeletonName)
 
     frame_start, frame_last = getFrameInterval(anim)
     ootAnim.frameCount = frame_last - frame_start + 1
@@ -215,6 +229,8 @@ def ootExportAnimationCommon(armatureObj, convertTransformMatrix, skeletonName):
         convertTransformMatrix,
         frame_start=frame_start,
         frame_count=(frame_last - frame_start + 1),
+        animBones=animBones,
+        sampler=sampler,
     )
 
     singleFrameData = []
@@ -235,31 +251,48 @@ def ootExportAnimationCommon(armatureObj, convertTransformMatrix, skeletonName):
             ootAnim.indices[frameData.boneIndex][frameData.field] = len(ootAnim.values)
             ootAnim.values.extend(frameData.frames)
 
+    # Animated values have to start at or after the limit, so they are packed separately from the static values.
     ootAnim.limit = len(ootAnim.values)
-    for frameData in multiFrameData:
+    packedValues, offsets = packValueArrays([frameData.frames for frameData in multiFrameData])
+    for frameData, offset in zip(multiFrameData, offsets):
         if frameData.boneIndex not in ootAnim.indices:
             ootAnim.indices[frameData.boneIndex] = [None, None, None]
-        ootAnim.indices[frameData.boneIndex][frameData.field] = len(ootAnim.values)
-        ootAnim.values.extend(frameData.frames)
+        ootAnim.indices[frameData.boneIndex][frameData.field] = ootAnim.limit + offset
+    ootAnim.values.extend(packedValues)
+
+    savedBytes = (sum([len(frameData.frames) for frameData in multiFrameData]) - len(packedValues)) * 2
+    print("Packed " + ootAnim.valuesName() + ", saving " + str(savedBytes) + " bytes.")
+    recordExportMetrics({"anim_values_saved_bytes": savedBytes})
 
     return ootAnim
 
 
-def exportAnimationC(armatureObj, exportPath, isCustomExport, folderName, skeletonName):
+def exportAnimationC(armatureObj, exportPath, isCustomExport, folderName, skeletonName, actions=None):
     checkEmptyName(folderName)
     checkEmptyName(skeletonName)
     convertTransformMatrix = (
         mathutils.Matrix.Scale(bpy.context.scene.ootActorBlenderScale, 4)
         @ mathutils.Matrix.Diagonal(armatureObj.scale).to_4x4()
     )
-    ootAnim = ootExportAnimationCommon(armatureObj, convertTransformMatrix, skeletonName)
+    if actions is None:
+        ootAnims = [ootExportAnimationCommon(armatureObj, convertTransformMatrix, skeletonName)]
+    else:
+        # Bone order and rest matrices are shared by all actions
+        ootConvertArmatureToSkeletonWithoutMesh(armatureObj, convertTransformMatrix, skeletonName)
+        animBones = ootGetAnimBones(armatureObj)
+        sampler = ArmaturePoseSampler(armatureObj)
+        ootAnims = [
+            ootExportAnimationCommon(armatureObj, convertTransformMatrix, skeletonName, animBones, sampler, False)
+            for action in iterArmatureActions(armatureObj, actions)
+        ]
 
-    ootAnimC = ootAnim.toC()
     path = ootGetPath(exportPath, isCustomExport, "assets/objects/", folderName, False, False)
-    writeCData(ootAnimC, os.path.join(path, ootAnim.name + ".h"), os.path.join(path, ootAnim.name + ".c"))
+    for ootAnim in ootAnims:
+        ootAnimC = ootAnim.toC()
+        writeCData(ootAnimC, os.path.join(path, ootAnim.name + ".h"), os.path.join(path, ootAnim.name + ".c"))
 
     if not isCustomExport:
-        addIncludeFiles(folderName, path, ootAnim.name)
+        addIncludeFilesForAssets(folderName, path, [ootAnim.name for ootAnim in ootAnims])
 
 
 def getNextBone(boneStack, armatureObj):
@@ -311,12 +344,10 @@ def ootImportAnimationC(armatureObj, filepath, animName, actorScale):
                     action_group=startBoneName,
                 )
                 if jointIndex[propertyIndex] < staticIndexMax:
-                    value = frameData[jointIndex[propertyIndex]] / actorScale
-                    fcurve.keyframe_points.insert(0, value)
+                    values = [frameData[jointIndex[propertyIndex]]]
                 else:
-                    for frame in range(frameCount):
-                        value = frameData[jointIndex[propertyIndex] + frame] / actorScale
-                        fcurve.keyframe_points.insert(frame, value)
+                    values = frameData[jointIndex[propertyIndex] : jointIndex[propertyIndex] + frameCount]
+                setFCurveKeyframes(fcurve, [value / actorScale for value in values])
             isRootTranslation = False
         else:
             # WARNING: This assumes the order bones are processed are in alphabetical order.
@@ -329,12 +360,10 @@ def ootImportAnimationC(armatureObj, filepath, animName, actorScale):
                     action_group=bone.name,
                 )
                 if jointIndex[propertyIndex] < staticIndexMax:
-                    value = math.radians(frameData[jointIndex[propertyIndex]] * 360 / (2**16))
-                    fcurve.keyframe_points.insert(0, value)
+                    values = [frameData[jointIndex[propertyIndex]]]
                 else:
-                    for frame in range(frameCount):
-                        value = math.radians(frameData[jointIndex[propertyIndex] + frame] * 360 / (2**16))
-                        fcurve.keyframe_points.insert(frame, value)
+                    values = frameData[jointIndex[propertyIndex] : jointIndex[propertyIndex] + frameCount]
+                setFCurveKeyframes(fcurve, [math.radians(value * 360 / (2**16)) for value in values])
 
     if armatureObj.animation_data is None:
         armatureObj.animation_data_create()
@@ -375,6 +404,7 @@ class OOT_ExportAnim(bpy.types.Operator):
 
     # Called on demand (i.e. button press, menu item)
     # Can also be called from operator search menu (Spacebar)
+    @recordExportStats
     def execute(self, context):
         try:
             if len(context.selected_objects) == 0 or not isinstance(
@@ -398,7 +428,10 @@ class OOT_ExportAnim(bpy.types.Operator):
 
             path = ootGetObjectPath(isCustomExport, exportPath, folderName)
 
-            exportAnimationC(armatureObj, path, isCustomExport, folderName, skeletonName)
+            actions = None
+            if context.scene.ootAnimExportActions != "Active":
+                actions = getArmatureActions(armatureObj, context.scene.ootAnimExportActions)
+            exportAnimationC(armatureObj, path, isCustomExport, folderName, skeletonName, actions)
             self.report({"INFO"}, "Success!")
 
         except Exception as e:
@@ -458,6 +491,7 @@ class OOT_ExportAnimPanel(OOT_Panel):
         col = self.layout.column()
 
         col.operator(OOT_ExportAnim.bl_idname)
+        prop_split(col, context.scene, "ootAnimExportActions", "Actions")
         prop_split(col, context.scene, "ootAnimSkeletonName", "Skeleton Name")
         if context.scene.ootAnimIsCustomExport:
             prop_split(col, context.scene, "ootAnimExportCustomPath", "Folder")
@@ -497,6 +531,9 @@ def oot_anim_register():
     bpy.types.Scene.ootAnimIsCustomExport = bpy.props.BoolProperty(name="Use Custom Path")
     bpy.types.Scene.ootAnimExportCustomPath = bpy.props.StringProperty(name="Folder", subtype="FILE_PATH")
     bpy.types.Scene.ootAnimExportFolderName = bpy.props.StringProperty(name="Animation Folder", default="object_geldb")
+    bpy.types.Scene.ootAnimExportActions = bpy.props.EnumProperty(
+        items=enumAnimExportActions, name="Actions", default="Active"
+    )
 
     bpy.types.Scene.ootAnimIsCustomImport = bpy.props.BoolProperty(name="Use Custom Path")
     bpy.types.Scene.ootAnimImportCustomPath = bpy.props.StringProperty(name="Folder", subtype="FILE_PATH")
@@ -512,6 +549,7 @@ def oot_anim_unregister():
     del bpy.types.Scene.ootAnimIsCustomExport
     del bpy.types.Scene.ootAnimExportCustomPath
     del bpy.types.Scene.ootAnimExportFolderName
+    del bpy.types.Scene.ootAnimExportActions
 
     del bpy.types.Scene.ootAnimIsCustomImport
     del bpy.types.Scene.ootAnimImportCustomPath
@@ -3,12 +3,14 @@ from bpy.utils import register_class, unregister_class
 from io import BytesIO
 
 from ..utility import *
+from ..utility_collision import getCollisionTriangles
 from .oot_utility import *
 from .oot_constants import *
 from ..panels import OOT_Panel
 
 from .oot_collision_classes import *
 from .oot_scene_room import *
+from ..export_stats import recordExportStats
 
 
 class OOTCameraPositionProperty(bpy.types.PropertyGroup):
@@ -161,18 +163,20 @@ def exportCollisionCommon(collision, obj, transformMatrix, includeChildren, name
     collisionDict = {}
 
     addCollisionTriangles(obj, collisionDict, includeChildren, transformMatrix, collision.bounds)
+    # rounded position : index in collision.vertices
+    vertexIndices = {vertex.position: index for index, vertex in enumerate(collision.vertices)}
     for polygonType, faces in collisionDict.items():
         collision.polygonGroups[polygonType] = []
         for (faceVerts, normal, distance) in faces:
             assert len(faceVerts) == 3
             indices = []
             for roundedPosition in faceVerts:
-                index = collisionVertIndex(roundedPosition, collision.vertices)
+                index = vertexIndices.get(roundedPosition)
                 if index is None:
+                    index = len(collision.vertices)
+                    vertexIndices[roundedPosition] = index
                     collision.vertices.append(OOTCollisionVertex(roundedPosition))
-                    indices.append(len(collision.vertices) - 1)
-                else:
-                    indices.append(index)
+                indices.append(index)
             assert len(indices) == 3
 
             # We need to ensure two things about the order in which the vertex indices are:
@@ -259,42 +263,27 @@ def addCollisionTriangles(obj, collisionDict, includeChildren, transformMatrix,
     if isinstance(obj.data, bpy.types.Mesh) and not obj.ignore_collision:
         if len(obj.data.materials) == 0:
             raise PluginError(obj.name + " must have a material associated with it.")
-        obj.data.calc_loop_triangles()
-        for face in obj.data.loop_triangles:
-            material = obj.material_slots[face.material_index].material
-            polygonType = getPolygonType(material.ootCollisionProperty)
-
-            planePoint = transformMatrix @ obj.data.vertices[face.vertices[0]].co
-            (x1, y1, z1) = roundPosition(planePoint)
-            (x2, y2, z2) = roundPosition(transformMatrix @ obj.data.vertices[face.vertices[1]].co)
-            (x3, y3, z3) = roundPosition(transformMatrix @ obj.data.vertices[face.vertices[2]].co)
-
-            updateBounds((x1, y1, z1), bounds)
-            updateBounds((x2, y2, z2), bounds)
-            updateBounds((x3, y3, z3), bounds)
-
-            faceNormal = (transformMatrix.inverted().transposed() @ face.normal).normalized()
-            distance = int(
-                round(
-                    -1 * (faceNormal[0] * planePoint[0] + faceNormal[1] * planePoint[1] + faceNormal[2] * planePoint[2])
-                )
-            )
-            distance = convertIntTo2sComplement(distance, 2, True)
-
-            nx = (y2 - y1) * (z3 - z2) - (z2 - z1) * (y3 - y2)
-            ny = (z2 - z1) * (x3 - x2) - (x2 - x1) * (z3 - z2)
-            nz = (x2 - x1) * (y3 - y2) - (y2 - y1) * (x3 - x2)
-            magSqr = nx * nx + ny * ny + nz * nz
-
-            if magSqr <= 0:
-                print("Ignore denormalized triangle.")
-                continue
 
+        polygonTypes = [
+            getPolygonType(slot.material.ootCollisionProperty) if slot.material is not None else None
+            for slot in obj.material_slots
+        ]
+
+        triangles = getCollisionTriangles(obj.data, transformMatrix, True)
+        if triangles.bounds is not None:
+            updateBounds(triangles.bounds[0], bounds)
+            updateBounds(triangles.bounds[1], bounds)
+
+        for materialIndex, positions, faceNormal, distance in zip(
+            triangles.materialIndices, triangles.positions, triangles.normals, triangles.distances
+        ):
+            polygonType = polygonTypes[materialIndex]
+            if polygonType is None:
+                raise PluginError(obj.name + " has an empty material slot.")
             if polygonType not in collisionDict:
                 collisionDict[polygonType] = []
 
-            positions = ((x1, y1, z1), (x2, y2, z2), (x3, y3, z3))
-
+            distance = convertIntTo2sComplement(distance, 2, True)
             collisionDict[polygonType].append((positions, faceNormal, distance))
 
     if includeChildren:
@@ -302,19 +291,6 @@ def addCollisionTriangles(obj, collisionDict, includeChildren, transformMatrix,
             addCollisionTriangles(child, collisionDict, includeChildren, transformMatrix @ child.matrix_local, bounds)
 
 
-def roundPosition(position):
-    # return [int.from_bytes(int(round(value)).to_bytes(2, 'big', signed = True), 'big') for value in position]
-    return (int(round(position[0])), int(round(position[1])), int(round(position[2])))
-
-
-def collisionVertIndex(vert, vertArray):
-    for i in range(len(vertArray)):
-        colVert = vertArray[i]
-        if colVert.position == vert:
-            return i
-    return None
-
-
 def ootCollisionVertexToC(vertex):
     return "{ " + str(vertex.position[0]) + ", " + str(vertex.position[1]) + ", " + str(vertex.position[2]) + " },\n"
 
@@ -536,6 +512,7 @@ class OOT_ExportCollision(bpy.types.Operator):
     bl_label = "Export Collision"
     bl_options = {"REGISTER", "UNDO", "PRESET"}
 
+    @recordExportStats
     def execute(self, context):
         obj = None
         if context.mode != "OBJECT":
@@ -3,6 +3,7 @@ from .oot_constants import *
 from .oot_utility import *
 from .oot_level_classes import *
 from ..panels import OOT_Panel
+from ..export_stats import recordExportStats
 
 ################################################################################
 # Properties
@@ -456,6 +457,7 @@ class OOT_ExportCutscene(bpy.types.Operator):
 	bl_label = "Export Cutscene"
 	bl_options = {'REGISTER', 'UNDO', 'PRESET'}
 	
+	@recordExportStats
 	def execute(self, context):
 		try:
 			if context.mode != 'OBJECT':
@@ -481,6 +483,7 @@ class OOT_ExportAllCutscenes(bpy.types.Operator):
 	bl_label = "Export All Cutscenes"
 	bl_options = {'REGISTER', 'UNDO', 'PRESET'}
 	
+	@recordExportStats
 	def execute(self, context):
 		try:
 			if context.mode != 'OBJECT':
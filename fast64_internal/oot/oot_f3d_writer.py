@@ -10,6 +10,7 @@ from ..panels import OOT_Panel
 
 from .oot_model_classes import *
 from .oot_scene_room import *
+from ..export_stats import recordExportStats
 
 
 class OOTDLExportSettings(bpy.types.PropertyGroup):
@@ -342,6 +343,7 @@ class OOT_ExportDL(bpy.types.Operator):
 
     # Called on demand (i.e. button press, menu item)
     # Can also be called from operator search menu (Spacebar)
+    @recordExportStats
     def execute(self, context):
         obj = None
         if context.mode != "OBJECT":
@@ -17,6 +17,7 @@ from .oot_collision import *
 from .oot_spline import *
 from .oot_cutscene import *
 from .c_writer import *
+from ..export_stats import recordExportStats
 
 
 def sceneNameFromID(sceneID):
@@ -600,6 +601,7 @@ class OOT_ExportScene(bpy.types.Operator):
     bl_label = "Export Scene"
     bl_options = {"REGISTER", "UNDO", "PRESET"}
 
+    @recordExportStats
     def execute(self, context):
         activeObj = None
         try:
@@ -16,6 +16,9 @@ class OOTModel(FModel):
     def getDrawLayerV3(self, obj):
         return obj.ootDrawLayer
 
+    def optimizeDisplayListsEnabled(self):
+        return bpy.context.scene.fast64.oot.optimize_display_lists
+
     def getRenderMode(self, drawLayer):
         if self.drawLayerOverride:
             drawLayerUsed = self.drawLayerOverride
@@ -11,6 +11,7 @@ from ..f3d.f3d_parser import *
 from ..f3d.f3d_writer import *
 from ..f3d.f3d_material import TextureProperty, tmemUsageUI
 from .oot_f3d_writer import *
+from ..export_stats import recordExportStats
 
 
 class OOTSkeletonExportSettings(bpy.types.PropertyGroup):
@@ -237,36 +238,10 @@ class OOTLimb:
 
 def getGroupIndices(meshInfo, armatureObj, meshObj, rootGroupIndex):
     meshInfo.vertexGroupInfo = OOTVertexGroupInfo()
-    for vertex in meshObj.data.vertices:
-        meshInfo.vertexGroupInfo.vertexGroups[vertex.index] = getGroupIndexOfVert(
-            vertex, armatureObj, meshObj, rootGroupIndex
-        )
-
-
-def getGroupIndexOfVert(vert, armatureObj, obj, rootGroupIndex):
-    actualGroups = []
-    nonBoneGroups = []
-    for group in vert.groups:
-        groupName = getGroupNameFromIndex(obj, group.group)
-        if groupName is not None:
-            if groupName in armatureObj.data.bones:
-                actualGroups.append(group)
-            else:
-                nonBoneGroups.append(groupName)
-
-    if len(actualGroups) == 0:
-        return rootGroupIndex
-        # highlightWeightErrors(obj, [vert], "VERT")
-        # raise VertexWeightError("All vertices must be part of a vertex group that corresponds to a bone in the armature.\n" +\
-        # 	"Groups of the bad vert that don't correspond to a bone: " + str(nonBoneGroups) + '. If a vert is supposed to belong to this group then either a bone is missing or you have the wrong group.')
-
-    vertGroup = actualGroups[0]
-    for group in actualGroups:
-        if group.weight > vertGroup.weight:
-            vertGroup = group
-    # if vertGroup not in actualGroups:
-    # raise VertexWeightError("A vertex was found that was primarily weighted to a group that does not correspond to a bone in #the armature. (" + getGroupNameFromIndex(obj, vertGroup.group) + ') Either decrease the weights of this vertex group or remove it. If you think this group should correspond to a bone, make sure to check your spelling.')
-    return vertGroup.group
+    # Vertices without a group that corresponds to a bone belong to the root group.
+    vertexBoneGroups = VertexBoneGroups(meshObj, armatureObj)
+    for vertIndex, groupIndex in enumerate(vertexBoneGroups.dominantGroups):
+        meshInfo.vertexGroupInfo.vertexGroups[vertIndex] = groupIndex if groupIndex is not None else rootGroupIndex
 
 
 def ootDuplicateArmature(originalArmatureObj):
@@ -929,6 +904,7 @@ class OOT_ExportSkeleton(bpy.types.Operator):
 
     # Called on demand (i.e. button press, menu item)
     # Can also be called from operator search menu (Spacebar)
+    @recordExportStats
     def execute(self, context):
         armatureObj = None
         if context.mode != "OBJECT":
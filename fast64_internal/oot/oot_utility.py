@@ -144,19 +144,24 @@ ootSceneDirs = {
 
 
 def addIncludeFiles(objectName, objectPath, assetName):
-    addIncludeFilesExtension(objectName, objectPath, assetName, "h")
-    addIncludeFilesExtension(objectName, objectPath, assetName, "c")
+    addIncludeFilesForAssets(objectName, objectPath, [assetName])
 
 
-def addIncludeFilesExtension(objectName, objectPath, assetName, extension):
-    include = '#include "' + assetName + "." + extension + '"\n'
+def addIncludeFilesForAssets(objectName, objectPath, assetNames):
+    addIncludeFilesExtension(objectName, objectPath, assetNames, "h")
+    addIncludeFilesExtension(objectName, objectPath, assetNames, "c")
+
+
+def addIncludeFilesExtension(objectName, objectPath, assetNames, extension):
     if not os.path.exists(objectPath):
         raise PluginError(objectPath + " does not exist.")
     path = os.path.join(objectPath, objectName + "." + extension)
     data = getDataFromFile(path)
 
-    if include not in data:
-        data += "\n" + include
+    for assetName in assetNames:
+        include = '#include "' + assetName + "." + extension + '"\n'
+        if include not in data:
+            data += "\n" + include
 
     # Save this regardless of modification so it will be recompiled.
     saveDataToFile(path, data)
@@ -207,6 +212,7 @@ class OOTObjectCategorizer:
 
 
 # This also sets all origins relative to the scene object.
+@timedExportPhase("Object Duplication")
 def ootDuplicateHierarchy(obj, ignoreAttr, includeEmpties, objectCategorizer):
     # Duplicate objects to apply scale / modifiers / linked data
     bpy.ops.object.select_all(action="DESELECT")
@@ -45,7 +45,7 @@ class SM64_AddrConv(bpy.types.Operator):
         try:
             address = int(context.scene.convertibleAddr, 16)
             importRom = context.scene.importRom
-            romfileSrc = open(bpy.path.abspath(importRom), "rb")
+            romfileSrc = RomReader(bpy.path.abspath(importRom))
             checkExpanded(bpy.path.abspath(importRom))
             levelParsed = parseLevelAtPointer(romfileSrc, level_pointers[context.scene.levelConvert])
             segmentData = levelParsed.segmentData
@@ -91,6 +91,8 @@ class SM64_FileSettingsPanel(SM64_Panel):
 
         prop_split(col, sm64Props, "exportType", "Export type")
         prop_split(col, context.scene, "blenderToSM64Scale", "Blender To SM64 Scale")
+        col.prop(sm64Props, "optimize_display_lists")
+        col.prop(sm64Props, "simplify_collision")
 
         if sm64Props.showImportingMenus:
             col.prop(context.scene, "importRom")
@@ -143,6 +145,16 @@ class SM64_Properties(bpy.types.PropertyGroup):
     showImportingMenus: bpy.props.BoolProperty(name="Show Importing Menus", default=False)
     exportType: bpy.props.EnumProperty(items=enumExportType, name="Export Type", default="C")
     goal: bpy.props.EnumProperty(items=sm64GoalTypeEnum, name="Export Goal", default="All")
+    optimize_display_lists: bpy.props.BoolProperty(
+        name="Optimize Display Lists",
+        description="Remove redundant state changes and pipe syncs from exported display lists",
+        default=False,
+    )
+    simplify_collision: bpy.props.BoolProperty(
+        name="Simplify Collision",
+        description="Merge coplanar faces of the same material and remove sliver triangles from exported collision",
+        default=False,
+    )
 
     # TODO: Utilize these across all exports
     # C exporting
@@ -1,4 +1,4 @@
-import bpy, mathutils, math, re, os, copy, shutil
+import bpy, mathutils, math, re, os, copy, shutil, struct, hashlib
 from .sm64_constants import *
 from .sm64_level_parser import parseLevelAtPointer
 from .sm64_rom_tweaks import ExtendBank0x04
@@ -8,6 +8,7 @@ from bpy.utils import register_class, unregister_class
 
 from ..utility import *
 from ..panels import SM64_Panel, sm64GoalImport
+from ..export_stats import recordExportStats, recordExportMetrics
 
 sm64_anim_types = {'ROTATE', 'TRANSLATE'}
 
@@ -17,6 +18,8 @@ class SM64_Animation:
 		self.header = None
 		self.indices = SM64_ShortArray(name + '_indices', False)
 		self.values = SM64_ShortArray(name + '_values', True)
+		# Values shared with other animations are written separately, see SM64_SharedAnimValues
+		self.sharedValues = False
 	
 	def get_ptr_offsets(self, isDMA):
 		return [12, 16] if not isDMA else []
@@ -29,7 +32,7 @@ class SM64_Animation:
 	def to_c(self):
 		data = CData()
 		data.header = "extern const struct Animation *const " + self.name + '[];\n'
-		data.source = self.values.to_c() + '\n' +\
+		data.source = (self.values.to_c() + '\n' if not self.sharedValues else '') +\
 			self.indices.to_c() + '\n' +\
 			self.header.to_c() + '\n'
 		return data
@@ -39,6 +42,35 @@ class SM64_ShortArray:
 		self.name = name
 		self.shortData = []
 		self.signed = signed
+		self.channels = [] # (indices array, position of offset in indices, values) of channels added with addChannel
+
+	def addChannel(self, values, indices):
+		"""
+		Adds the frame count and value offset of a channel to indices.
+		The offset is filled in when the values are packed.
+		"""
+		indices.shortData.append(len(values))
+		self.channels.append((indices, len(indices.shortData), tuple(values)))
+		indices.shortData.append(0)
+
+	def getChannelValueCount(self):
+		return sum([len(values) for indices, position, values in self.channels])
+
+	def pack(self):
+		"""
+		Stores the values of all channels, with identical and overlapping runs shared between channels.
+		Returns the number of bytes saved.
+		"""
+		self.shortData, offsets = packValueArrays([values for indices, position, values in self.channels])
+		for (indices, position, values), offset in zip(self.channels, offsets):
+			if offset > 2**16 - 1:
+				raise PluginError('Animation is too large.')
+			indices.shortData[position] = offset
+
+		savedBytes = (self.getChannelValueCount() - len(self.shortData)) * 2
+		print('Packed ' + self.name + ', saving ' + str(savedBytes) + ' bytes.')
+		recordExportMetrics({'anim_values_saved_bytes': savedBytes})
+		return savedBytes
 	
 	def to_binary(self):
 		data = bytearray(0)
@@ -60,6 +92,28 @@ class SM64_ShortArray:
 		data += '\n};\n'
 		return data
 
+class SM64_SharedAnimValues:
+	"""
+	Value arrays shared by the animations of a batch export, so that identical and overlapping channels
+	are only stored once.
+	A new array is started when an animation could make offsets overflow the 16 bit indices.
+	"""
+	def __init__(self, name):
+		self.name = name
+		self.arrays = []
+
+	def getArray(self, valueCount):
+		if len(self.arrays) == 0 or self.arrays[-1].getChannelValueCount() + valueCount > 2**16:
+			suffix = '_values' if len(self.arrays) == 0 else '_values_' + str(len(self.arrays))
+			self.arrays.append(SM64_ShortArray(self.name + suffix, True))
+		return self.arrays[-1]
+
+	def pack(self):
+		return sum([array.pack() for array in self.arrays])
+
+	def to_c(self):
+		return '\n'.join([array.to_c() for array in self.arrays])
+
 class SM64_AnimationHeader:
 	def __init__(self, name, repetitions, marioYOffset, frameInterval, 
 		nodeCount, transformValuesStart, transformIndicesStart, animSize):
@@ -71,6 +125,7 @@ class SM64_AnimationHeader:
 		self.transformValuesStart = transformValuesStart
 		self.transformIndicesStart = transformIndicesStart
 		self.animSize = animSize # DMA animations only
+		self.valuesName = name + '_values'
 		
 		self.transformIndices = []
 
@@ -109,7 +164,7 @@ class SM64_AnimationHeader:
 			'\t' + str(int(round(self.frameInterval[0]))) + ',\n' + \
 			'\t' + str(int(round(self.frameInterval[1] - 1))) + ',\n' + \
 			'\tANIMINDEX_NUMPARTS(' + self.name + '_indices),\n' + \
-			'\t' + self.name + '_values,\n' + \
+			'\t' + self.valuesName + ',\n' + \
 			'\t' + self.name + '_indices,\n' + \
 			'\t0,\n' + \
 			'};\n'
@@ -138,12 +193,26 @@ def getLastKeyframeTime(keyframes):
 # add data/table includes to groupN.c (bin_id?)
 # add data/table files
 def exportAnimationC(armatureObj, loopAnim, dirPath, dirName, groupName,
-	customExport, headerType, levelName):
+	customExport, headerType, levelName, actions = None):
 	dirPath, texDir = getExportDir(customExport, dirPath, headerType, 
 		levelName, '', dirName)
 
-	sm64_anim = exportAnimationCommon(armatureObj, loopAnim, dirName + "_anim")
-	animName = armatureObj.animation_data.action.name
+	animsName = dirName + '_anims'
+	if actions is None:
+		sm64_anims = [(armatureObj.animation_data.action.name,
+			exportAnimationCommon(armatureObj, loopAnim, dirName + "_anim"))]
+		sharedValues = None
+	else:
+		# Bone order, rest matrices and value arrays are shared by all actions
+		animBones = getAnimBones(armatureObj)
+		sampler = ArmaturePoseSampler(armatureObj)
+		# Each batch gets its own value arrays, so that animations exported before keep pointing at their values.
+		# Exporting the same actions again replaces the arrays of that batch.
+		batchID = hashlib.sha1('\n'.join([action.name for action in actions]).encode('utf-8')).hexdigest()[:8]
+		sharedValues = SM64_SharedAnimValues(animsName + '_' + batchID)
+		sm64_anims = [(action.name, exportAnimationCommon(armatureObj, loopAnim, dirName + "_anim",
+			animBones, sampler, sharedValues)) for action in iterArmatureActions(armatureObj, actions)]
+		sharedValues.pack()
 
 	geoDirPath = os.path.join(dirPath, toAlnum(dirName))
 	if not os.path.exists(geoDirPath):
@@ -153,14 +222,16 @@ def exportAnimationC(armatureObj, loopAnim, dirPath, dirName, groupName,
 	if not os.path.exists(animDirPath):
 		os.mkdir(animDirPath)
 
-	animsName = dirName + '_anims'
-	animFileName = 'anim_' + toAlnum(animName) + '.inc.c'
-	animPath = os.path.join(animDirPath, animFileName)
+	animFileNames = []
+	for animName, sm64_anim in sm64_anims:
+		animFileName = 'anim_' + toAlnum(animName) + '.inc.c'
+		animPath = os.path.join(animDirPath, animFileName)
+		animFileNames.append(animFileName)
 
-	data = sm64_anim.to_c()
-	outFile = open(animPath, 'w', newline='\n')
-	outFile.write(data.source)
-	outFile.close()
+		data = sm64_anim.to_c()
+		outFile = open(animPath, 'w', newline='\n')
+		outFile.write(data.source)
+		outFile.close()
 
 	headerPath = os.path.join(geoDirPath, 'anim_header.h')
 	headerFile = open(headerPath, 'w', newline='\n')
@@ -169,10 +240,29 @@ def exportAnimationC(armatureObj, loopAnim, dirPath, dirName, groupName,
 
 	# write to data.inc.c
 	dataFilePath = os.path.join(animDirPath, 'data.inc.c')
-	if not os.path.exists(dataFilePath):
+	if sharedValues is not None:
+		valuesFileName = 'anim_values_' + batchID + '.inc.c'
+		valuesFile = open(os.path.join(animDirPath, valuesFileName), 'w', newline='\n')
+		valuesFile.write(sharedValues.to_c())
+		valuesFile.close()
+
+		# The animations of the batch have to be included after their values,
+		# so their includes are moved to the end of data.inc.c. Other includes are kept.
+		batchIncludes = ['#include "' + fileName + '"\n' for fileName in [valuesFileName] + animFileNames]
+		dataLines = []
+		if os.path.exists(dataFilePath):
+			with open(dataFilePath, 'r') as dataFile:
+				dataLines = [line for line in dataFile.readlines() if line not in batchIncludes]
+			if len(dataLines) > 0 and not dataLines[-1].endswith('\n'):
+				dataLines[-1] += '\n'
 		dataFile = open(dataFilePath, 'w', newline='\n')
+		dataFile.write(''.join(dataLines + batchIncludes))
 		dataFile.close()
-	writeIfNotFound(dataFilePath, '#include "' + animFileName + '"\n', '')
+	else:
+		if not os.path.exists(dataFilePath):
+			dataFile = open(dataFilePath, 'w', newline='\n')
+			dataFile.close()
+		writeIfNotFound(dataFilePath, '#include "' + animFileNames[0] + '"\n', '')
 
 	# write to table.inc.c
 	tableFilePath = os.path.join(animDirPath, 'table.inc.c')
@@ -187,9 +277,13 @@ def exportAnimationC(armatureObj, loopAnim, dirPath, dirName, groupName,
 	stringData = ""
 	with open(tableFilePath, 'r') as f:
 		stringData = f.read()
+	tableChanged = False
 
-	# if animation header isn´t already in the table then add it.
-	if sm64_anim.header.name not in stringData:
+	for animName, sm64_anim in sm64_anims:
+		# if animation header isn´t already in the table then add it.
+		# Existing entries keep their index, since game code refers to animations by index.
+		if '&' + sm64_anim.header.name + ',' in stringData:
+			continue
 
 		# search for the NULL value which represents the end of the table 
 		# (this value is not present in vanilla animation tables)
@@ -206,7 +300,9 @@ def exportAnimationC(armatureObj, loopAnim, dirPath, dirName, groupName,
 			stringData = stringData[:footerIndex] + '\tNULL,\n' + stringData[footerIndex:]
 
 		stringData = stringData[:footerIndex] + f'\t&{sm64_anim.header.name},\n' + stringData[footerIndex:]
-		
+		tableChanged = True
+
+	if tableChanged:
 		with open(tableFilePath, 'w') as f:
 			f.write(stringData)
 
@@ -274,7 +370,8 @@ def exportAnimationInsertableBinary(filepath, armatureObj, isDMA, loopAnim):
 		sm64_anim.get_ptr_offsets(isDMA), startAddress, animData)
 	
 
-def exportAnimationCommon(armatureObj, loopAnim, name):
+# animBones, sampler and sharedValues can be passed in to share them between the animations of a batch export.
+def exportAnimationCommon(armatureObj, loopAnim, name, animBones = None, sampler = None, sharedValues = None):
 	if armatureObj.animation_data is None or \
 		armatureObj.animation_data.action is None:
 		raise PluginError("No active animation selected.")
@@ -290,12 +387,19 @@ def exportAnimationCommon(armatureObj, loopAnim, name):
 		armatureObj,
 		frame_start=frame_start,
 		frame_count=(frame_last - frame_start + 1),
+		animBones=animBones,
+		sampler=sampler,
 	)
 
+	if sharedValues is not None:
+		valueCount = sum([len(frameData.frames) for frameData in translationData]) + \
+			sum([len(frameData.frames) for boneFrameData in armatureFrameData for frameData in boneFrameData])
+		sm64_anim.values = sharedValues.getArray(valueCount)
+		sm64_anim.sharedValues = True
+
 	repetitions = 0 if loopAnim else 1
 	marioYOffset = 0x00 # ??? Seems to be this value for most animations
 	
-	transformValuesOffset = 0
 	headerSize = 0x1A
 	transformIndicesStart = headerSize #0x18 if including animSize?
 
@@ -306,27 +410,19 @@ def exportAnimationCommon(armatureObj, loopAnim, name):
 	transformValuesStart = transformIndicesStart
 
 	for translationFrameProperty in translationData:
-		frameCount = len(translationFrameProperty.frames)
-		sm64_anim.indices.shortData.append(frameCount)
-		sm64_anim.indices.shortData.append(transformValuesOffset)
-		if(transformValuesOffset) > 2**16 - 1:
-			raise PluginError('Animation is too large.')
-		transformValuesOffset += frameCount
+		sm64_anim.values.addChannel([
+			int.from_bytes(value.to_bytes(2,'big', signed = True), byteorder = 'big', signed = False)
+			for value in translationFrameProperty.frames], sm64_anim.indices)
 		transformValuesStart += 4
-		for value in translationFrameProperty.frames:
-			sm64_anim.values.shortData.append(int.from_bytes(value.to_bytes(2,'big', signed = True), byteorder = 'big', signed = False))
 
 	for boneFrameData in armatureFrameData:
 		for boneFrameDataProperty in boneFrameData:
-			frameCount = len(boneFrameDataProperty.frames)
-			sm64_anim.indices.shortData.append(frameCount)
-			sm64_anim.indices.shortData.append(transformValuesOffset)
-			if(transformValuesOffset) > 2**16 - 1:
-				raise PluginError('Animation is too large.')
-			transformValuesOffset += frameCount
+			sm64_anim.values.addChannel(boneFrameDataProperty.frames, sm64_anim.indices)
 			transformValuesStart += 4
-			for value in boneFrameDataProperty.frames:
-				sm64_anim.values.shortData.append(value)
+
+	# Shared values are packed once all animations of the batch are added
+	if not sm64_anim.sharedValues:
+		sm64_anim.values.pack()
 	
 	animSize = headerSize + len(sm64_anim.indices.shortData) * 2 + \
 		len(sm64_anim.values.shortData) * 2
@@ -334,10 +430,12 @@ def exportAnimationCommon(armatureObj, loopAnim, name):
 	sm64_anim.header = SM64_AnimationHeader(sm64_anim.name, repetitions,
 		marioYOffset, [frame_start, frame_last + 1], nodeCount, transformValuesStart, 
 		transformIndicesStart, animSize)
+	if sm64_anim.sharedValues:
+		sm64_anim.header.valuesName = sm64_anim.values.name
 	
 	return sm64_anim
 	
-def convertAnimationData(anim, armatureObj, *, frame_start, frame_count):
+def getAnimBones(armatureObj):
 	bonesToProcess = findStartBones(armatureObj)
 	currentBone = armatureObj.data.bones[bonesToProcess[0]]
 	animBones = []
@@ -356,6 +454,14 @@ def convertAnimationData(anim, armatureObj, *, frame_start, frame_count):
 		# Traverse children in alphabetical order.
 		childrenNames = sorted([bone.name for bone in currentBone.children])
 		bonesToProcess = childrenNames + bonesToProcess
+
+	return animBones
+
+def convertAnimationData(anim, armatureObj, *, frame_start, frame_count, animBones = None, sampler = None):
+	if animBones is None:
+		animBones = getAnimBones(armatureObj)
+	if sampler is None:
+		sampler = ArmaturePoseSampler(armatureObj)
 	
 	# list of boneFrameData, which is [[x frames], [y frames], [z frames]]
 	translationData = [ValueFrameData(0, i, []) for i in range(3)]
@@ -364,36 +470,31 @@ def convertAnimationData(anim, armatureObj, *, frame_start, frame_count):
 		ValueFrameData(i, 1, []),
 		ValueFrameData(i, 2, [])] for i in range(len(animBones))]
 
-	currentFrame = bpy.context.scene.frame_current
-	for frame in range(frame_start, frame_start + frame_count):
-		bpy.context.scene.frame_set(frame)
+	for poseMatrices in sampler.sampleFrames(anim, range(frame_start, frame_start + frame_count)):
 		rootBone = armatureObj.data.bones[animBones[0]]
-		rootPoseBone = armatureObj.pose.bones[animBones[0]]
 
 		# Hacky solution to handle Z-up to Y-up conversion
 		translation = \
 			(rootBone.matrix.to_4x4().inverted() @\
-			mathutils.Matrix.Scale(bpy.context.scene.blenderToSM64Scale, 4) @ rootPoseBone.matrix).decompose()[0]
+			mathutils.Matrix.Scale(bpy.context.scene.blenderToSM64Scale, 4) @ poseMatrices[rootBone.name]).decompose()[0]
 		saveTranslationFrame(translationData, translation)
 
 		for boneIndex in range(len(animBones)):
 			boneName = animBones[boneIndex]
 			currentBone = armatureObj.data.bones[boneName]
-			currentPoseBone = armatureObj.pose.bones[boneName]
 			
 			rotationValue = \
 				(currentBone.matrix.to_4x4().inverted() @ \
-				currentPoseBone.matrix).to_quaternion()
+				poseMatrices[boneName]).to_quaternion()
 			if currentBone.parent is not None:
 				rotationValue = (
-					currentBone.matrix.to_4x4().inverted() @ currentPoseBone.parent.matrix.inverted() @ \
-					currentPoseBone.matrix).to_quaternion()
+					currentBone.matrix.to_4x4().inverted() @ poseMatrices[currentBone.parent.name].inverted() @ \
+					poseMatrices[boneName]).to_quaternion()
 				
 				# rest pose local, compared to current pose local
 			
 			saveQuaternionFrame(armatureFrameData[boneIndex], rotationValue)
 	
-	bpy.context.scene.frame_set(currentFrame)
 	removeTrailingFrames(translationData)
 	for frameData in armatureFrameData:
 		removeTrailingFrames(frameData)
@@ -446,8 +547,7 @@ def importAnimationToBlender(romfile, startAddress, armatureObj, segmentData, is
 					data_path = 'pose.bones["' + startBoneName + '"].location',
 					index = propertyIndex,
 					action_group = startBoneName)
-				for frame in range(len(boneFrameData[propertyIndex])):
-					fcurve.keyframe_points.insert(frame, boneFrameData[propertyIndex][frame])
+				setFCurveKeyframes(fcurve, boneFrameData[propertyIndex])
 			isRootTranslation = False
 		else:
 			bone, boneStack = getNextBone(boneStack, armatureObj)
@@ -456,8 +556,7 @@ def importAnimationToBlender(romfile, startAddress, armatureObj, segmentData, is
 					data_path = 'pose.bones["' + bone.name + '"].rotation_euler', 
 					index = propertyIndex,
 					action_group = bone.name)
-				for frame in range(len(boneFrameData[propertyIndex])):
-					fcurve.keyframe_points.insert(frame, boneFrameData[propertyIndex][frame])
+				setFCurveKeyframes(fcurve, boneFrameData[propertyIndex])
 
 	if armatureObj.animation_data is None:
 		armatureObj.animation_data_create()
@@ -502,67 +601,37 @@ def readAnimation(name, romfile, startAddress, segmentData, isDMA):
 
 	return (animationHeader, armatureFrameData)
 
+def readAnimValues(romfile, address, count, signed):
+	return romfile.unpackAt('>' + str(count) + ('h' if signed else 'H'), address)
+
 def getKeyFramesRotation(romfile, transformValuesStart, boneIndex):
 	ptrToValue = transformValuesStart + boneIndex.startOffset
-	romfile.seek(ptrToValue)
-
-	keyframes = []
-	for frame in range(boneIndex.numFrames):
-		romfile.seek(ptrToValue + frame * 2)
-		value = int.from_bytes(romfile.read(2), 'big') * 360 / (2**16)
-		keyframes.append(math.radians(value))
-
-	return keyframes
+	values = readAnimValues(romfile, ptrToValue, boneIndex.numFrames, False)
+	return [math.radians(value * 360 / (2**16)) for value in values]
 
 def getKeyFramesTranslation(romfile, transformValuesStart, boneIndex):
 	ptrToValue = transformValuesStart + boneIndex.startOffset
-	romfile.seek(ptrToValue)
-
-	keyframes = []
-	for frame in range(boneIndex.numFrames):
-		romfile.seek(ptrToValue + frame * 2)
-		keyframes.append(int.from_bytes(romfile.read(2), 'big', signed = True) /\
-			bpy.context.scene.blenderToSM64Scale)
-
-	return keyframes
+	values = readAnimValues(romfile, ptrToValue, boneIndex.numFrames, True)
+	return [value / bpy.context.scene.blenderToSM64Scale for value in values]
 
 def readAnimHeader(name, romfile, startAddress, segmentData, isDMA):
 	frameInterval = [0,0]
 
-	romfile.seek(startAddress + 0x00)
-	numRepeats = int.from_bytes(romfile.read(2), 'big')
-
-	romfile.seek(startAddress + 0x02)
-	marioYOffset = int.from_bytes(romfile.read(2), 'big')
-
-	romfile.seek(startAddress + 0x06)
-	frameInterval[0] = int.from_bytes(romfile.read(2), 'big')
-
-	romfile.seek(startAddress + 0x08)
-	frameInterval[1] = int.from_bytes(romfile.read(2), 'big')
+	numRepeats, marioYOffset, frameInterval[0], frameInterval[1], numNodes, transformValuesOffset, \
+		transformIndicesOffset, animSize = romfile.unpackAt('>HH2xHHHIII', startAddress)
 
-	romfile.seek(startAddress + 0x0A)
-	numNodes = int.from_bytes(romfile.read(2), 'big')
-
-	romfile.seek(startAddress + 0x0C)
-	transformValuesOffset = int.from_bytes(romfile.read(4), 'big')
 	if isDMA:	
 		transformValuesStart = startAddress + transformValuesOffset
 	else:
 		transformValuesStart = decodeSegmentedAddr(
 			transformValuesOffset.to_bytes(4, byteorder='big'), segmentData)
 
-	romfile.seek(startAddress + 0x10)
-	transformIndicesOffset = int.from_bytes(romfile.read(4), 'big')
 	if isDMA:
 		transformIndicesStart = startAddress + transformIndicesOffset
 	else:
 		transformIndicesStart = decodeSegmentedAddr(
 			transformIndicesOffset.to_bytes(4, byteorder='big'), segmentData)
 
-	romfile.seek(startAddress + 0x14)
-	animSize = int.from_bytes(romfile.read(4), 'big')
-
 	return SM64_AnimationHeader(name, numRepeats, marioYOffset, frameInterval, numNodes, 
 		transformValuesStart, transformIndicesStart, animSize)
 
@@ -588,12 +657,10 @@ def readTransformIndex(romfile, startAddress):
 	return SM64_AnimIndexNode(x, y, z)
 
 def readValueIndex(romfile, startAddress):
-	romfile.seek(startAddress)
-	numFrames = int.from_bytes(romfile.read(2), 'big')
-	romfile.seek(startAddress + 2)
+	numFrames, startOffset = romfile.unpackAt('>HH', startAddress)
 
 	# multiply 2 because value is the index in array of shorts (???)
-	startOffset = int.from_bytes(romfile.read(2), 'big') * 2
+	startOffset *= 2
 	print(str(hex(startAddress)) + ": " + str(numFrames) + " " + str(startOffset))
 	return SM64_AnimIndex(numFrames, startOffset)
 
@@ -610,6 +677,7 @@ class SM64_ExportAnimMario(bpy.types.Operator):
 
 	# Called on demand (i.e. button press, menu item)
 	# Can also be called from operator search menu (Spacebar)
+	@recordExportStats
 	def execute(self, context):
 		romfileOutput = None
 		tempROM = None
@@ -637,10 +705,13 @@ class SM64_ExportAnimMario(bpy.types.Operator):
 					context.scene.animLevelOption)
 				if not context.scene.animCustomExport:
 					applyBasicTweaks(exportPath)
+				actions = None
+				if context.scene.animExportActions != 'Active':
+					actions = getArmatureActions(armatureObj, context.scene.animExportActions)
 				exportAnimationC(armatureObj, context.scene.loopAnimation, 
 					exportPath, bpy.context.scene.animName,
 					bpy.context.scene.animGroupName,
-					context.scene.animCustomExport, context.scene.animExportHeaderType, levelName)
+					context.scene.animCustomExport, context.scene.animExportHeaderType, levelName, actions)
 				self.report({'INFO'}, 'Success!')
 			elif context.scene.fast64.sm64.exportType == 'Insertable Binary':
 				exportAnimationInsertableBinary(
@@ -660,7 +731,9 @@ class SM64_ExportAnimMario(bpy.types.Operator):
 				romfileOutput = open(bpy.path.abspath(tempROM), 'rb+')
 			
 				# Note actual level doesn't matter for Mario, since he is in all of 	them
-				levelParsed = parseLevelAtPointer(romfileOutput, level_pointers		[context.scene.levelAnimExport])
+				# The level is parsed before the ROM is modified, so it can be read from memory.
+				with RomReader(bpy.path.abspath(tempROM)) as romReader:
+					levelParsed = parseLevelAtPointer(romReader, level_pointers[context.scene.levelAnimExport])
 				segmentData = levelParsed.segmentData
 				if context.scene.extendBank4:
 					ExtendBank0x04(romfileOutput, segmentData, 
@@ -743,6 +816,7 @@ class SM64_ExportAnimPanel(SM64_Panel):
 		col.prop(context.scene, 'loopAnimation')
 
 		if context.scene.fast64.sm64.exportType == 'C':
+			prop_split(col, context.scene, 'animExportActions', 'Actions')
 			col.prop(context.scene, 'animCustomExport')
 			if context.scene.animCustomExport:
 				col.prop(context.scene, 'animExportPath')
@@ -803,7 +877,7 @@ class SM64_ImportAnimMario(bpy.types.Operator):
 		romfileSrc = None
 		try:
 			checkExpanded(bpy.path.abspath(context.scene.importRom))
-			romfileSrc = open(bpy.path.abspath(context.scene.importRom), 'rb')
+			romfileSrc = RomReader(bpy.path.abspath(context.scene.importRom))
 		except Exception as e:
 			raisePluginError(self, e)
 			return {'CANCELLED'}
@@ -896,6 +970,8 @@ def sm64_anim_register():
 	bpy.types.Scene.levelAnimImport = bpy.props.EnumProperty(items = level_enums, name = 'Level', default = 'IC')
 	bpy.types.Scene.levelAnimExport = bpy.props.EnumProperty(items = level_enums, name = 'Level', default = 'IC')
 	bpy.types.Scene.loopAnimation = bpy.props.BoolProperty(name = 'Loop Animation', default = True)
+	bpy.types.Scene.animExportActions = bpy.props.EnumProperty(
+		items = enumAnimExportActions, name = 'Actions', default = 'Active')
 	bpy.types.Scene.setAnimListIndex = bpy.props.BoolProperty(name = 'Set Anim List Entry', default = True)
 	bpy.types.Scene.overwrite_0x28 = bpy.props.BoolProperty(name = 'Overwrite 0x28 behaviour command', default = True)
 	bpy.types.Scene.addr_0x27 = bpy.props.StringProperty(
@@ -945,6 +1021,7 @@ def sm64_anim_unregister():
 	del bpy.types.Scene.DMAStartAddress
 	del bpy.types.Scene.DMAEntryAddress
 	del bpy.types.Scene.loopAnimation
+	del bpy.types.Scene.animExportActions
 	del bpy.types.Scene.setAnimListIndex
 	del bpy.types.Scene.overwrite_0x28
 	del bpy.types.Scene.addr_0x27
@@ -3,22 +3,41 @@ from .sm64_objects import *
 from bpy.utils import register_class, unregister_class
 from .sm64_level_parser import parseLevelAtPointer
 from .sm64_rom_tweaks import ExtendBank0x04
-import bpy, shutil, os, math
+import bpy, shutil, os, math, struct
 from io import BytesIO
 from ..utility import *
+from ..utility_collision import getCollisionTriangles, simplifyCollisionMesh
 from ..panels import SM64_Panel
+from ..export_stats import recordExportStats, recordExportMetrics
+
+# Used when collision simplification is enabled.
+# Faces within this angle of each other are treated as coplanar,
+# and triangles with an altitude shorter than this many units are dropped.
+collisionCoplanarAngle = math.radians(0.1)
+collisionSliverAltitude = 1
+
+# Spatial partition of surfaces in surface_load.c
+collisionCellCount = 16
+collisionCellSize = 0x400
+collisionLevelBoundary = 0x2000
 
 class CollisionVertex:
 	def __init__(self, position):
 		self.position = position
 
-	def to_binary(self):
-		data = bytearray(0)
+	def size(self):
+		return 6
+
+	def write_binary(self, data, offset):
 		if len(self.position) > 3:
 			raise PluginError("Vertex position should not be " + \
-				str(len(self.position) + ' fields long.'))
-		for field in self.position:
-			data.extend(int(round(field)).to_bytes(2, 'big', signed = True))
+				str(len(self.position)) + ' fields long.')
+		struct.pack_into('>3h', data, offset, *[int(round(field)) for field in self.position])
+		return offset + 6
+
+	def to_binary(self):
+		data = bytearray(self.size())
+		self.write_binary(data, 0)
 		return data
 	
 	def to_c(self):
@@ -33,15 +52,23 @@ class CollisionTriangle:
 		self.specialParam = specialParam
 		self.room = room
 	
-	def to_binary(self):
-		data = bytearray(0)
+	def size(self):
+		return 6 if self.specialParam is None else 8
+
+	def write_binary(self, data, offset):
 		if len(self.indices) > 3:
 			raise PluginError("Triangle indices should not be " + \
-				str(len(self.indices) + ' fields long.'))
-		for index in self.indices:
-			data.extend(int(round(index)).to_bytes(2, 'big', signed = False))
-		if self.specialParam is not None:
-			data.extend(int(self.specialParam, 16).to_bytes(2, 'big', signed=False))
+				str(len(self.indices)) + ' fields long.')
+		indices = [int(round(index)) for index in self.indices]
+		if self.specialParam is None:
+			struct.pack_into('>3H', data, offset, *indices)
+		else:
+			struct.pack_into('>4H', data, offset, *indices, int(self.specialParam, 16))
+		return offset + self.size()
+
+	def to_binary(self):
+		data = bytearray(self.size())
+		self.write_binary(data, 0)
 		return data
 	
 	def to_c(self):
@@ -70,41 +97,50 @@ class Collision:
 	def set_addr(self, startAddress):
 		startAddress = get64bitAlignedAddr(startAddress)
 		self.startAddress = startAddress
+		size = self.size()
 		print('Collision ' + self.name + ': ' + str(startAddress) + \
-			', ' + str(self.size()))
-		return startAddress, startAddress + self.size()
+			', ' + str(size))
+		return startAddress, startAddress + size
 	
 	def save_binary(self, romfile):
 		romfile.seek(self.startAddress)
 		romfile.write(self.to_binary())
 
 	def size(self):
-		return len(self.to_binary())
+		# Computed from the counts, so that the data is only encoded once when it is saved
+		size = 4 + len(self.vertices) * 6
+		for collisionType, triangles in self.triangles.items():
+			size += 4 + sum([triangle.size() for triangle in triangles])
+		size += 2
+		if len(self.specials) > 0:
+			size += 4 + sum([special.size() for special in self.specials])
+		if len(self.water_boxes) > 0:
+			size += 4 + 12 * len(self.water_boxes)
+		return size + 2
 
 	def to_c(self):
 		data = CData()
-		data.header = 'extern const Collision ' + self.name + '[];\n'
-		data.source = 'const Collision ' + self.name + '[] = {\n'
-		data.source += '\tCOL_INIT(),\n'
-		data.source += '\tCOL_VERTEX_INIT(' + str(len(self.vertices)) + '),\n'
-		for vertex in self.vertices:
-			data.source += '\t' + vertex.to_c()
+		self.write_c(data)
+		return data
+
+	def write_c(self, data):
+		data.write_header('extern const Collision ' + self.name + '[];\n')
+		data.write_source('const Collision ' + self.name + '[] = {\n')
+		data.write_source('\tCOL_INIT(),\n')
+		data.write_source('\tCOL_VERTEX_INIT(' + str(len(self.vertices)) + '),\n')
+		data.extend_source('\t' + vertex.to_c() for vertex in self.vertices)
 		for collisionType, triangles in self.triangles.items():
-			data.source += '\tCOL_TRI_INIT(' + collisionType + ', ' +\
-				str(len(triangles)) + '),\n'
-			for triangle in triangles:
-				data.source += '\t' + triangle.to_c()
-		data.source += '\tCOL_TRI_STOP(),\n'
+			data.write_source('\tCOL_TRI_INIT(' + collisionType + ', ' +\
+				str(len(triangles)) + '),\n')
+			data.extend_source('\t' + triangle.to_c() for triangle in triangles)
+		data.write_source('\tCOL_TRI_STOP(),\n')
 		if len(self.specials) > 0:
-			data.source += '\tCOL_SPECIAL_INIT(' + str(len(self.specials)) + '),\n'
-			for special in self.specials:
-				data.source += '\t' + special.to_c()
+			data.write_source('\tCOL_SPECIAL_INIT(' + str(len(self.specials)) + '),\n')
+			data.extend_source('\t' + special.to_c() for special in self.specials)
 		if len(self.water_boxes) > 0:
-			data.source += '\tCOL_WATER_BOX_INIT(' + str(len(self.water_boxes)) + '),\n'
-			for waterBox in self.water_boxes:
-				data.source += '\t' + waterBox.to_c()
-		data.source += '\tCOL_END()\n' + '};\n'
-		return data
+			data.write_source('\tCOL_WATER_BOX_INIT(' + str(len(self.water_boxes)) + '),\n')
+			data.extend_source('\t' + waterBox.to_c() for waterBox in self.water_boxes)
+		data.write_source('\tCOL_END()\n' + '};\n')
 	
 	def rooms_name(self):
 		return self.name + '_rooms'
@@ -126,27 +162,32 @@ class Collision:
 
 	def to_binary(self):
 		colTypeDef = CollisionTypeDefinition()
-		data = bytearray([0x00, 0x40])
-		data += len(self.vertices).to_bytes(2, 'big')
+		data = bytearray(self.size())
+		struct.pack_into('>2H', data, 0, 0x40, len(self.vertices))
+		offset = 4
 		for vertex in self.vertices:
-			data += vertex.to_binary()
+			offset = vertex.write_binary(data, offset)
 		for collisionType, triangles in self.triangles.items():
-			data += getattr(colTypeDef, collisionType).to_bytes(2, 'big')
-			data += len(triangles).to_bytes(2, 'big')
+			struct.pack_into('>2H', data, offset, getattr(colTypeDef, collisionType), len(triangles))
+			offset += 4
 			for triangle in triangles:
-				data += triangle.to_binary()
-		data += bytearray([0x00, 0x41])
+				offset = triangle.write_binary(data, offset)
+		struct.pack_into('>H', data, offset, 0x41)
+		offset += 2
 		if len(self.specials) > 0:
-			data += bytearray([0x00, 0x43])
-			data += len(self.specials).to_bytes(2, 'big')
+			struct.pack_into('>2H', data, offset, 0x43, len(self.specials))
+			offset += 4
 			for special in self.specials:
-				data += special.to_binary()
+				specialData = special.to_binary()
+				data[offset : offset + len(specialData)] = specialData
+				offset += len(specialData)
 		if len(self.water_boxes) > 0:
-			data += bytearray([0x00, 0x44])
-			data += len(self.water_boxes).to_bytes(2, 'big')
+			struct.pack_into('>2H', data, offset, 0x44, len(self.water_boxes))
+			offset += 4
 			for waterBox in self.water_boxes:
-				data += waterBox.to_binary()
-		data += bytearray([0x00, 0x42])
+				data[offset : offset + 12] = waterBox.to_binary()
+				offset += 12
+		struct.pack_into('>H', data, offset, 0x42)
 		return data
 
 class SM64CollisionPanel(bpy.types.Panel):
@@ -326,37 +367,32 @@ def exportCollisionInsertableBinary(obj, transformMatrix, filepath,
 
 def exportCollisionCommon(obj, transformMatrix, includeSpecials, includeChildren, 
 	name, areaIndex):
-	bpy.ops.object.select_all(action = 'DESELECT')
-	obj.select_set(True)
-
 	# dict of collisionType : faces
 	collisionDict = {}
 	#addCollisionTriangles(obj, collisionDict, includeChildren, transformMatrix, areaIndex)
 	tempObj, allObjs = \
 		duplicateHierarchy(obj, None, True, areaIndex)
 	try:
-		addCollisionTriangles(tempObj, collisionDict, includeChildren, transformMatrix, areaIndex)
+		addCollisionTriangles(tempObj, collisionDict, includeChildren, transformMatrix, areaIndex,
+			bpy.context.scene.fast64.sm64.simplify_collision)
 		cleanupDuplicatedObjects(allObjs)
-		obj.select_set(True)
-		bpy.context.view_layer.objects.active = obj
 	except Exception as e:
 		cleanupDuplicatedObjects(allObjs)
-		obj.select_set(True)
-		bpy.context.view_layer.objects.active = obj
 		raise Exception(str(e))
 
 	collision = Collision(toAlnum(name) + '_collision')
+	vertexIndices = {} # rounded position : index in collision.vertices
 	for collisionType, faces in collisionDict.items():
 		collision.triangles[collisionType] = []
 		for (faceVerts, specialParam, room) in faces:
 			indices = []
 			for roundedPosition in faceVerts:
-				index = collisionVertIndex(roundedPosition, collision.vertices)
+				index = vertexIndices.get(roundedPosition)
 				if index is None:
+					index = len(collision.vertices)
+					vertexIndices[roundedPosition] = index
 					collision.vertices.append(CollisionVertex(roundedPosition))
-					indices.append(len(collision.vertices) - 1)
-				else:
-					indices.append(index)
+				indices.append(index)
 			collision.triangles[collisionType].append(CollisionTriangle(indices, specialParam, room))
 	if includeSpecials:
 		area = SM64_Area(areaIndex, '', '', '', None, None, [], name, None)
@@ -368,55 +404,133 @@ def exportCollisionCommon(obj, transformMatrix, includeSpecials, includeChildren
 
 	return collision
 
-def addCollisionTriangles(obj, collisionDict, includeChildren, transformMatrix, areaIndex):
+# The mesh data of obj and its children is modified if simplify is set, so it should only be called on duplicates.
+def addCollisionTriangles(obj, collisionDict, includeChildren, transformMatrix, areaIndex, simplify = False):
 	if isinstance(obj.data, bpy.types.Mesh) and not obj.ignore_collision:
 		if len(obj.data.materials) == 0:
 			raise PluginError(obj.name + " must have a material associated with it.")
-		obj.data.calc_loop_triangles()
-		for face in obj.data.loop_triangles:
-			material = obj.material_slots[face.material_index].material
+
+		# (collision type, special param) of each material slot
+		slotSettings = []
+		for slot in obj.material_slots:
+			material = slot.material
+			if material is None:
+				slotSettings.append(None)
+				continue
 			colType = material.collision_type if material.collision_all_options\
 				else material.collision_type_simple
 			if colType == 'Custom':
 				colType = material.collision_custom
 			specialParam = material.collision_param if material.use_collision_param else None
-
-			(x1, y1, z1) = roundPosition(transformMatrix @ obj.data.vertices[face.vertices[0]].co)
-			(x2, y2, z2) = roundPosition(transformMatrix @ obj.data.vertices[face.vertices[1]].co)
-			(x3, y3, z3) = roundPosition(transformMatrix @ obj.data.vertices[face.vertices[2]].co)
-
-			nx = (y2 - y1) * (z3 - z2) - (z2 - z1) * (y3 - y2)
-			ny = (z2 - z1) * (x3 - x2) - (x2 - x1) * (z3 - z2)
-			nz = (x2 - x1) * (y3 - y2) - (y2 - y1) * (x3 - x2)
-			magSqr = nx * nx + ny * ny + nz * nz
-
-			if magSqr <= 0:
-				print("Ignore denormalized triangle.")
-				continue
-
+			slotSettings.append((colType, specialParam))
+
+		if simplify:
+			mergedCount = simplifyCollisionMesh(obj.data, collisionCoplanarAngle)
+			triangles = getCollisionTriangles(obj.data, transformMatrix, False, collisionSliverAltitude)
+			recordExportMetrics({
+				'collision_merged_triangles': mergedCount,
+				'collision_sliver_triangles': triangles.sliverCount})
+		else:
+			triangles = getCollisionTriangles(obj.data, transformMatrix, False)
+		for materialIndex, positions in zip(triangles.materialIndices, triangles.positions):
+			if slotSettings[materialIndex] is None:
+				raise PluginError(obj.name + " has an empty material slot.")
+			colType, specialParam = slotSettings[materialIndex]
 			if colType not in collisionDict:
 				collisionDict[colType] = []
-			collisionDict[colType].append(((
-				(x1, y1, z1),
-				(x2, y2, z2),
-				(x3, y3, z3)), specialParam, obj.room_num))
+			collisionDict[colType].append((positions, specialParam, obj.room_num))
 	
 	if includeChildren:
 		for child in obj.children:
-			addCollisionTriangles(child, collisionDict, includeChildren, transformMatrix @ child.matrix_local, areaIndex)
-
-
-def roundPosition(position):
-	return (int(round(position[0])),
-		int(round(position[1])),
-		int(round(position[2])))
-
-def collisionVertIndex(vert, vertArray):
-	for i in range(len(vertArray)):
-		colVert = vertArray[i]
-		if colVert.position == vert:
-			return i
-	return None
+			addCollisionTriangles(child, collisionDict, includeChildren, transformMatrix @ child.matrix_local, areaIndex,
+				simplify)
+
+def lowerCollisionCellIndex(coord):
+	coord = max(coord + collisionLevelBoundary, 0)
+	index = coord // collisionCellSize
+	# Surfaces within 50 units of a cell border are also added to the neighbouring cell.
+	if coord % collisionCellSize < 50:
+		index -= 1
+	return min(max(index, 0), collisionCellCount - 1)
+
+def upperCollisionCellIndex(coord):
+	coord = max(coord + collisionLevelBoundary, 0)
+	index = coord // collisionCellSize
+	if coord % collisionCellSize > collisionCellSize - 50:
+		index += 1
+	return min(max(index, 0), collisionCellCount - 1)
+
+# Returns the number of surfaces the game will load into each cell of the static surface partition,
+# as [cellZ][cellX] = [floors, ceilings, walls].
+def getCollisionCellCounts(collision):
+	cells = [[[0, 0, 0] for cellX in range(collisionCellCount)] for cellZ in range(collisionCellCount)]
+	for triangles in collision.triangles.values():
+		for triangle in triangles:
+			positions = [collision.vertices[index].position for index in triangle.indices]
+			(x1, y1, z1), (x2, y2, z2), (x3, y3, z3) = positions
+			nx = (y2 - y1) * (z3 - z2) - (z2 - z1) * (y3 - y2)
+			ny = (z2 - z1) * (x3 - x2) - (x2 - x1) * (z3 - z2)
+			nz = (x2 - x1) * (y3 - y2) - (y2 - y1) * (x3 - x2)
+			mag = math.sqrt(nx * nx + ny * ny + nz * nz)
+			if mag < 0.0001:
+				continue
+			ny /= mag
+			surfaceIndex = 0 if ny > 0.01 else (1 if ny < -0.01 else 2)
+
+			xs = [position[0] for position in positions]
+			zs = [position[2] for position in positions]
+			for cellZ in range(lowerCollisionCellIndex(min(zs)), upperCollisionCellIndex(max(zs)) + 1):
+				for cellX in range(lowerCollisionCellIndex(min(xs)), upperCollisionCellIndex(max(xs)) + 1):
+					cells[cellZ][cellX][surfaceIndex] += 1
+	return cells
+
+def getCollisionCellHeatColor(count, maxCount):
+	if count == 0:
+		return (0.1, 0.1, 0.1, 1)
+	t = count / maxCount
+	return (min(1, 2 * t), min(1, 2 * (1 - t)), 0, 1)
+
+# Creates a grid mesh with one face per cell, colored by its surface count, replacing the previous one.
+# location is the world position of the collision origin.
+def createCollisionCellHeatmap(name, cells, location, scaleValue, height):
+	heatmapName = name + '_cell_heatmap'
+	oldObj = bpy.data.objects.get(heatmapName)
+	if oldObj is not None:
+		oldMesh = oldObj.data
+		bpy.data.objects.remove(oldObj)
+		if oldMesh is not None and oldMesh.users == 0:
+			bpy.data.meshes.remove(oldMesh)
+
+	maxCount = max(max(sum(cell) for cell in row) for row in cells)
+	vertices = []
+	faces = []
+	colors = []
+	cellSize = collisionCellSize / scaleValue
+	for cellZ in range(collisionCellCount):
+		for cellX in range(collisionCellCount):
+			# SM64 x, y, z is Blender x, -y, z
+			x = (cellX * collisionCellSize - collisionLevelBoundary) / scaleValue
+			y = -(cellZ * collisionCellSize - collisionLevelBoundary) / scaleValue
+			start = len(vertices)
+			vertices.extend([(x, y, height), (x + cellSize, y, height),
+				(x + cellSize, y - cellSize, height), (x, y - cellSize, height)])
+			faces.append((start, start + 3, start + 2, start + 1))
+			colors.extend(getCollisionCellHeatColor(sum(cells[cellZ][cellX]), maxCount) * 4)
+
+	mesh = bpy.data.meshes.new(heatmapName + '_mesh')
+	mesh.from_pydata(vertices, [], faces)
+	colorLayer = mesh.color_attributes.new('Col', 'FLOAT_COLOR', 'CORNER')
+	colorLayer.data.foreach_set('color', colors)
+	mesh.color_attributes.active_color = colorLayer
+	mesh.update()
+
+	heatmapObj = bpy.data.objects.new(heatmapName, mesh)
+	bpy.context.scene.collection.objects.link(heatmapObj)
+	heatmapObj.location = location
+	heatmapObj.show_in_front = True
+	heatmapObj.ignore_render = True
+	heatmapObj.ignore_collision = True
+	return heatmapObj
 
 class CollisionSettings:
 	def __init__(self):
@@ -449,6 +563,7 @@ class SM64_ExportCollision(bpy.types.Operator):
 	bl_label = "Export Collision"
 	bl_options = {'REGISTER', 'UNDO', 'PRESET'}
 
+	@recordExportStats
 	def execute(self, context):
 		romfileOutput = None
 		tempROM = None
@@ -506,8 +621,9 @@ class SM64_ExportCollision(bpy.types.Operator):
 				romfileExport.close()
 				romfileOutput = open(bpy.path.abspath(tempROM), 'rb+')
 
-				levelParsed = parseLevelAtPointer(romfileOutput, 
-					level_pointers[context.scene.colExportLevel])
+				# The level is parsed before the ROM is modified, so it can be read from memory.
+				with RomReader(bpy.path.abspath(tempROM)) as romReader:
+					levelParsed = parseLevelAtPointer(romReader, level_pointers[context.scene.colExportLevel])
 				segmentData = levelParsed.segmentData
 
 				if context.scene.extendBank4:
@@ -556,6 +672,70 @@ class SM64_ExportCollision(bpy.types.Operator):
 			raisePluginError(self, e)
 			return {'CANCELLED'} # must return a set
 
+class SM64_PreviewCollisionCells(bpy.types.Operator):
+	# set bl_ properties
+	bl_idname = 'object.sm64_preview_collision_cells'
+	bl_label = "Preview Collision Cells"
+	bl_description = "Count the surfaces in each cell of the game's collision grid, " + \
+		"and show them as a heatmap below the selected object"
+	bl_options = {'REGISTER', 'UNDO', 'PRESET'}
+
+	def execute(self, context):
+		obj = None
+		try:
+			if context.mode != 'OBJECT':
+				raise PluginError("Operator can only be used in object mode.")
+			if len(context.selected_objects) == 0:
+				raise PluginError("Object not selected.")
+			obj = context.active_object
+			isArea = obj.data is None and obj.sm64_obj_type == 'Area Root'
+			areaIndex = obj.areaIndex if isArea else None
+			includeChildren = isArea or context.scene.colIncludeChildren
+
+			scaleValue = bpy.context.scene.blenderToSM64Scale
+			finalTransform = mathutils.Matrix.Diagonal(mathutils.Vector((
+				scaleValue, scaleValue, scaleValue))).to_4x4()
+
+			applyRotation([obj], math.radians(90), 'X')
+			try:
+				collision = exportCollisionCommon(obj, finalTransform, False, includeChildren,
+					obj.name, areaIndex)
+			finally:
+				applyRotation([obj], math.radians(-90), 'X')
+
+			if len(collision.vertices) == 0:
+				raise PluginError(obj.name + " has no collision.")
+			cells = getCollisionCellCounts(collision)
+			minY = min(vertex.position[1] for vertex in collision.vertices)
+			createCollisionCellHeatmap(obj.name, cells, obj.matrix_world.translation.copy(),
+				scaleValue, minY / scaleValue - 1)
+			obj.select_set(True)
+			context.view_layer.objects.active = obj
+
+			cellList = [(sum(cells[cellZ][cellX]), cellX, cellZ) for cellZ in range(collisionCellCount) \
+				for cellX in range(collisionCellCount)]
+			cellList.sort(reverse = True)
+			print('Busiest collision cells of ' + obj.name + ' (floors, ceilings, walls):')
+			for total, cellX, cellZ in cellList[:8]:
+				if total == 0:
+					break
+				print('\tx ' + str(cellX * collisionCellSize - collisionLevelBoundary) + \
+					', z ' + str(cellZ * collisionCellSize - collisionLevelBoundary) + ': ' + \
+					str(tuple(cells[cellZ][cellX])))
+
+			total, cellX, cellZ = cellList[0]
+			floors, ceilings, walls = cells[cellZ][cellX]
+			self.report({'INFO'}, 'Busiest cell has ' + str(total) + ' surfaces (' + \
+				str(floors) + ' floors, ' + str(ceilings) + ' ceilings, ' + str(walls) + ' walls).')
+			return {'FINISHED'} # must return a set
+
+		except Exception as e:
+			if obj is not None:
+				obj.select_set(True)
+				context.view_layer.objects.active = obj
+			raisePluginError(self, e)
+			return {'CANCELLED'} # must return a set
+
 class SM64_ExportCollisionPanel(SM64_Panel):
 	bl_idname = "SM64_PT_export_collision"
 	bl_label = "SM64 Collision Exporter"
@@ -565,6 +745,7 @@ class SM64_ExportCollisionPanel(SM64_Panel):
 	def draw(self, context):
 		col = self.layout.column()
 		propsColE = col.operator(SM64_ExportCollision.bl_idname)
+		col.operator(SM64_PreviewCollisionCells.bl_idname)
 
 		col.prop(context.scene, 'colIncludeChildren')
 		
@@ -605,6 +786,7 @@ class SM64_ExportCollisionPanel(SM64_Panel):
 
 sm64_col_classes = (
 	SM64_ExportCollision,
+	SM64_PreviewCollisionCells,
 )
 
 sm64_col_panel_classes = (
@@ -24,7 +24,7 @@ class SM64_ImportDL(bpy.types.Operator):
 			return {'CANCELLED'}
 		try:
 			checkExpanded(bpy.path.abspath(context.scene.importRom))
-			romfileSrc = open(bpy.path.abspath(context.scene.importRom), 'rb')
+			romfileSrc = RomReader(bpy.path.abspath(context.scene.importRom))
 			levelParsed = parseLevelAtPointer(romfileSrc, 
 				level_pointers[context.scene.levelDLImport])
 			segmentData = levelParsed.segmentData
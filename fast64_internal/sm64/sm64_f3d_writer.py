@@ -1,4 +1,5 @@
 import shutil, copy, bpy, cProfile, pstats
+from contextlib import ExitStack
 
 from ..panels import SM64_Panel
 from ..f3d.f3d_writer import *
@@ -17,6 +18,7 @@ from .sm64_constants import (
 )
 from .sm64_level_parser import parseLevelAtPointer
 from .sm64_rom_tweaks import ExtendBank0x04
+from ..export_stats import recordExportStats
 
 
 enumHUDExportLocation = [
@@ -38,6 +40,9 @@ class SM64Model(FModel):
     def getDrawLayerV3(self, obj):
         return int(obj.draw_layer_static)
 
+    def optimizeDisplayListsEnabled(self):
+        return bpy.context.scene.fast64.sm64.optimize_display_lists
+
     def getRenderMode(self, drawLayer):
         cycle1 = getattr(bpy.context.scene.world, "draw_layer_" + str(drawLayer) + "_cycle_1")
         cycle2 = getattr(bpy.context.scene.world, "draw_layer_" + str(drawLayer) + "_cycle_2")
@@ -373,46 +378,48 @@ def sm64ExportF3DtoC(
         scrollName = levelName + "_level_dl_" + name
 
     gfxFormatter = SM64GfxFormatter(ScrollMethod.Vertex)
-    exportData = fModel.to_c(TextureExportSettings(texSeparate, savePNG, texDir, modelDirPath), gfxFormatter)
-    staticData = exportData.staticData
-    dynamicData = exportData.dynamicData
-    texC = exportData.textureData
-
-    scrollData, hasScrolling = fModel.to_c_vertex_scroll(scrollName, gfxFormatter)
-
-    scroll_data = scrollData.source
-    cDefineScroll = scrollData.header
-
-    modifyTexScrollFiles(basePath, modelDirPath, cDefineScroll, scroll_data, hasScrolling)
+    modelPath = os.path.join(modelDirPath, "model.inc.c")
+    headerPath = os.path.join(modelDirPath, "header.h")
+    with ExitStack() as openFiles:
+        # Static data and separate texture data are streamed directly to their files.
+        # They only replace the existing files once the export succeeds.
+        staticData = CDataFileWriter(
+            openFiles.enter_context(openReplacedFile(modelPath)),
+            openFiles.enter_context(openReplacedFile(headerPath)),
+        )
+        texC = CData()
+        if texSeparate:
+            texC = CDataFileWriter(
+                openFiles.enter_context(openReplacedFile(os.path.join(modelDirPath, "texture.inc.c")))
+            )
 
-    if DLFormat == DLFormat.Static:
-        staticData.append(dynamicData)
-    else:
-        geoString = writeMaterialFiles(
-            basePath,
-            modelDirPath,
-            '#include "actors/' + toAlnum(name) + '/header.h"',
-            '#include "actors/' + toAlnum(name) + '/material.inc.h"',
-            dynamicData.header,
-            dynamicData.source,
-            "",
-            customExport,
+        exportData = fModel.to_c(
+            TextureExportSettings(texSeparate, savePNG, texDir, modelDirPath),
+            gfxFormatter,
+            ExportCData(staticData, CData(), texC),
         )
+        dynamicData = exportData.dynamicData
 
-    if texSeparate:
-        texCFile = open(os.path.join(modelDirPath, "texture.inc.c"), "w", newline="\n")
-        texCFile.write(texC.source)
-        texCFile.close()
+        scrollData, hasScrolling = fModel.to_c_vertex_scroll(scrollName, gfxFormatter)
 
-    modelPath = os.path.join(modelDirPath, "model.inc.c")
-    outFile = open(modelPath, "w", newline="\n")
-    outFile.write(staticData.source)
-    outFile.close()
+        scroll_data = scrollData.source
+        cDefineScroll = scrollData.header
 
-    headerPath = os.path.join(modelDirPath, "header.h")
-    cDefFile = open(headerPath, "w", newline="\n")
-    cDefFile.write(staticData.header)
-    cDefFile.close()
+        modifyTexScrollFiles(basePath, modelDirPath, cDefineScroll, scroll_data, hasScrolling)
+
+        if DLFormat == DLFormat.Static:
+            staticData.append(dynamicData)
+        else:
+            geoString = writeMaterialFiles(
+                basePath,
+                modelDirPath,
+                '#include "actors/' + toAlnum(name) + '/header.h"',
+                '#include "actors/' + toAlnum(name) + '/material.inc.h"',
+                dynamicData.header,
+                dynamicData.source,
+                "",
+                customExport,
+            )
 
     fileStatus = None
     if not customExport:
@@ -555,6 +562,7 @@ class SM64_ExportDL(bpy.types.Operator):
 
     # Called on demand (i.e. button press, menu item)
     # Can also be called from operator search menu (Spacebar)
+    @recordExportStats
     def execute(self, context):
         romfileOutput = None
         tempROM = None
@@ -632,7 +640,9 @@ class SM64_ExportDL(bpy.types.Operator):
                 romfileExport.close()
                 romfileOutput = open(bpy.path.abspath(tempROM), "rb+")
 
-                levelParsed = parseLevelAtPointer(romfileOutput, level_pointers[context.scene.levelDLExport])
+                # The level is parsed before the ROM is modified, so it can be read from memory.
+                with RomReader(bpy.path.abspath(tempROM)) as romReader:
+                    levelParsed = parseLevelAtPointer(romReader, level_pointers[context.scene.levelDLExport])
                 segmentData = levelParsed.segmentData
                 if context.scene.extendBank4:
                     ExtendBank0x04(romfileOutput, segmentData, defaultExtendSegment4)
@@ -776,6 +786,7 @@ class ExportTexRectDraw(bpy.types.Operator):
 
     # Called on demand (i.e. button press, menu item)
     # Can also be called from operator search menu (Spacebar)
+    @recordExportStats
     def execute(self, context):
         try:
             if context.scene.texrect.tex is None:
@@ -23,7 +23,6 @@ def parseGeoLayout(romfile, startAddress, scene, segmentData,
 	convertTransformMatrix, useArmature, ignoreSwitch, shadeSmooth,
 	f3dType, isHWv1):
 	currentAddress = startAddress
-	romfile.seek(currentAddress)
 
 	# Create new skinned mesh
 	#bpy.ops.object.mode_set(mode = 'OBJECT')
@@ -128,8 +127,7 @@ def parseNode(romfile, geoStartAddress, currentAddress, currentCmd, jumps,
 	currentTransform = copy.deepcopy(currentTransform)
 	originalTransform = copy.deepcopy(currentTransform)
 	currentAddress += getGeoLayoutCmdLength(*currentCmd)
-	romfile.seek(currentAddress)
-	currentCmd = romfile.read(2)
+	currentCmd = romfile.readAt(currentAddress, 2)
 	armatureMeshGroups = []
 
 	# True if at least one complete node processed.
@@ -305,9 +303,8 @@ def parseNode(romfile, geoStartAddress, currentAddress, currentCmd, jumps,
 		
 		nodeIndex[-1] += 1
 
-		romfile.seek(currentAddress)
 		previousCmdType = currentCmd[0]
-		currentCmd = romfile.read(2)
+		currentCmd = romfile.readAt(currentAddress, 2)
 
 		if previousCmdType not in nodeGroupCmds or \
 			currentCmd[0] != GEO_NODE_OPEN:
@@ -583,8 +580,7 @@ def parseSwitch(romfile, currentAddress, currentTransform,
 	commandSize = 8
 
 	if not ignoreNode:
-		romfile.seek(currentAddress)
-		command = romfile.read(commandSize)
+		command = romfile.readAt(currentAddress, commandSize)
 		funcParam = int.from_bytes(command[2:4], 'big', signed = True)
 		switchFunc = bytesToHexClean(command[4:8])
 
@@ -606,9 +602,8 @@ def parseDL(romfile, currentAddress, currentTransform, bMesh, obj, armatureObj,
 
 	drawLayer = bitMask(currentCmd[1], 0, 4)
 
-	romfile.seek(currentAddress)
 	commandSize = 8
-	command = romfile.read(commandSize)
+	command = romfile.readAt(currentAddress, commandSize)
 
 	if not ignoreNode:
 		boneName = handleNodeCommon(romfile, armatureObj, parentBoneName,
@@ -626,9 +621,8 @@ def parseDLWithOffset(romfile, currentAddress,
 	currentTransform, bMesh, obj, armatureObj, parentBoneName, ignoreNode, nodeIndex, currentCmd, segmentData, vertexBuffer,
 	f3dType, isHWv1):
 	print("DL_OFFSET " + hex(currentAddress))
-	romfile.seek(currentAddress)
 
-	command = romfile.read(getGeoLayoutCmdLength(*currentCmd))
+	command = romfile.readAt(currentAddress, getGeoLayoutCmdLength(*currentCmd))
 
 	drawLayer = command[1]
 
@@ -667,17 +661,14 @@ def parseDLWithOffset(romfile, currentAddress,
 	# Handle child objects
 	# Validate that next command is 04 (open node)
 	currentAddress += getGeoLayoutCmdLength(*currentCmd)
-	romfile.seek(currentAddress) # DONT FORGET THIS, FIXES PARENTING BUG
-	currentCmd = romfile.read(2)
 
 	return currentAddress, boneName, finalTransform
 
 def parseBranch(romfile, currentCmd, currentAddress, jumps,
 	segmentData = None):
 	print("BRANCH " + hex(currentAddress))
-	romfile.seek(currentAddress)
 	postJumpAddr = currentAddress + getGeoLayoutCmdLength(*currentCmd)
-	currentCmd = romfile.read(getGeoLayoutCmdLength(*currentCmd))
+	currentCmd = romfile.readAt(currentAddress, getGeoLayoutCmdLength(*currentCmd))
 
 	if currentCmd[1] == 1:
 		jumps.append(postJumpAddr)
@@ -689,9 +680,8 @@ def parseBranch(romfile, currentCmd, currentAddress, jumps,
 def parseBranchStore(romfile, currentCmd, currentAddress, jumps,
 	segmentData = None):
 	print("BRANCH AND STORE " + hex(currentAddress))
-	romfile.seek(currentAddress)
 	postJumpAddr = currentAddress + getGeoLayoutCmdLength(*currentCmd)
-	currentCmd = romfile.read(getGeoLayoutCmdLength(*currentCmd))
+	currentCmd = romfile.readAt(currentAddress, getGeoLayoutCmdLength(*currentCmd))
 
 	jumps.append(postJumpAddr)
 	currentAddress = decodeSegmentedAddr(currentCmd[4:8],
@@ -736,9 +726,8 @@ def parseScale(romfile, currentAddress, currentCmd, currentTransform,
 	loadDL = bitMask(currentCmd[1], 7, 1)
 	drawLayer = bitMask(currentCmd[1], 0, 4)
 
-	romfile.seek(currentAddress)
 	commandSize = 8 + (4 if loadDL else 0)
-	command = romfile.read(commandSize)
+	command = romfile.readAt(currentAddress, commandSize)
 
 	scale = int.from_bytes(command[4:8], 'big') / 0x10000
 	#finalTransform = currentTransform @ mathutils.Matrix.Scale(scale, 4)
@@ -777,8 +766,7 @@ def parseTranslateRotate(romfile, currentAddress,
 	if loadDL:
 		commandSize += 4
 
-	romfile.seek(currentAddress)
-	command = romfile.read(commandSize)
+	command = romfile.readAt(currentAddress, commandSize)
 
 	if fieldLayout == 0:
 		pos = readVectorFromShorts(command, 4)
@@ -839,8 +827,7 @@ def parseTranslate(romfile, currentAddress,
 	else:
 		commandSize = 8
 
-	romfile.seek(currentAddress)
-	command = romfile.read(commandSize)
+	command = romfile.readAt(currentAddress, commandSize)
 
 	pos = readVectorFromShorts(command, 2)
 	translation = mathutils.Matrix.Translation(
@@ -875,8 +862,7 @@ def parseRotate(romfile, currentAddress,
 	else:
 		commandSize = 8
 
-	romfile.seek(currentAddress)
-	command = romfile.read(commandSize)
+	command = romfile.readAt(currentAddress, commandSize)
 
 	rot = readEulerVectorFromShorts(command, 2)
 	rotation = mathutils.Euler(rot, geoNodeRotateOrder).to_matrix().to_4x4()
@@ -909,8 +895,7 @@ def parseBillboard(romfile, currentAddress,
 	else:
 		commandSize = 8
 
-	romfile.seek(currentAddress)
-	command = romfile.read(commandSize)
+	command = romfile.readAt(currentAddress, commandSize)
 
 	pos = readVectorFromShorts(command, 2)
 	translation = mathutils.Matrix.Translation(
@@ -938,8 +923,7 @@ def parseShadow(romfile, currentAddress, currentTransform,
 	print("SHADOW " + hex(currentAddress))
 	commandSize = 8
 
-	romfile.seek(currentAddress)
-	command = romfile.read(commandSize)
+	command = romfile.readAt(currentAddress, commandSize)
 	shadowType = int.from_bytes(command[2:4], 'big')
 	if str(shadowType) not in enumShadowType:
 		if shadowType > 12 and shadowType < 50: # Square Shadow
@@ -972,7 +956,6 @@ def parseStart(romfile, currentAddress, currentTransform,
 	print("START " + hex(currentAddress))
 	
 	commandSize = 4
-	romfile.seek(currentAddress)
 
 	if not ignoreNode:
 		boneName = format(nodeIndex, '03') + "-start"
@@ -991,8 +974,7 @@ def parseStartWithRenderArea(romfile, currentAddress, currentTransform,
 	print("START W/ RENDER AREA" + hex(currentAddress))
 	
 	commandSize = 4
-	romfile.seek(currentAddress)
-	command = romfile.read(commandSize)
+	command = romfile.readAt(currentAddress, commandSize)
 	cullingRadius = int.from_bytes(command[2:4], 'big') / bpy.context.scene.blenderToSM64Scale
 
 	if not ignoreNode:
@@ -1016,8 +998,7 @@ def parseFunction(romfile, currentAddress, currentTransform,
 
 	commandSize = 8
 
-	romfile.seek(currentAddress)
-	command = romfile.read(commandSize)
+	command = romfile.readAt(currentAddress, commandSize)
 	asmParam = int.from_bytes(command[2:4], 'big', signed = True)
 	asmFunc = bytesToHexClean(command[4:8])
 
@@ -1036,8 +1017,7 @@ def parseHeldObject(romfile, currentAddress, currentTransform,
 	armatureObj, parentBoneName, ignoreNode, nodeIndex, segmentData):
 	print("HELD OBJECT " + hex(currentAddress))
 	commandSize = 12
-	romfile.seek(currentAddress)
-	command = romfile.read(commandSize)
+	command = romfile.readAt(currentAddress, commandSize)
 
 	pos = readVectorFromShorts(command, 2)
 	translation = mathutils.Matrix.Translation(
@@ -1144,7 +1124,7 @@ class SM64_ImportGeolayout(bpy.types.Operator):
 			raisePluginError(self, e)
 			return {'CANCELLED'}
 		try:
-			romfileSrc = open(bpy.path.abspath(importRom), 'rb')
+			romfileSrc = RomReader(bpy.path.abspath(importRom))
 			checkExpanded(bpy.path.abspath(importRom))
 
 			armatureObj = None
@@ -18,6 +18,7 @@ from .sm64_utility import *
 from ..utility import *
 from ..operators import ObjectDataExporter
 from ..panels import SM64_Panel
+from ..export_stats import recordExportStats
 
 
 def appendSecondaryGeolayout(geoDirPath, geoName1, geoName2, additionalNode=""):
@@ -346,12 +347,8 @@ def convertObjectToGeolayout(
             convertTextureData,
         )
         cleanupDuplicatedObjects(allObjs)
-        rootObj.select_set(True)
-        bpy.context.view_layer.objects.active = rootObj
     except Exception as e:
         cleanupDuplicatedObjects(allObjs)
-        rootObj.select_set(True)
-        bpy.context.view_layer.objects.active = rootObj
         raise Exception(str(e))
 
     appendRevertToGeolayout(geolayoutGraph, fModel)
@@ -1933,52 +1930,53 @@ def processSwitchBoneMatOverrides(materialOverrides, switchBone):
             materialOverrides.append((switchOption.materialOverride, specificMat, switchOption.materialOverrideType))
 
 
-def getGroupIndex(vert, armatureObj, obj):
-    actualGroups = []
-    belowLimitGroups = []
-    nonBoneGroups = []
-    for group in vert.groups:
-        groupName = getGroupNameFromIndex(obj, group.group)
-        if groupName is not None:
-            if groupName in armatureObj.data.bones:
-                if group.weight > 0.4:
-                    actualGroups.append(group)
-                else:
+def getSkinnedVertexGroups(obj, armatureObj):
+    """
+    Returns the bone vertex group index of each vertex of obj.
+    Every vertex must have exactly one bone group that is significantly weighted.
+    """
+    vertexBoneGroups = VertexBoneGroups(obj, armatureObj, 0.4, 0.5)
+
+    if len(vertexBoneGroups.invalidVerts) > 0:
+        belowLimitGroups = []
+        nonBoneGroups = []
+        for group in obj.data.vertices[vertexBoneGroups.invalidVerts[0]].groups:
+            groupName = getGroupNameFromIndex(obj, group.group)
+            if groupName is not None:
+                if groupName in armatureObj.data.bones:
                     belowLimitGroups.append(groupName)
-            else:
-                nonBoneGroups.append(groupName)
+                else:
+                    nonBoneGroups.append(groupName)
 
-    if len(actualGroups) == 0:
-        highlightWeightErrors(obj, [vert], "VERT")
+        highlightWeightErrors(obj, [obj.data.vertices[index] for index in vertexBoneGroups.invalidVerts], "VERT")
         raise VertexWeightError(
-            "All vertices must be part of a vertex group, be non-trivially weighted (> 0.4), and the vertex group must correspond to a bone in the armature.\n"
-            + "Groups of the bad vert that don't correspond to a bone: "
+            "All vertices must be part of a vertex group, be non-trivially weighted (> 0.4), and the vertex group must correspond to a bone in the armature. "
+            + str(len(vertexBoneGroups.invalidVerts))
+            + " vertices are not.\n"
+            + "Groups of the first bad vert that don't correspond to a bone: "
             + str(nonBoneGroups)
             + ". If a vert is supposed to belong to this group then either a bone is missing or you have the wrong group.\n"
-            + "Groups of the bad vert below weight limit: "
+            + "Groups of the first bad vert below weight limit: "
             + str(belowLimitGroups)
             + ". If a vert is supposed to belong to one of these groups then make sure to increase its weight."
         )
-    vertGroup = actualGroups[0]
-    significantWeightGroup = None
-    for group in actualGroups:
-        if group.weight > 0.5:
-            if significantWeightGroup is None:
-                significantWeightGroup = group
-            else:
-                highlightWeightErrors(obj, [vert], "VERT")
-                raise VertexWeightError(
-                    "A vertex was found that was significantly weighted to multiple groups. Make sure each vertex only belongs to one group whose weight is greater than 0.5. ("
-                    + getGroupNameFromIndex(obj, group.group)
-                    + ", "
-                    + getGroupNameFromIndex(obj, significantWeightGroup.group)
-                    + ")"
-                )
-        if group.weight > vertGroup.weight:
-            vertGroup = group
-    # if vertGroup not in actualGroups:
-    # raise VertexWeightError("A vertex was found that was primarily weighted to a group that does not correspond to a bone in #the armature. (" + getGroupNameFromIndex(obj, vertGroup.group) + ') Either decrease the weights of this vertex group or remove it. If you think this group should correspond to a bone, make sure to check your spelling.')
-    return vertGroup.group
+
+    if len(vertexBoneGroups.multiWeightedVerts) > 0:
+        groupNames = []
+        for group in obj.data.vertices[vertexBoneGroups.multiWeightedVerts[0]].groups:
+            groupName = getGroupNameFromIndex(obj, group.group)
+            if group.weight > 0.5 and groupName is not None and groupName in armatureObj.data.bones:
+                groupNames.append(groupName)
+        highlightWeightErrors(obj, [obj.data.vertices[index] for index in vertexBoneGroups.multiWeightedVerts], "VERT")
+        raise VertexWeightError(
+            "A vertex was found that was significantly weighted to multiple groups. Make sure each vertex only belongs to one group whose weight is greater than 0.5. ("
+            + groupNames[1]
+            + ", "
+            + groupNames[0]
+            + ")"
+        )
+
+    return vertexBoneGroups.dominantGroups
 
 
 class SimpleSkinnedFace:
@@ -2161,10 +2159,11 @@ def saveModelGivenVertexGroup(
     lastMaterialName = None
 
     mesh = obj.data
+    if infoDict.skinnedVertexGroups is None:
+        infoDict.skinnedVertexGroups = getSkinnedVertexGroups(obj, armatureObj)
+    vertGroups = infoDict.skinnedVertexGroups
     currentGroupIndex = getGroupIndexFromname(obj, vertexGroup)
-    vertIndices = [
-        vert.index for vert in obj.data.vertices if getGroupIndex(vert, armatureObj, obj) == currentGroupIndex
-    ]
+    vertIndices = [vertIndex for vertIndex, groupIndex in enumerate(vertGroups) if groupIndex == currentGroupIndex]
     parentGroupIndex = getGroupIndexFromname(obj, parentGroup) if parentGroup is not None else -1
 
     if len(vertIndices) == 0:
@@ -2206,7 +2205,7 @@ def saveModelGivenVertexGroup(
 
             # loop is interpreted as face + loop index
             for i in range(3):
-                vertGroupIndex = getGroupIndex(mesh.vertices[face.vertices[i]], armatureObj, obj)
+                vertGroupIndex = vertGroups[face.vertices[i]]
                 if vertGroupIndex not in ancestorGroups:
                     ancestorGroups[vertGroupIndex] = getAncestorGroups(parentGroup, vertexGroup, armatureObj, obj)
 
@@ -2702,6 +2701,7 @@ class SM64_ExportGeolayoutObject(ObjectDataExporter):
 
     # Called on demand (i.e. button press, menu item)
     # Can also be called from operator search menu (Spacebar)
+    @recordExportStats
     def execute(self, context):
         romfileOutput = None
         tempROM = None
@@ -2783,7 +2783,9 @@ class SM64_ExportGeolayoutObject(ObjectDataExporter):
                 romfileExport.close()
                 romfileOutput = open(bpy.path.abspath(tempROM), "rb+")
 
-                levelParsed = parseLevelAtPointer(romfileOutput, level_pointers[context.scene.levelGeoExport])
+                # The level is parsed before the ROM is modified, so it can be read from memory.
+                with RomReader(bpy.path.abspath(tempROM)) as romReader:
+                    levelParsed = parseLevelAtPointer(romReader, level_pointers[context.scene.levelGeoExport])
                 segmentData = levelParsed.segmentData
 
                 if context.scene.extendBank4:
@@ -2887,6 +2889,7 @@ class SM64_ExportGeolayoutArmature(bpy.types.Operator):
 
     # Called on demand (i.e. button press, menu item)
     # Can also be called from operator search menu (Spacebar)
+    @recordExportStats
     def execute(self, context):
         romfileOutput = None
         tempROM = None
@@ -2996,7 +2999,9 @@ class SM64_ExportGeolayoutArmature(bpy.types.Operator):
                 romfileExport.close()
                 romfileOutput = open(bpy.path.abspath(tempROM), "rb+")
 
-                levelParsed = parseLevelAtPointer(romfileOutput, level_pointers[context.scene.levelGeoExport])
+                # The level is parsed before the ROM is modified, so it can be read from memory.
+                with RomReader(bpy.path.abspath(tempROM)) as romReader:
+                    levelParsed = parseLevelAtPointer(romReader, level_pointers[context.scene.levelGeoExport])
                 segmentData = levelParsed.segmentData
 
                 if context.scene.extendBank4:
@@ -10,8 +10,7 @@ from ..utility import *
 def parseLevelAtPointer(romfile, pointerAddress):
 	segmentData = parseCommonSegmentLoad(romfile)
 
-	romfile.seek(pointerAddress)
-	command = romfile.read(16)
+	command = romfile.readAt(pointerAddress, 16)
 	segment = command[3]
 	segmentStart = int.from_bytes(command[4:8], 'big')
 	segmentEnd = int.from_bytes(command[8:12], 'big')
@@ -31,8 +30,7 @@ def parseLevelAtPointer(romfile, pointerAddress):
 def parseCommonSegmentLoad(romfile):
 	segmentData = copy.deepcopy(mainLevelLoadScriptSegment)
 	for segment, pointer in loadSegmentAddresses.items():
-		romfile.seek(pointer)
-		command = romfile.read(12)
+		command = romfile.readAt(pointer, 12)
 		
 		segment = command[3]
 		segmentStart = int.from_bytes(command[4:8], 'big')
@@ -43,13 +41,13 @@ def parseCommonSegmentLoad(romfile):
 	return segmentData
 
 # second byte = command length
+def readLevelCommand(romfile, address):
+	return romfile.readAt(address, romfile.readAt(address + 1, 1)[0])
+
 def parseLevel(romfile, startAddress, segmentData):
 	currentAddress = startAddress
 
-	romfile.seek(currentAddress)
-	currentCmd = romfile.read(2)
-	romfile.seek(currentAddress) # second seek is because reading moves read pointer forward	
-	currentCmd = romfile.read(currentCmd[1])
+	currentCmd = readLevelCommand(romfile, currentAddress)
 	#currentAddress += currentCmd[1]
 
 	scriptStack = [currentAddress]
@@ -74,10 +72,7 @@ def parseLevel(romfile, startAddress, segmentData):
 
 		elif currentCmd[0] == L_POP:
 			currentAddress = scriptStack.pop()
-			romfile.seek(currentAddress)
-			currentCmd = romfile.read(2)
-			romfile.seek(currentAddress)
-			currentCmd = romfile.read(currentCmd[1])
+			currentCmd = readLevelCommand(romfile, currentAddress)
 			currentAddress += currentCmd[1]
 			#print([hex(value) for value in scriptStack])
 
@@ -154,10 +149,7 @@ def parseLevel(romfile, startAddress, segmentData):
 
 		if currentCmd[0] != L_PUSH and currentCmd[0] != L_JUMP and currentCmd[0] != L_POP:
 			currentAddress += currentCmd[1]
-		romfile.seek(currentAddress)
-		currentCmd = romfile.read(2)
-		romfile.seek(currentAddress)
-		currentCmd = romfile.read(currentCmd[1])
+		currentCmd = readLevelCommand(romfile, currentAddress)
 		#currentAddress += currentCmd[1]
 
 	return currentLevel
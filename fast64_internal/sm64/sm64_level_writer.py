@@ -12,6 +12,7 @@ from .sm64_utility import *
 from ..utility import *
 from ..panels import SM64_Panel
 from ..operators import ObjectDataExporter
+from ..export_stats import recordExportStats
 
 levelDefineArgs = {
     "internal name": 0,
@@ -1064,6 +1065,7 @@ class SM64_ExportLevel(ObjectDataExporter):
     bl_label = "Export Level"
     bl_options = {"REGISTER", "UNDO", "PRESET"}
 
+    @recordExportStats
     def execute(self, context):
 
         try:
@@ -356,8 +356,13 @@ class SM64_Special_Object:
         self.position = position
         self.rotation = rotation
 
+    def size(self):
+        if self.rotation is None:
+            return 8
+        return 10 if self.bparam is None else 12
+
     def to_binary(self):
-        data = int(self.preset).to_bytes(2, "big")
+        data = bytearray(int(self.preset).to_bytes(2, "big"))
         if len(self.position) > 3:
             raise PluginError("Object position should not be " + str(len(self.position) + " fields long."))
         for index in self.position:
@@ -2,6 +2,7 @@ from .sm64_constants import *
 from bpy.utils import register_class, unregister_class
 import bpy, bmesh
 from ..utility import *
+from ..export_stats import recordExportStats
 
 enumSplineTypes = [
 	("Trajectory", "Trajectory", "Exports to Trajectory[]. Used for movement"),
@@ -88,6 +89,7 @@ class SM64_ExportSpline(bpy.types.Operator):
 	bl_label = "Export Spline"
 	bl_options = {'REGISTER', 'UNDO'} 
 
+	@recordExportStats
 	def execute(self, context):
 		context.object.sm64_special_enum = self.sm64_special_enum
 		bpy.context.region.tag_redraw()
@@ -1,8 +1,15 @@
-import bpy, random, string, os, math, traceback, re, os, mathutils
+import bpy, bmesh, random, string, os, math, traceback, re, os, mathutils, mmap, array, struct
 from math import pi, ceil, degrees, radians
 from mathutils import *
 from .utility_anim import *
 from typing import Callable, Iterable
+from contextlib import contextmanager
+from .export_stats import timedExportPhase
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class PluginError(Exception):
@@ -104,6 +111,24 @@ def writeFile(filepath, data):
     datafile.close()
 
 
+@contextmanager
+def openReplacedFile(filepath):
+    """
+    Opens a temporary text file that replaces filepath once the block finishes without an error,
+    so a failed export leaves the existing file intact.
+    """
+    tempPath = filepath + ".tmp"
+    datafile = open(tempPath, "w", newline="\n", encoding="utf-8")
+    try:
+        yield datafile
+    except BaseException:
+        datafile.close()
+        os.remove(tempPath)
+        raise
+    datafile.close()
+    os.replace(tempPath, filepath)
+
+
 def checkObjectReference(obj, title):
     if obj.name not in bpy.context.view_layer.objects:
         raise PluginError(
@@ -167,6 +192,89 @@ def getGroupNameFromIndex(obj, index):
     return None
 
 
+class VertexBoneGroups:
+    """
+    Classification of every vertex of a skinned mesh by its vertex groups that correspond to bones of an armature.
+    The weights are read once into flat arrays, so that all vertices are classified in one pass
+    instead of resolving group names for each vertex lookup.
+    """
+
+    def __init__(self, obj: bpy.types.Object, armatureObj: bpy.types.Object, minWeight=None, significantWeight=None):
+        """
+        minWeight: bone groups need a weight above this to count, or any weight if None.
+        significantWeight: if set, vertices with more than one bone group above this weight are collected.
+        """
+        # whether each vertex group index corresponds to a bone
+        self.isBoneGroup = [group.name in armatureObj.data.bones for group in obj.vertex_groups]
+        # group of the highest weight that counts for each vertex, or None, preferring the first group on ties
+        self.dominantGroups = [None] * len(obj.data.vertices)
+        # indices of vertices without any group that counts
+        self.invalidVerts = []
+        # indices of vertices with more than one group above significantWeight
+        self.multiWeightedVerts = []
+
+        vertIndices = []
+        groupIndices = []
+        weights = []
+        for vert in obj.data.vertices:
+            for group in vert.groups:
+                vertIndices.append(vert.index)
+                groupIndices.append(group.group)
+                weights.append(group.weight)
+
+        if np is not None:
+            self.classifyNumpy(vertIndices, groupIndices, weights, minWeight, significantWeight)
+        else:
+            self.classifyPython(vertIndices, groupIndices, weights, minWeight, significantWeight)
+
+    def classifyNumpy(self, vertIndices, groupIndices, weights, minWeight, significantWeight):
+        vertCount = len(self.dominantGroups)
+        vertIndices = np.array(vertIndices, dtype=np.int64)
+        groupIndices = np.array(groupIndices, dtype=np.int64)
+        # Weights are compared in double precision, like the float values read from each group.
+        weights = np.array(weights, dtype=np.float64)
+
+        # Groups can refer to removed vertex groups, which do not correspond to anything.
+        isBoneGroup = np.array(self.isBoneGroup + [False], dtype=bool)
+        valid = isBoneGroup[np.minimum(groupIndices, len(self.isBoneGroup))]
+        if minWeight is not None:
+            valid &= weights > minWeight
+        vertIndices = vertIndices[valid]
+        groupIndices = groupIndices[valid]
+        weights = weights[valid]
+
+        # lexsort is stable, so the first group of the highest weight of each vertex comes first.
+        order = np.lexsort((-weights, vertIndices))
+        sortedVerts = vertIndices[order]
+        isFirst = np.ones(len(order), dtype=bool)
+        isFirst[1:] = sortedVerts[1:] != sortedVerts[:-1]
+        dominantGroups = np.full(vertCount, -1, dtype=np.int64)
+        dominantGroups[sortedVerts[isFirst]] = groupIndices[order][isFirst]
+
+        self.dominantGroups = [None if group < 0 else group for group in dominantGroups.tolist()]
+        self.invalidVerts = np.flatnonzero(dominantGroups < 0).tolist()
+        if significantWeight is not None:
+            significantCounts = np.bincount(vertIndices[weights > significantWeight], minlength=vertCount)
+            self.multiWeightedVerts = np.flatnonzero(significantCounts > 1).tolist()
+
+    def classifyPython(self, vertIndices, groupIndices, weights, minWeight, significantWeight):
+        dominantWeights = [None] * len(self.dominantGroups)
+        significantCounts = [0] * len(self.dominantGroups)
+        for vertIndex, groupIndex, weight in zip(vertIndices, groupIndices, weights):
+            if groupIndex >= len(self.isBoneGroup) or not self.isBoneGroup[groupIndex]:
+                continue
+            if minWeight is not None and weight <= minWeight:
+                continue
+            if dominantWeights[vertIndex] is None or weight > dominantWeights[vertIndex]:
+                dominantWeights[vertIndex] = weight
+                self.dominantGroups[vertIndex] = groupIndex
+            if significantWeight is not None and weight > significantWeight:
+                significantCounts[vertIndex] += 1
+
+        self.invalidVerts = [vertIndex for vertIndex, group in enumerate(self.dominantGroups) if group is None]
+        self.multiWeightedVerts = [vertIndex for vertIndex, count in enumerate(significantCounts) if count > 1]
+
+
 def copyPropertyCollection(oldProp, newProp):
     newProp.clear()
     for item in oldProp:
@@ -293,36 +401,157 @@ def propertyGroupEquals(oldProp, newProp):
     return equivalent
 
 
+def hashablePropertyValue(value):
+    if value is None or isinstance(value, (str, int, float, bool, bpy.types.ID)):
+        return value
+    elif isinstance(value, set):
+        # Enum flag properties
+        return frozenset(value)
+    else:
+        return tuple(hashablePropertyValue(item) for item in value)
+
+
+def propertyGroupFingerprint(prop):
+    """
+    Returns a hashable value, which is equal for property groups that propertyGroupEquals considers equal.
+    Like propertyGroupEquals, collection properties are not compared.
+    """
+    values = []
+    for sub_value_attr in prop.bl_rna.properties.keys():
+        if sub_value_attr == "rna_type":
+            continue
+        sub_value = getattr(prop, sub_value_attr)
+        if isinstance(sub_value, bpy.types.PropertyGroup):
+            values.append(propertyGroupFingerprint(sub_value))
+        elif type(sub_value).__name__ == "bpy_prop_collection_idprop":
+            continue
+        else:
+            values.append(hashablePropertyValue(sub_value))
+    return tuple(values)
+
+
+@timedExportPhase("File Writes")
 def writeCData(data, headerPath, sourcePath):
     sourceFile = open(sourcePath, "w", newline="\n", encoding="utf-8")
-    sourceFile.write(data.source)
+    sourceFile.writelines(data.sourceParts)
     sourceFile.close()
 
     headerFile = open(headerPath, "w", newline="\n", encoding="utf-8")
-    headerFile.write(data.header)
+    headerFile.writelines(data.headerParts)
     headerFile.close()
 
 
+@timedExportPhase("File Writes")
 def writeCDataSourceOnly(data, sourcePath):
     sourceFile = open(sourcePath, "w", newline="\n", encoding="utf-8")
-    sourceFile.write(data.source)
+    sourceFile.writelines(data.sourceParts)
     sourceFile.close()
 
 
+@timedExportPhase("File Writes")
 def writeCDataHeaderOnly(data, headerPath):
     headerFile = open(headerPath, "w", newline="\n", encoding="utf-8")
-    headerFile.write(data.header)
+    headerFile.writelines(data.headerParts)
     headerFile.close()
 
 
 class CData:
+    """
+    C source and header text.
+    Text is stored as a list of parts, which are only joined when source / header is read.
+    Large outputs should be built with write_source / write_header / append, which never copy existing text.
+    """
+
     def __init__(self):
-        self.source = ""
-        self.header = ""
+        self.sourceParts = []
+        self.headerParts = []
+
+    @property
+    def source(self):
+        if len(self.sourceParts) > 1:
+            self.sourceParts = ["".join(self.sourceParts)]
+        return self.sourceParts[0] if len(self.sourceParts) > 0 else ""
+
+    @source.setter
+    def source(self, value):
+        self.sourceParts = [value]
+
+    @property
+    def header(self):
+        if len(self.headerParts) > 1:
+            self.headerParts = ["".join(self.headerParts)]
+        return self.headerParts[0] if len(self.headerParts) > 0 else ""
+
+    @header.setter
+    def header(self, value):
+        self.headerParts = [value]
+
+    def write_source(self, text):
+        self.sourceParts.append(text)
+
+    def write_header(self, text):
+        self.headerParts.append(text)
+
+    def extend_source(self, parts):
+        self.sourceParts.extend(parts)
+
+    def extend_header(self, parts):
+        self.headerParts.extend(parts)
 
     def append(self, other):
-        self.source += other.source
-        self.header += other.header
+        self.extend_source(other.sourceParts)
+        self.extend_header(other.headerParts)
+
+
+class CDataFileParts:
+    """
+    Stands in for the part list of a CData, writing each part to a file as soon as it is added.
+    """
+
+    def __init__(self, file, name):
+        self.file = file
+        self.name = name
+
+    def getFile(self):
+        if self.file is None:
+            raise PluginError(f"C data is being written to a file, but no {self.name} file was provided.")
+        return self.file
+
+    def append(self, text):
+        self.getFile().write(text)
+
+    def extend(self, parts):
+        self.getFile().writelines(parts)
+
+    def __iter__(self):
+        raise PluginError(f"C {self.name} data has been written to a file and cannot be read back.")
+
+
+class CDataFileWriter(CData):
+    """
+    CData sink that streams text to open files instead of keeping it in memory.
+    Data can only be added with write_source / write_header / extend_source / extend_header / append.
+    """
+
+    def __init__(self, sourceFile, headerFile=None):
+        self.sourceParts = CDataFileParts(sourceFile, "source")
+        self.headerParts = CDataFileParts(headerFile, "header")
+
+    @property
+    def source(self):
+        raise PluginError("C source data has been written to a file and cannot be read back.")
+
+    @source.setter
+    def source(self, value):
+        raise PluginError("C source data has been written to a file and cannot be replaced.")
+
+    @property
+    def header(self):
+        raise PluginError("C header data has been written to a file and cannot be read back.")
+
+    @header.setter
+    def header(self, value):
+        raise PluginError("C header data has been written to a file and cannot be replaced.")
 
 
 def getObjectFromData(data):
@@ -403,6 +632,219 @@ def findStartBones(armatureObj):
         )
 
 
+def setFCurveKeyframes(fcurve, values):
+    """
+    Keys values on consecutive frames starting at 0, adding all keyframes at once instead of inserting them one by one.
+    Constant channels are keyed on a single frame.
+    """
+    values = list(values)
+    if len(values) == 0:
+        return
+    if all(value == values[0] for value in values):
+        values = values[:1]
+
+    coordinates = [0.0] * (2 * len(values))
+    coordinates[0::2] = range(len(values))
+    coordinates[1::2] = values
+
+    fcurve.keyframe_points.add(len(values))
+    fcurve.keyframe_points.foreach_set("co", coordinates)
+    # Sorts keyframes and recalculates handles once for the whole curve
+    fcurve.update()
+
+
+enumAnimExportActions = [
+    ("Active", "Active Action", "Export the active action of the armature"),
+    ("All", "All Actions", "Export every action that animates bones of the armature"),
+    ("NLA", "NLA Track Actions", "Export the actions of the armature's unmuted NLA strips"),
+]
+
+
+def getArmatureActions(armatureObj, actionSource):
+    """
+    Returns the actions to export for an enumAnimExportActions value.
+    """
+    animData = armatureObj.animation_data
+    if actionSource == "Active":
+        if animData is None or animData.action is None:
+            raise PluginError("No active animation selected.")
+        return [animData.action]
+    elif actionSource == "NLA":
+        actions = []
+        if animData is not None:
+            for track in animData.nla_tracks:
+                if track.mute:
+                    continue
+                for strip in track.strips:
+                    if strip.action is not None and strip.action not in actions:
+                        actions.append(strip.action)
+    else:
+        bonePaths = {poseBone.path_from_id() for poseBone in armatureObj.pose.bones}
+        actions = [
+            action
+            for action in bpy.data.actions
+            if any(fcurve.data_path.rpartition(".")[0] in bonePaths for fcurve in action.fcurves)
+        ]
+
+    if len(actions) == 0:
+        raise PluginError("No actions found to export for " + armatureObj.name + ".")
+    return actions
+
+
+def iterArmatureActions(armatureObj, actions):
+    """
+    Makes each action the active action of the armature in turn, with NLA evaluation disabled,
+    and restores the previous action afterwards.
+    """
+    if armatureObj.animation_data is None:
+        armatureObj.animation_data_create()
+    animData = armatureObj.animation_data
+    prevAction = animData.action
+    prevUseNLA = animData.use_nla
+    try:
+        if len(actions) > 1 or actions[0] != prevAction:
+            animData.use_nla = False
+        for action in actions:
+            animData.action = action
+            yield action
+    finally:
+        animData.action = prevAction
+        animData.use_nla = prevUseNLA
+
+
+class ArmaturePoseSampler:
+    """
+    Samples the armature space pose bone matrices of an armature's active action over a range of frames.
+    The action's F-curves are evaluated and chained down the bone hierarchy directly,
+    so that the scene doesn't have to be re-evaluated for every frame.
+    Falls back to scene.frame_set when drivers, constraints, NLA tracks or non default bone inheritance
+    could change the result.
+    The bone hierarchy and rest matrices are only computed once, so a sampler can be reused for every action
+    of an armature.
+    """
+
+    def __init__(self, armatureObj):
+        self.armatureObj = armatureObj
+        bones = armatureObj.data.bones
+        poseBones = armatureObj.pose.bones
+
+        # Parents have to be evaluated before their children
+        self.boneOrder = []
+        boneStack = [bone for bone in bones if bone.parent is None]
+        while len(boneStack) > 0:
+            bone = boneStack.pop()
+            self.boneOrder.append(bone.name)
+            boneStack.extend(bone.children)
+
+        self.restOffsets = {}  # bone name : rest matrix relative to parent
+        self.defaults = {}  # bone name : {property : list of values}, for channels without F-curves
+        self.pathToBoneName = {}
+        for bone in bones:
+            if bone.parent is not None:
+                self.restOffsets[bone.name] = bone.parent.matrix_local.inverted() @ bone.matrix_local
+            else:
+                self.restOffsets[bone.name] = bone.matrix_local.copy()
+
+            poseBone = poseBones[bone.name]
+            self.defaults[bone.name] = {
+                "location": list(poseBone.location),
+                "rotation_quaternion": list(poseBone.rotation_quaternion),
+                "rotation_euler": list(poseBone.rotation_euler),
+                "rotation_axis_angle": list(poseBone.rotation_axis_angle),
+                "scale": list(poseBone.scale),
+            }
+            self.pathToBoneName[poseBone.path_from_id()] = bone.name
+
+    def getFallbackReason(self, anim):
+        animData = self.armatureObj.animation_data
+        if animData is None or animData.action != anim:
+            return "action is not active"
+        if len(animData.drivers) > 0:
+            return "armature has drivers"
+        if animData.use_nla and any(not track.mute and len(track.strips) > 0 for track in animData.nla_tracks):
+            return "armature has NLA tracks"
+        if (
+            getattr(animData, "action_influence", 1) < 1
+            or getattr(animData, "action_blend_type", "REPLACE") != "REPLACE"
+        ):
+            return "action is blended"
+        for poseBone in self.armatureObj.pose.bones:
+            if any(not constraint.mute and constraint.influence > 0 for constraint in poseBone.constraints):
+                return 'bone "' + poseBone.name + '" has constraints'
+            bone = poseBone.bone
+            if (
+                not bone.use_inherit_rotation
+                or getattr(bone, "inherit_scale", "FULL") != "FULL"
+                or not getattr(bone, "use_inherit_scale", True)
+                or not bone.use_local_location
+                or bone.use_relative_parent
+            ):
+                return 'bone "' + poseBone.name + '" has non default inheritance'
+        return None
+
+    def getChannels(self, anim):
+        """
+        Returns a dict of bone name : [(property, index, fcurve)].
+        """
+        channels = {boneName: [] for boneName in self.defaults}
+        for fcurve in anim.fcurves:
+            if fcurve.mute:
+                continue
+            path, _, propertyName = fcurve.data_path.rpartition(".")
+            if path in self.pathToBoneName and propertyName in self.defaults[self.pathToBoneName[path]]:
+                channels[self.pathToBoneName[path]].append((propertyName, fcurve.array_index, fcurve))
+        return channels
+
+    def getBasisMatrix(self, boneName, boneChannels, frame):
+        values = {propertyName: list(value) for propertyName, value in self.defaults[boneName].items()}
+        for propertyName, index, fcurve in boneChannels:
+            values[propertyName][index] = fcurve.evaluate(frame)
+
+        rotationMode = self.armatureObj.pose.bones[boneName].rotation_mode
+        if rotationMode == "QUATERNION":
+            rotation = mathutils.Quaternion(values["rotation_quaternion"]).normalized().to_matrix()
+        elif rotationMode == "AXIS_ANGLE":
+            angle, axis = values["rotation_axis_angle"][0], mathutils.Vector(values["rotation_axis_angle"][1:])
+            rotation = mathutils.Matrix.Rotation(angle, 3, axis) if axis.length > 0 else mathutils.Matrix.Identity(3)
+        else:
+            rotation = mathutils.Euler(values["rotation_euler"], rotationMode).to_matrix()
+
+        return (
+            mathutils.Matrix.Translation(values["location"])
+            @ rotation.to_4x4()
+            @ mathutils.Matrix.Diagonal(values["scale"]).to_4x4()
+        )
+
+    def getPoseMatrices(self, channels, frame):
+        poseMatrices = {}
+        bones = self.armatureObj.data.bones
+        for boneName in self.boneOrder:
+            parent = bones[boneName].parent
+            matrix = self.restOffsets[boneName] @ self.getBasisMatrix(boneName, channels[boneName], frame)
+            poseMatrices[boneName] = poseMatrices[parent.name] @ matrix if parent is not None else matrix
+        return poseMatrices
+
+    def sampleFrames(self, anim, frames):
+        """
+        Yields a dict of bone name : pose matrix for each frame.
+        """
+        fallbackReason = self.getFallbackReason(anim)
+        if fallbackReason is None:
+            channels = self.getChannels(anim)
+            for frame in frames:
+                yield self.getPoseMatrices(channels, frame)
+            return
+
+        print("Sampling animation with frame_set, since " + fallbackReason + ".")
+        currentFrame = bpy.context.scene.frame_current
+        try:
+            for frame in frames:
+                bpy.context.scene.frame_set(frame)
+                yield {poseBone.name: poseBone.matrix.copy() for poseBone in self.armatureObj.pose.bones}
+        finally:
+            bpy.context.scene.frame_set(currentFrame)
+
+
 def getDataFromFile(filepath):
     if not os.path.exists(filepath):
         raise PluginError('Path "' + filepath + '" does not exist.')
@@ -745,18 +1187,14 @@ def copy_object_and_apply(obj: bpy.types.Object, apply_scale=False, apply_modifi
     obj_copy.location = mathutils.Vector([0.0, 0.0, 0.0])
     obj_copy.scale = mathutils.Vector([1.0, 1.0, 1.0])
     obj_copy.rotation_quaternion = mathutils.Quaternion([1, 0, 0, 0])
-    obj_copy.data = obj_copy.data.copy()
 
-    if apply_modifiers:
-        # In order to correctly apply modifiers, we have to go through blender and add the object to the collection, then apply modifiers
-        prev_active = bpy.context.view_layer.objects.active
-        bpy.context.collection.objects.link(obj_copy)
-        obj_copy.select_set(True)
-        bpy.context.view_layer.objects.active = obj_copy
-        for modifier in obj_copy.modifiers:
-            attemptModifierApply(modifier)
-
-        bpy.context.view_layer.objects.active = prev_active
+    if apply_modifiers and isinstance(obj.data, bpy.types.Mesh):
+        # The evaluated mesh already has the modifiers applied, so the copy never has to be linked to the scene
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        obj_copy.data = getEvaluatedMeshCopy(obj, depsgraph, mathutils.Matrix.Identity(4))
+        obj_copy.modifiers.clear()
+    else:
+        obj_copy.data = obj_copy.data.copy()
 
     mtx = transform_mtx_blender_to_n64()
     if apply_scale:
@@ -816,43 +1254,70 @@ def get_obj_temp_mesh(obj):
             return o
 
 
+def getEvaluatedMeshCopy(obj: bpy.types.Object, depsgraph, transformMatrix: mathutils.Matrix):
+    """
+    Returns a new mesh of obj as it is evaluated in depsgraph, i.e. with its modifiers applied,
+    transformed by transformMatrix. The scene is not changed, and the mesh should be removed by the caller.
+    """
+    mesh = bpy.data.meshes.new_from_object(
+        obj.evaluated_get(depsgraph), preserve_all_data_layers=True, depsgraph=depsgraph
+    )
+    mesh.transform(transformMatrix)
+    if transformMatrix.is_negative:
+        # Mesh.transform does not flip faces for negative scale, unlike applying transforms on objects
+        bMesh = bmesh.new()
+        bMesh.from_mesh(mesh)
+        bmesh.ops.reverse_faces(bMesh, faces=bMesh.faces[:])
+        bMesh.to_mesh(mesh)
+        bMesh.free()
+    return mesh
+
+
+@timedExportPhase("Object Duplication")
 def duplicateHierarchy(obj, ignoreAttr, includeEmpties, areaIndex):
-    # Duplicate objects to apply scale / modifiers / linked data
-    bpy.ops.object.select_all(action="DESELECT")
-    selectMeshChildrenOnly(obj, None, includeEmpties, areaIndex)
-    obj.select_set(True)
-    bpy.context.view_layer.objects.active = obj
-    bpy.ops.object.duplicate()
+    """
+    Copies obj and the descendants selectMeshChildrenOnly would select, with modifiers applied and
+    world rotation / scale applied to their data, so that each copy is only translated relative to its parent.
+    The copies are not linked to the scene, so neither the scene nor the selection is changed.
+    Returns the copy of obj and a list of all copies, which should be removed with cleanupDuplicatedObjects.
+    """
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+
+    # Hidden objects are left out, like they would be when duplicating the selection.
+    objs = [child for child in getMeshChildrenOnly(obj, None, includeEmpties, areaIndex) if child.visible_get()]
+    if obj not in objs:
+        objs.insert(0, obj)
+
+    # original object : copy, with parents before their children
+    copies = {}
     try:
-        tempObj = bpy.context.view_layer.objects.active
-        allObjs = bpy.context.selected_objects
-
-        bpy.ops.object.make_single_user(obdata=True)
-        bpy.ops.object.transform_apply(location=False, rotation=True, scale=True, properties=False)
-
-        for selectedObj in allObjs:
-            bpy.ops.object.select_all(action="DESELECT")
-            selectedObj.select_set(True)
-            bpy.context.view_layer.objects.active = selectedObj
-
-            for modifier in selectedObj.modifiers:
-                attemptModifierApply(modifier)
-        for selectedObj in allObjs:
-            if ignoreAttr is not None and getattr(selectedObj, ignoreAttr):
-                for child in selectedObj.children:
-                    bpy.ops.object.select_all(action="DESELECT")
-                    child.select_set(True)
-                    bpy.context.view_layer.objects.active = child
-                    bpy.ops.object.parent_clear(type="CLEAR_KEEP_TRANSFORM")
-                    selectedObj.parent.select_set(True)
-                    bpy.context.view_layer.objects.active = selectedObj.parent
-                    bpy.ops.object.parent_set(keep_transform=True)
-                selectedObj.parent = None
-        return tempObj, allObjs
+        for original in objs:
+            evaluatedMatrix = original.evaluated_get(depsgraph).matrix_world
+            mesh = None
+            if isinstance(original.data, bpy.types.Mesh):
+                mesh = getEvaluatedMeshCopy(original, depsgraph, evaluatedMatrix.to_3x3().to_4x4())
+            copy = original.copy()
+            copies[original] = copy
+            if mesh is not None:
+                copy.data = mesh
+            copy.original_name = original.name
+            copy.modifiers.clear()
+            copy.constraints.clear()
+            copy.parent = copies.get(original.parent, original.parent)
+            copy.matrix_world = mathutils.Matrix.Translation(evaluatedMatrix.translation)
+
+        if ignoreAttr is not None:
+            for original, copy in copies.items():
+                if getattr(original, ignoreAttr):
+                    for child in [child for child in copies.values() if child.parent == copy]:
+                        childMatrix = child.matrix_world.copy()
+                        child.parent = copy.parent
+                        child.matrix_world = childMatrix
+                    copy.parent = None
+
+        return copies[obj], list(copies.values())
     except Exception as e:
-        cleanupDuplicatedObjects(allObjs)
-        obj.select_set(True)
-        bpy.context.view_layer.objects.active = obj
+        cleanupDuplicatedObjects(list(copies.values()))
         raise Exception(str(e))
 
 
@@ -887,21 +1352,32 @@ def checkSM64EmptyUsesGeoLayout(sm64_obj_type):
     return sm64_obj_type in enumSM64EmptyWithGeolayout or checkIsSM64InlineGeoLayout(sm64_obj_type)
 
 
-def selectMeshChildrenOnly(obj, ignoreAttr, includeEmpties, areaIndex):
+def getMeshChildrenOnly(obj, ignoreAttr, includeEmpties, areaIndex, objs=None):
+    """
+    Returns the objects selectMeshChildrenOnly would select, with parents before their children.
+    """
+    if objs is None:
+        objs = []
     checkArea = areaIndex is not None and obj.data is None
     if checkArea and obj.sm64_obj_type == "Area Root" and obj.areaIndex != areaIndex:
-        return
+        return objs
     ignoreObj = ignoreAttr is not None and getattr(obj, ignoreAttr)
     isMesh = isinstance(obj.data, bpy.types.Mesh)
     isEmpty = obj.data is None and includeEmpties and checkSM64EmptyUsesGeoLayout(obj.sm64_obj_type)
     if (isMesh or isEmpty) and not ignoreObj:
-        obj.select_set(True)
-        obj.original_name = obj.name
+        objs.append(obj)
     for child in obj.children:
         if checkArea and obj.sm64_obj_type == "Level Root":
             if not (child.data is None and child.sm64_obj_type == "Area Root"):
                 continue
-        selectMeshChildrenOnly(child, ignoreAttr, includeEmpties, areaIndex)
+        getMeshChildrenOnly(child, ignoreAttr, includeEmpties, areaIndex, objs)
+    return objs
+
+
+def selectMeshChildrenOnly(obj, ignoreAttr, includeEmpties, areaIndex):
+    for child in getMeshChildrenOnly(obj, ignoreAttr, includeEmpties, areaIndex):
+        child.select_set(True)
+        child.original_name = child.name
 
 
 def cleanupDuplicatedObjects(selected_objects):
@@ -936,63 +1412,182 @@ def cleanupTempMeshes():
             bpy.data.curves.remove(data)
 
 
+def readMeshValues(collection, attr, size, typecode):
+    values = array.array(typecode, [0]) * (len(collection) * size)
+    collection.foreach_get(attr, values)
+    return values
+
+
+def joinMeshes(meshes, name):
+    """
+    Returns a new mesh containing the geometry of all meshes.
+    UV layers and color attributes are joined by name, and filled with zero UVs / white where a mesh lacks them.
+    Color attributes keep the type of the first mesh that has them, and use the corner domain if domains differ.
+    The split normals of every mesh are kept as custom normals.
+    """
+    positions = []
+    faces = []
+    materialIndices = array.array("i")
+    smoothFaces = []
+    loopOrders = []  # loop indices of each mesh in face order, which is the loop order of the joined mesh
+    loopVertexIndices = []  # vertex index of each loop of each mesh
+    uvNames = []
+    colorLayers = {}  # name : (data type, domain)
+    for mesh in meshes:
+        vertexOffset = len(positions)
+        co = readMeshValues(mesh.vertices, "co", 3, "f")
+        positions.extend(zip(co[0::3], co[1::3], co[2::3]))
+        loopStarts = readMeshValues(mesh.polygons, "loop_start", 1, "i")
+        loopTotals = readMeshValues(mesh.polygons, "loop_total", 1, "i")
+        loopVerts = readMeshValues(mesh.loops, "vertex_index", 1, "i")
+        faceLoops = [range(start, start + total) for start, total in zip(loopStarts, loopTotals)]
+        faces.extend([vertexOffset + loopVerts[loop] for loop in loops] for loops in faceLoops)
+        loopOrders.append([loop for loops in faceLoops for loop in loops])
+        loopVertexIndices.append(loopVerts)
+        materialIndices.extend(readMeshValues(mesh.polygons, "material_index", 1, "i"))
+        smooth = [False] * len(mesh.polygons)
+        mesh.polygons.foreach_get("use_smooth", smooth)
+        smoothFaces.extend(smooth)
+
+        for uvLayer in mesh.uv_layers:
+            if uvLayer.name not in uvNames:
+                uvNames.append(uvLayer.name)
+        for colorLayer in mesh.color_attributes:
+            if colorLayer.name not in colorLayers:
+                colorLayers[colorLayer.name] = (colorLayer.data_type, colorLayer.domain)
+            elif colorLayers[colorLayer.name][1] != colorLayer.domain:
+                colorLayers[colorLayer.name] = (colorLayers[colorLayer.name][0], "CORNER")
+
+    joinedMesh = bpy.data.meshes.new(name)
+    joinedMesh.from_pydata(positions, [], faces)
+    joinedMesh.polygons.foreach_set("material_index", materialIndices)
+    joinedMesh.polygons.foreach_set("use_smooth", smoothFaces)
+
+    def joinLoopValues(getValues, size, default):
+        # getValues returns (values, domain) of a mesh, or None if the mesh does not have the layer.
+        joinedValues = array.array("f")
+        for mesh, loopOrder, loopVerts in zip(meshes, loopOrders, loopVertexIndices):
+            meshValues = getValues(mesh)
+            if meshValues is None:
+                joinedValues.extend(default * len(loopOrder))
+                continue
+            values, domain = meshValues
+            for loop in loopOrder:
+                index = loopVerts[loop] if domain == "POINT" else loop
+                joinedValues.extend(values[index * size : (index + 1) * size])
+        return joinedValues
+
+    for uvName in uvNames:
+        uvLayer = joinedMesh.uv_layers.new(name=uvName, do_init=False)
+        uvLayer.data.foreach_set(
+            "uv",
+            joinLoopValues(
+                lambda mesh: (
+                    (readMeshValues(mesh.uv_layers[uvName].data, "uv", 2, "f"), "CORNER")
+                    if uvName in mesh.uv_layers
+                    else None
+                ),
+                2,
+                [0, 0],
+            ),
+        )
+
+    for colorName, (dataType, domain) in colorLayers.items():
+        colorLayer = joinedMesh.color_attributes.new(colorName, dataType, domain)
+        if domain == "POINT":
+            # Every mesh has the attribute on vertices, so vertex values are joined in vertex order.
+            colors = array.array("f")
+            for mesh in meshes:
+                if colorName in mesh.color_attributes:
+                    colors.extend(readMeshValues(mesh.color_attributes[colorName].data, "color", 4, "f"))
+                else:
+                    colors.extend([1, 1, 1, 1] * len(mesh.vertices))
+        else:
+            colors = joinLoopValues(
+                lambda mesh: (
+                    (
+                        readMeshValues(mesh.color_attributes[colorName].data, "color", 4, "f"),
+                        mesh.color_attributes[colorName].domain,
+                    )
+                    if colorName in mesh.color_attributes
+                    else None
+                ),
+                4,
+                [1, 1, 1, 1],
+            )
+        colorLayer.data.foreach_set("color", colors)
+
+    for mesh in meshes:
+        mesh.calc_normals_split()
+    normals = joinLoopValues(lambda mesh: (readMeshValues(mesh.loops, "normal", 3, "f"), "CORNER"), 3, [0, 0, 1])
+    joinedMesh.use_auto_smooth = True
+    joinedMesh.normals_split_custom_set([normals[index : index + 3] for index in range(0, len(normals), 3)])
+
+    if "UVMap" in joinedMesh.uv_layers:
+        joinedMesh.uv_layers.active = joinedMesh.uv_layers["UVMap"]
+    return joinedMesh
+
+
+@timedExportPhase("Object Duplication")
 def combineObjects(obj, includeChildren, ignoreAttr, areaIndex):
+    """
+    Joins obj and its mesh children into one mesh with modifiers applied, relative to the location of obj.
+    The result is a copy that is not linked to the scene, so neither the scene nor the selection is changed.
+    Returns the joined object and a list of extra meshes, which should be removed with cleanupCombineObj.
+    """
     obj.original_name = obj.name
 
-    # Duplicate objects to apply scale / modifiers / linked data
-    bpy.ops.object.select_all(action="DESELECT")
     if includeChildren:
-        selectMeshChildrenOnly(obj, ignoreAttr, False, areaIndex)
+        # Hidden objects are left out, like they would be when duplicating the selection.
+        objs = [child for child in getMeshChildrenOnly(obj, ignoreAttr, False, areaIndex) if child.visible_get()]
     else:
-        obj.select_set(True)
-    if len(bpy.context.selected_objects) == 0:
+        objs = [obj] if isinstance(obj.data, bpy.types.Mesh) else []
+    if len(objs) == 0:
         return None, []
-    bpy.ops.object.duplicate()
-    joinedObj = None
-    try:
-        # duplicate obj and apply modifiers / make single user
-        allObjs = bpy.context.selected_objects
-        bpy.ops.object.make_single_user(obdata=True)
-        bpy.ops.object.transform_apply(location=False, rotation=True, scale=True, properties=False)
-        for selectedObj in allObjs:
-            bpy.ops.object.select_all(action="DESELECT")
-            selectedObj.select_set(True)
-            for modifier in selectedObj.modifiers:
-                attemptModifierApply(modifier)
-
-        bpy.ops.object.select_all(action="DESELECT")
-
-        # Joining causes orphan data, so we remove it manually.
-        meshList = []
-        for selectedObj in allObjs:
-            selectedObj.select_set(True)
-            meshList.append(selectedObj.data)
-
-        joinedObj = bpy.context.selected_objects[0]
-        bpy.context.view_layer.objects.active = joinedObj
-        joinedObj.select_set(True)
-        meshList.remove(joinedObj.data)
-        bpy.ops.object.join()
-        setOrigin(obj, joinedObj)
-
-        bpy.ops.object.select_all(action="DESELECT")
-        bpy.context.view_layer.objects.active = joinedObj
-        joinedObj.select_set(True)
-
-        # Need to clear parent transform in order to correctly apply transform.
-        bpy.ops.object.parent_clear(type="CLEAR_KEEP_TRANSFORM")
-        bpy.ops.object.transform_apply(location=False, rotation=True, scale=True, properties=False)
-        bpy.context.view_layer.objects.active = joinedObj
-        joinedObj.select_set(True)
-        bpy.ops.object.transform_apply(location=False, rotation=True, scale=True, properties=False)
-
-    except Exception as e:
-        cleanupDuplicatedObjects(allObjs)
-        obj.select_set(True)
-        bpy.context.view_layer.objects.active = obj
-        raise Exception(str(e))
 
-    return joinedObj, meshList
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    originMatrix = mathutils.Matrix.Translation(-obj.matrix_world.translation)
+    # Materials are merged by identity, like when joining objects.
+    materials = []
+    meshes = []
+    try:
+        for child in objs:
+            mesh = getEvaluatedMeshCopy(child, depsgraph, originMatrix @ child.evaluated_get(depsgraph).matrix_world)
+            meshes.append(mesh)
+            slotMaterials = [slot.material for slot in child.material_slots]
+            for material in slotMaterials:
+                if material not in materials:
+                    materials.append(material)
+            materialMap = [materials.index(material) for material in slotMaterials]
+            if materialMap != list(range(len(materialMap))):
+                materialIndices = [0] * len(mesh.polygons)
+                mesh.polygons.foreach_get("material_index", materialIndices)
+                mesh.polygons.foreach_set(
+                    "material_index",
+                    [materialMap[index] if index < len(materialMap) else 0 for index in materialIndices],
+                )
+
+        # Layers are joined by name, since joining through a BMesh matches the layers of later meshes by order.
+        joinedMesh = joinMeshes(meshes, obj.name + "_combined")
+    finally:
+        for mesh in meshes:
+            bpy.data.meshes.remove(mesh)
+
+    for material in materials:
+        joinedMesh.materials.append(material)
+
+    # The object settings come from the first object, which would be the one the others are joined into.
+    joinedObj = objs[0].copy()
+    joinedObj.original_name = objs[0].name
+    joinedObj.data = joinedMesh
+    joinedObj.modifiers.clear()
+    joinedObj.constraints.clear()
+    joinedObj.parent = None
+    joinedObj.matrix_world = mathutils.Matrix.Translation(obj.matrix_world.translation)
+    for slot in joinedObj.material_slots:
+        slot.link = "DATA"
+
+    return joinedObj, []
 
 
 def cleanupCombineObj(tempObj, meshList):
@@ -1191,6 +1786,74 @@ def intToBytes(value, byteSize):
     return bytes.fromhex(intToHex(value, byteSize)[2:])
 
 
+class RomReader:
+    """
+    Read only file like access to a ROM, backed by mmap.
+    Binary importers seek and read a few bytes for every command, which this serves from memory instead of the file.
+    """
+
+    def __init__(self, filepath):
+        self.file = open(filepath, "rb")
+        try:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            self.file.close()
+            raise PluginError('ROM "' + filepath + '" is empty.')
+        self.data = memoryview(self.mmap)
+        self.position = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += len(self.data)
+        if offset < 0:
+            raise PluginError("Cannot seek to negative ROM offset " + hex(offset) + ".")
+        self.position = offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def read(self, size=-1):
+        end = len(self.data) if size is None or size < 0 else self.position + size
+        value = self.data[self.position : end].tobytes()
+        self.position += len(value)
+        return value
+
+    def readAt(self, address, size):
+        """
+        Returns size bytes at address, without seeking.
+        """
+        if address < 0:
+            raise PluginError("Cannot read from negative ROM offset " + hex(address) + ".")
+        return self.data[address : address + size].tobytes()
+
+    def unpackAt(self, format, address):
+        """
+        Decodes values at address with a struct format, ex. ">3h10x" repeated for the positions of a vertex list.
+        """
+        if address < 0:
+            raise PluginError("Cannot read from negative ROM offset " + hex(address) + ".")
+        try:
+            return struct.unpack_from(format, self.data, address)
+        except struct.error:
+            raise PluginError("ROM data at " + hex(address) + " is out of bounds.")
+
+    def close(self):
+        self.data.release()
+        self.mmap.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
 # byte input
 # returns an integer, usually used for file seeking positions
 def decodeSegmentedAddr(address, segmentData):
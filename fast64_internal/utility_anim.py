@@ -1,4 +1,4 @@
-import bpy, math, mathutils
+import bpy, math, mathutils, struct
 
 from typing import TYPE_CHECKING
 
@@ -48,6 +48,47 @@ def squashFramesIfAllSame(frameData):
             frameData[i].frames = frameData[i].frames[0:1]
 
 
+def findAlignedBytes(data, sub, alignment):
+    index = data.find(sub)
+    while index != -1 and index % alignment != 0:
+        index = data.find(sub, index + 1)
+    return index
+
+
+def packValueArrays(arrays):
+    """
+    Packs arrays of values into a single array that contains each of them as a contiguous run,
+    using a greedy shortest common superstring heuristic.
+    Identical arrays and arrays contained in another one are stored once,
+    and the remaining arrays are appended longest first, overlapping the end of the packed array as much as possible.
+    Returns the packed array and the offset of each array in it.
+    """
+
+    # Values are compared as bytes, so that searching for runs happens in C.
+    def encode(values):
+        return struct.pack(">" + str(len(values)) + "i", *values)
+
+    uniqueArrays = sorted(dict.fromkeys(tuple(values) for values in arrays), key=len, reverse=True)
+    packed = []
+    packedBytes = bytearray()
+    offsets = {}
+    for values in uniqueArrays:
+        valuesBytes = encode(values)
+        index = findAlignedBytes(packedBytes, valuesBytes, 4)
+        if index != -1:
+            offsets[values] = index // 4
+            continue
+
+        overlap = min(len(packed), len(values) - 1)
+        while overlap > 0 and not packedBytes.endswith(valuesBytes[: overlap * 4]):
+            overlap -= 1
+        offsets[values] = len(packed) - overlap
+        packed.extend(values[overlap:])
+        packedBytes.extend(valuesBytes[overlap * 4 :])
+
+    return packed, [offsets[tuple(values)] for values in arrays]
+
+
 def saveTranslationFrame(frameData, translation):
     for i in range(3):
         frameData[i].frames.append(min(int(round(translation[i])), 2**16 - 1))
@@ -0,0 +1,169 @@
+import bpy, bmesh
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class CollisionMeshTriangles:
+    """
+    Loop triangles of a mesh in collision space, with vertex positions rounded to integers.
+    Triangles that are degenerate after rounding are left out, as are slivers if a minimum altitude is given.
+    """
+
+    def __init__(self):
+        self.materialIndices = []
+        self.positions = []  # ((x, y, z), (x, y, z), (x, y, z)) of each triangle
+        self.normals = []  # normalized face normal of each triangle, if planes were computed
+        self.distances = []  # plane distance through the unrounded first vertex, if planes were computed
+        self.bounds = None  # [min, max] of rounded positions of all triangles, including degenerate ones
+        self.degenerateCount = 0
+        self.sliverCount = 0
+
+
+def roundCollisionPosition(position):
+    return (int(round(position[0])), int(round(position[1])), int(round(position[2])))
+
+
+def simplifyCollisionMesh(mesh: bpy.types.Mesh, angleLimit):
+    """
+    Merges adjacent faces that are coplanar within angleLimit (radians) and share a material slot.
+    The mesh is modified in place, so this should only be used on temporary export meshes.
+    Returns the number of loop triangles removed.
+    """
+    mesh.calc_loop_triangles()
+    triCount = len(mesh.loop_triangles)
+
+    bMesh = bmesh.new()
+    bMesh.from_mesh(mesh)
+    bmesh.ops.dissolve_limit(
+        bMesh,
+        angle_limit=angleLimit,
+        use_dissolve_boundaries=False,
+        verts=bMesh.verts[:],
+        edges=bMesh.edges[:],
+        delimit={"MATERIAL"},
+    )
+    bMesh.to_mesh(mesh)
+    bMesh.free()
+    mesh.update()
+
+    mesh.calc_loop_triangles()
+    return triCount - len(mesh.loop_triangles)
+
+
+def getCollisionTriangles(mesh: bpy.types.Mesh, transformMatrix, computePlanes, minAltitude=None):
+    """
+    minAltitude: if set, triangles whose smallest altitude is below this, in collision units, are left out as slivers.
+    """
+    mesh.calc_loop_triangles()
+    if np is not None:
+        triangles = getCollisionTrianglesNumpy(mesh, transformMatrix, computePlanes, minAltitude)
+    else:
+        triangles = getCollisionTrianglesPython(mesh, transformMatrix, computePlanes, minAltitude)
+
+    if triangles.degenerateCount > 0:
+        print("Ignored " + str(triangles.degenerateCount) + " denormalized triangles in " + mesh.name + ".")
+    if triangles.sliverCount > 0:
+        print("Ignored " + str(triangles.sliverCount) + " sliver triangles in " + mesh.name + ".")
+    return triangles
+
+
+def getCollisionTrianglesNumpy(mesh: bpy.types.Mesh, transformMatrix, computePlanes, minAltitude):
+    triangles = CollisionMeshTriangles()
+    triCount = len(mesh.loop_triangles)
+    if triCount == 0:
+        return triangles
+
+    # mathutils works in single precision, so the same is done here to round positions the same way.
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coords)
+    matrix = np.array(transformMatrix, dtype=np.float32)
+    positions = coords.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+
+    triVerts = np.empty(triCount * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", triVerts)
+    triVerts = triVerts.reshape(-1, 3)
+    materialIndices = np.empty(triCount, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("material_index", materialIndices)
+
+    triPositions = np.rint(positions).astype(np.int64)[triVerts]
+    allPositions = triPositions.reshape(-1, 3)
+    triangles.bounds = [allPositions.min(axis=0).tolist(), allPositions.max(axis=0).tolist()]
+
+    edgeNormals = np.cross(triPositions[:, 1] - triPositions[:, 0], triPositions[:, 2] - triPositions[:, 1])
+    crossLengthSquared = (edgeNormals * edgeNormals).sum(axis=1)
+    valid = crossLengthSquared > 0
+    triangles.degenerateCount = triCount - int(np.count_nonzero(valid))
+    if minAltitude is not None:
+        # The smallest altitude is twice the area over the longest edge.
+        edges = triPositions - np.roll(triPositions, 1, axis=1)
+        longestEdgeSquared = (edges * edges).sum(axis=2).max(axis=1)
+        notSliver = crossLengthSquared >= minAltitude * minAltitude * longestEdgeSquared
+        triangles.sliverCount = int(np.count_nonzero(valid & ~notSliver))
+        valid &= notSliver
+    keep = np.flatnonzero(valid)
+
+    triangles.materialIndices = materialIndices[keep].tolist()
+    triangles.positions = [tuple(tuple(position) for position in triangle) for triangle in triPositions[keep].tolist()]
+
+    if computePlanes:
+        faceNormals = np.empty(triCount * 3, dtype=np.float32)
+        mesh.loop_triangles.foreach_get("normal", faceNormals)
+        normalMatrix = np.array(transformMatrix.inverted().transposed().to_3x3(), dtype=np.float32)
+        normals = faceNormals.reshape(-1, 3)[keep] @ normalMatrix.T
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        normals = normals / np.where(lengths > 0, lengths, 1)
+        planePoints = positions[triVerts[keep, 0]]
+
+        triangles.normals = [tuple(normal) for normal in normals.tolist()]
+        triangles.distances = np.rint(-(normals * planePoints).sum(axis=1)).astype(np.int64).tolist()
+
+    return triangles
+
+
+def getCollisionTrianglesPython(mesh: bpy.types.Mesh, transformMatrix, computePlanes, minAltitude):
+    triangles = CollisionMeshTriangles()
+    bounds = None
+    normalMatrix = transformMatrix.inverted().transposed()
+    for face in mesh.loop_triangles:
+        planePoint = transformMatrix @ mesh.vertices[face.vertices[0]].co
+        positions = (
+            roundCollisionPosition(planePoint),
+            roundCollisionPosition(transformMatrix @ mesh.vertices[face.vertices[1]].co),
+            roundCollisionPosition(transformMatrix @ mesh.vertices[face.vertices[2]].co),
+        )
+        (x1, y1, z1), (x2, y2, z2), (x3, y3, z3) = positions
+
+        for position in positions:
+            if bounds is None:
+                bounds = [list(position), list(position)]
+            for i in range(3):
+                bounds[0][i] = min(bounds[0][i], position[i])
+                bounds[1][i] = max(bounds[1][i], position[i])
+
+        nx = (y2 - y1) * (z3 - z2) - (z2 - z1) * (y3 - y2)
+        ny = (z2 - z1) * (x3 - x2) - (x2 - x1) * (z3 - z2)
+        nz = (x2 - x1) * (y3 - y2) - (y2 - y1) * (x3 - x2)
+        crossLengthSquared = nx * nx + ny * ny + nz * nz
+        if crossLengthSquared <= 0:
+            triangles.degenerateCount += 1
+            continue
+        if minAltitude is not None:
+            longestEdgeSquared = max(
+                sum((positions[i][axis] - positions[i - 1][axis]) ** 2 for axis in range(3)) for i in range(3)
+            )
+            if crossLengthSquared < minAltitude * minAltitude * longestEdgeSquared:
+                triangles.sliverCount += 1
+                continue
+
+        triangles.materialIndices.append(face.material_index)
+        triangles.positions.append(positions)
+        if computePlanes:
+            faceNormal = (normalMatrix @ face.normal).normalized()
+            triangles.normals.append(tuple(faceNormal))
+            triangles.distances.append(int(round(-1 * faceNormal.dot(planePoint))))
+
+    triangles.bounds = bounds
+    return triangles